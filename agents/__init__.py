@@ -7,10 +7,12 @@ from .query_optimizer import optimize_query
 from .schema_advisor import advise_schema
 from .cost_advisor import estimate_cost
 from .data_validator import validate_query
+from .fused import analyze_fused
 
 __all__ = [
     "optimize_query",
     "advise_schema",
     "estimate_cost",
     "validate_query",
+    "analyze_fused",
 ]
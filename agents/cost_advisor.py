@@ -1,14 +1,24 @@
 # agents/cost_advisor.py
-import json
 import logging
 from utils.claude_client import call_claude_json
+from utils.config import Config
+from utils.prompt_context import build_context
 
 logger = logging.getLogger(__name__)
 
-async def estimate_cost(sql: str, explain):
+def cost_result(sql: str, resp: dict):
+    """Build the cost advisor's success result from a parsed LLM response."""
+    details = {
+        "estimated_cost": resp.get("estimated_cost", "medium"),
+        "cost_saving_tips": resp.get("cost_saving_tips", []),
+        "warnings": resp.get("warnings", [])
+    }
+    return {"agent": "cost_advisor", "status": "success", "query": sql, "details": details}
+
+async def estimate_cost(sql: str, explain, model: str = Config.LLM_MODEL_LARGE):
     base = {"agent": "cost_advisor", "status": None, "query": sql, "details": {}}
     
-    explain_str = json.dumps(explain, indent=2, default=str) if explain and isinstance(explain, list) else "No explain data"
+    explain_str = build_context(sql, "cost_advisor", Config.PROMPT_BUDGET_COST, explain=explain)["explain"] or "No explain data"
     
     prompt = f"""You are a Cost Advisor for MariaDB. Analyze IO cost and runtime.
 
@@ -32,18 +42,13 @@ If no data available, still return valid JSON with best guess."""
     
     try:
         logger.debug("Calling Groq API for cost analysis")
-        resp = await call_claude_json(prompt, max_tokens=800, temperature=0.3)
+        resp = await call_claude_json(prompt, max_tokens=800, temperature=0.3, agent="cost_advisor", model=model)
         
         if "error" in resp:
             logger.warning(f"Cost advisor error: {resp.get('error')}")
-            return {**base, "status": "error", "details": {"error": resp.get("error"), "estimated_cost": "unknown"}}
-        
-        details = {
-            "estimated_cost": resp.get("estimated_cost", "medium"),
-            "cost_saving_tips": resp.get("cost_saving_tips", []),
-            "warnings": resp.get("warnings", [])
-        }
-        return {**base, "status": "success", "details": details}
+            return {**base, "status": "error", "details": {"error": resp.get("error"), "http_status": resp.get("status"), "estimated_cost": "unknown"}}
+
+        return cost_result(sql, resp)
     except Exception as e:
         logger.exception(f"Cost advisor exception: {e}")
         return {**base, "status": "error", "details": {"error": str(e), "estimated_cost": "unknown"}}
@@ -1,14 +1,24 @@
 # agents/data_validator.py
-import json
 import logging
 from utils.claude_client import call_claude_json
+from utils.config import Config
+from utils.prompt_context import build_context
 
 logger = logging.getLogger(__name__)
 
-async def validate_query(sql: str, sample_rows: dict):
+def validator_result(sql: str, resp: dict):
+    """Build the data validator's success result from a parsed LLM response."""
+    details = {
+        "issues": resp.get("issues", []),
+        "confidence": resp.get("confidence", "low"),
+        "reasoning": resp.get("reasoning", "Validation complete")
+    }
+    return {"agent": "data_validator", "status": "success", "query": sql, "details": details}
+
+async def validate_query(sql: str, sample_rows: dict, model: str = Config.LLM_MODEL_LARGE):
     base = {"agent": "data_validator", "status": None, "query": sql, "details": {}}
     
-    sample_rows_str = json.dumps(sample_rows, indent=2, default=str) if sample_rows and isinstance(sample_rows, dict) else "No sample data"
+    sample_rows_str = build_context(sql, "data_validator", Config.PROMPT_BUDGET_VALIDATOR, sample_rows=sample_rows)["sample_rows"] or "No sample data"
     
     prompt = f"""You are a Data Quality Validator for MariaDB. Inspect results for anomalies.
 
@@ -32,18 +42,13 @@ If no issues, return valid JSON with empty issues array and high confidence."""
     
     try:
         logger.debug("Calling Groq API for data validation")
-        resp = await call_claude_json(prompt, max_tokens=600, temperature=0.3)
+        resp = await call_claude_json(prompt, max_tokens=600, temperature=0.3, agent="data_validator", model=model)
         
         if "error" in resp:
             logger.warning(f"Data validator error: {resp.get('error')}")
             return {**base, "status": "error", "details": {"error": resp.get("error")}}
-        
-        details = {
-            "issues": resp.get("issues", []),
-            "confidence": resp.get("confidence", "low"),
-            "reasoning": resp.get("reasoning", "Validation complete")
-        }
-        return {**base, "status": "success", "details": details}
+
+        return validator_result(sql, resp)
     except Exception as e:
         logger.exception(f"Data validator exception: {e}")
         return {**base, "status": "error", "details": {"error": str(e)}}
@@ -0,0 +1,127 @@
+# agents/fused.py
+import logging
+from typing import Any, Dict
+
+from utils.claude_client import call_claude_json
+from utils.config import Config
+from utils.prompt_context import build_context
+from .query_optimizer import optimizer_result
+from .cost_advisor import cost_result
+from .schema_advisor import _is_safe, schema_result
+from .data_validator import validator_result
+
+logger = logging.getLogger(__name__)
+
+FUSED_AGENTS = ("query_optimizer", "cost_advisor", "schema_advisor", "data_validator")
+
+
+def _valid_section(agent: str, section: Any) -> bool:
+    if not isinstance(section, dict):
+        return False
+    if agent == "query_optimizer":
+        return isinstance(section.get("optimized_query"), str) and bool(section["optimized_query"].strip())
+    if agent == "cost_advisor":
+        return section.get("estimated_cost") in ("low", "medium", "high")
+    if agent == "schema_advisor":
+        return isinstance(section.get("recommended_indexes", []), list)
+    return isinstance(section.get("issues", []), list)
+
+
+async def analyze_fused(sql: str, schema, explain, sample_rows,
+                        model: str = Config.LLM_MODEL_LARGE) -> Dict[str, Dict[str, Any]]:
+    """
+    One LLM call answering for all four agents.
+    - Sends the SQL, schema, EXPLAIN and sample rows once
+    - Splits the JSON reply into the per-agent result dicts the separate agents return
+    Only well-formed sections are returned; callers make the separate call for any
+    agent missing from the result (all of them if the call fails or the reply is malformed).
+    Queries the schema advisor treats as unsafe are not fused.
+    """
+    if not _is_safe(sql):
+        return {}
+
+    context = build_context(sql, "fused", Config.PROMPT_BUDGET_FUSED,
+                            schema=schema, explain=explain, sample_rows=sample_rows)
+    schema_str = context["schema"] or "Schema unavailable"
+    explain_str = context["explain"] or "Explain plan unavailable"
+    sample_rows_str = context["sample_rows"] or "Sample rows unavailable"
+
+    prompt = f"""You are a team of four MariaDB/MySQL specialists reviewing one query together:
+a query optimizer, a cost advisor, a schema advisor and a data quality validator.
+
+SQL:
+{sql}
+
+SCHEMA CONTEXT:
+{schema_str}
+
+EXPLAIN PLAN:
+{explain_str}
+
+SAMPLE ROWS:
+{sample_rows_str}
+
+TASKS:
+- query_optimizer: rewrite the query with at least one concrete performance improvement (explicit columns
+  instead of SELECT *, index-friendly predicates, LIMIT, covering indexes); detect full scans (type=ALL),
+  filesort, temp tables and cross joins; give 3+ specific recommendations and a realistic impact.
+- cost_advisor: estimate IO/runtime cost from the EXPLAIN plan and give cost reduction tips
+  (buffer pool efficiency, index covering, avoiding temp tables/filesort).
+- schema_advisor: suggest BTREE indexes for InnoDB, partitioning for large tables, column type fixes.
+- data_validator: check the sample rows for missing values, wrong types, outliers, NULL violations,
+  negative/future dates.
+
+RESPONSE FORMAT - RETURN ONE VALID JSON OBJECT ONLY:
+{{
+  "query_optimizer": {{
+    "optimized_query": "SELECT ...",
+    "why_faster": "explanation",
+    "recommendations": ["tip1", "tip2", "tip3"],
+    "warnings": ["warning1"],
+    "estimated_impact": "low|medium|high",
+    "engine_advice": ["MariaDB specific advice"],
+    "materialization_advice": ["advice"]
+  }},
+  "cost_advisor": {{
+    "estimated_cost": "low|medium|high",
+    "cost_saving_tips": ["tip1", "tip2"],
+    "warnings": ["warning1"]
+  }},
+  "schema_advisor": {{
+    "recommended_indexes": ["CREATE INDEX idx_name ON table(col1, col2)"],
+    "schema_changes": ["ALTER TABLE... ADD..."],
+    "warnings": ["potential issue"]
+  }},
+  "data_validator": {{
+    "issues": ["issue1"],
+    "confidence": "high|medium|low",
+    "reasoning": "analysis summary"
+  }}
+}}
+
+Every section is required; use empty arrays when there is nothing to report."""
+
+    try:
+        logger.debug("Calling Groq API for fused agent analysis")
+        resp = await call_claude_json(prompt, max_tokens=4000, temperature=0.3, agent="fused", model=model)
+    except Exception as e:
+        logger.warning(f"Fused agent call failed, using separate calls: {e}")
+        return {}
+    if "error" in resp:
+        logger.warning(f"Fused agent error, using separate calls: {resp.get('error')}")
+        return {}
+
+    builders = {
+        "query_optimizer": optimizer_result,
+        "cost_advisor": cost_result,
+        "schema_advisor": schema_result,
+        "data_validator": validator_result,
+    }
+    results = {}
+    for agent in FUSED_AGENTS:
+        section = resp.get(agent)
+        if _valid_section(agent, section):
+            results[agent] = builders[agent](sql, section)
+        else:
+            logger.warning(f"Fused response has no usable {agent} section, using a separate call")
+    return results
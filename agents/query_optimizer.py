@@ -1,25 +1,47 @@
 # agents/query_optimizer.py
-import json
 import logging
 from typing import Dict, Any
 from utils.claude_client import call_claude_json
+from utils.config import Config
+from utils.prompt_context import build_context
 
 logger = logging.getLogger(__name__)
 
+def optimizer_result(sql: str, resp: Dict[str, Any]) -> Dict[str, Any]:
+    """Build the optimizer's success result from a parsed LLM response."""
+    required_fields = ["optimized_query", "why_faster", "recommendations", "warnings", "estimated_impact"]
+    missing_fields = [f for f in required_fields if f not in resp]
+
+    if missing_fields:
+        logger.warning(f"Query optimizer missing fields: {missing_fields}")
+
+    resp.setdefault("optimized_query", sql)
+    resp.setdefault("why_faster", "Performance optimization analysis complete")
+    resp.setdefault("recommendations", ["Add indexes on JOIN and WHERE columns", "Consider using explicit columns instead of SELECT *", "Implement covering indexes for better query efficiency"])
+    resp.setdefault("warnings", [])
+    resp.setdefault("estimated_impact", "medium")
+    resp.setdefault("engine_advice", ["Use InnoDB for better concurrent access"])
+    resp.setdefault("materialization_advice", [])
+
+    return {"status": "success", "details": resp}
+
 async def optimize_query(sql: str,
                    schema: Dict[str, Any],
                    explain: Dict[str, Any],
                    sample_rows: Dict[str, Any],
-                   target_engine: str = "mariadb") -> Dict[str, Any]:
+                   target_engine: str = "mariadb",
+                   model: str = Config.LLM_MODEL_LARGE) -> Dict[str, Any]:
     """
     Groq-powered Query Optimizer (MariaDB-focused)
     - Calls Groq with schema + EXPLAIN + SQL
     - Expects structured JSON with optimized query, recommendations, warnings, impact, etc.
     """
 
-    schema_str = json.dumps(schema, indent=2, default=str) if schema and not isinstance(schema, dict) or (isinstance(schema, dict) and schema.get("error") is None) else "Schema unavailable"
-    explain_str = json.dumps(explain, indent=2, default=str) if explain and isinstance(explain, list) else "Explain plan unavailable"
-    sample_rows_str = json.dumps(sample_rows, indent=2, default=str) if sample_rows and isinstance(sample_rows, dict) else "Sample rows unavailable"
+    context = build_context(sql, "query_optimizer", Config.PROMPT_BUDGET_OPTIMIZER,
+                            schema=schema, explain=explain, sample_rows=sample_rows)
+    schema_str = context["schema"] or "Schema unavailable"
+    explain_str = context["explain"] or "Explain plan unavailable"
+    sample_rows_str = context["sample_rows"] or "Sample rows unavailable"
 
     prompt = f"""You are a world-class SQL performance tuning agent specialized in MariaDB/MySQL.
 
@@ -69,7 +91,7 @@ CRITICAL RULES:
 
     try:
         logger.debug(f"Calling Groq API for query optimization")
-        resp = await call_claude_json(prompt, max_tokens=2000, temperature=0.3)
+        resp = await call_claude_json(prompt, max_tokens=2000, temperature=0.3, agent="query_optimizer", model=model)
         
         if "error" in resp:
             logger.warning(f"Query optimizer error: {resp.get('error')}")
@@ -77,28 +99,15 @@ CRITICAL RULES:
                 "status": "error",
                 "details": {
                     "error": resp.get("error"),
+                    "http_status": resp.get("status"),
                     "optimized_query": sql,
                     "recommendations": [],
                     "warnings": ["Unable to optimize query"],
                     "estimated_impact": "unknown"
                 }
             }
-        
-        required_fields = ["optimized_query", "why_faster", "recommendations", "warnings", "estimated_impact"]
-        missing_fields = [f for f in required_fields if f not in resp]
-        
-        if missing_fields:
-            logger.warning(f"Query optimizer missing fields: {missing_fields}")
-        
-        resp.setdefault("optimized_query", sql)
-        resp.setdefault("why_faster", "Performance optimization analysis complete")
-        resp.setdefault("recommendations", ["Add indexes on JOIN and WHERE columns", "Consider using explicit columns instead of SELECT *", "Implement covering indexes for better query efficiency"])
-        resp.setdefault("warnings", [])
-        resp.setdefault("estimated_impact", "medium")
-        resp.setdefault("engine_advice", ["Use InnoDB for better concurrent access"])
-        resp.setdefault("materialization_advice", [])
-        
-        return {"status": "success", "details": resp}
+
+        return optimizer_result(sql, resp)
     except Exception as e:
         logger.exception(f"Query optimization exception: {e}")
         return {
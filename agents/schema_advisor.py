@@ -1,8 +1,9 @@
 # agents/schema_advisor.py
-import json
 import logging
 import re
 from utils.claude_client import call_claude_json
+from utils.config import Config
+from utils.prompt_context import build_context
 
 logger = logging.getLogger(__name__)
 FORBIDDEN = ["insert", "update", "delete", "drop", "truncate", "alter", "create", "replace"]
@@ -11,7 +12,16 @@ def _is_safe(sql: str):
     q = sql.lower()
     return not any(re.search(rf"\b{kw}\b", q) for kw in FORBIDDEN)
 
-async def advise_schema(sql: str, schema: dict):
+def schema_result(sql: str, resp: dict):
+    """Build the schema advisor's success result from a parsed LLM response."""
+    details = {
+        "recommended_indexes": resp.get("recommended_indexes", []),
+        "schema_changes": resp.get("schema_changes", []),
+        "warnings": resp.get("warnings", [])
+    }
+    return {"agent": "schema_advisor", "status": "success", "query": sql, "safe_query": None, "details": details}
+
+async def advise_schema(sql: str, schema: dict, model: str = Config.LLM_MODEL_LARGE):
     base = {"agent": "schema_advisor", "status": None, "query": sql, "safe_query": None, "details": {}}
     
     if not _is_safe(sql):
@@ -21,7 +31,7 @@ Return JSON with safe SELECT equivalent:
 {{ "safe_preview": "SELECT ...", "explanation": "Why it's unsafe" }}"""
         
         try:
-            resp = await call_claude_json(prompt, max_tokens=400)
+            resp = await call_claude_json(prompt, max_tokens=400, agent="schema_advisor", model=model)
             if "error" in resp:
                 return {**base, "status": "error", "details": {"error": resp.get("error")}}
             return {**base, "status": "unsafe", "safe_query": resp.get("safe_preview", ""), "details": {"reasoning": resp.get("explanation", "Query contains unsafe operations")}}
@@ -29,7 +39,7 @@ Return JSON with safe SELECT equivalent:
             logger.exception(f"Schema advisor unsafe check failed: {e}")
             return {**base, "status": "unsafe", "safe_query": "", "details": {"reasoning": "Query contains unsafe operations"}}
 
-    schema_str = json.dumps(schema, indent=2, default=str) if schema and isinstance(schema, dict) else "Schema unavailable"
+    schema_str = build_context(sql, "schema_advisor", Config.PROMPT_BUDGET_SCHEMA, schema=schema)["schema"] or "Schema unavailable"
     
     prompt = f"""You are a Schema Advisor for MariaDB/MySQL. Suggest schema improvements for query performance.
 
@@ -54,18 +64,13 @@ If no changes needed, return valid JSON with empty arrays."""
     
     try:
         logger.debug("Calling Groq API for schema analysis")
-        resp = await call_claude_json(prompt, max_tokens=1000, temperature=0.3)
+        resp = await call_claude_json(prompt, max_tokens=1000, temperature=0.3, agent="schema_advisor", model=model)
         
         if "error" in resp:
             logger.warning(f"Schema advisor error: {resp.get('error')}")
             return {**base, "status": "error", "details": {"error": resp.get("error")}}
-        
-        details = {
-            "recommended_indexes": resp.get("recommended_indexes", []),
-            "schema_changes": resp.get("schema_changes", []),
-            "warnings": resp.get("warnings", [])
-        }
-        return {**base, "status": "success", "details": details}
+
+        return schema_result(sql, resp)
     except Exception as e:
         logger.exception(f"Schema advisor exception: {e}")
         return {**base, "status": "error", "details": {"error": str(e)}}
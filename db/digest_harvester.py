@@ -0,0 +1,197 @@
+import logging
+import time
+from array import array
+from collections import deque
+from itertools import islice
+from typing import Any, Deque, Dict, List, Optional, Set, Tuple
+
+import aiomysql
+
+from utils.config import Config
+
+logger = logging.getLogger(__name__)
+
+# Cumulative counters read per digest, in storage order
+COUNTERS = ("count", "timer_wait", "lock_time", "rows_examined", "rows_sent",
+            "no_index_used", "tmp_disk_tables")
+_N = len(COUNTERS)
+
+_DIGEST_SQL = """
+    SELECT DIGEST, DIGEST_TEXT, COUNT_STAR, SUM_TIMER_WAIT, SUM_LOCK_TIME,
+           SUM_ROWS_EXAMINED, SUM_ROWS_SENT, SUM_NO_INDEX_USED, SUM_CREATED_TMP_DISK_TABLES
+    FROM performance_schema.events_statements_summary_by_digest
+    WHERE DIGEST IS NOT NULL AND SCHEMA_NAME = DATABASE()
+"""
+
+_SYS_SQL = "SELECT 1 FROM information_schema.SCHEMATA WHERE SCHEMA_NAME = 'sys'"
+
+# sys view listing digests whose average runtime is in the server's top 5%
+_SYS_P95_SQL = """
+    SELECT digest FROM sys.x$statements_with_runtimes_in_95th_percentile
+    WHERE db = DATABASE()
+"""
+
+
+def _sample_sql(n: int) -> str:
+    placeholders = ", ".join(["%s"] * n)
+    return f"""
+        SELECT DIGEST, SQL_TEXT FROM performance_schema.events_statements_history_long
+        WHERE DIGEST IN ({placeholders}) AND SQL_TEXT IS NOT NULL
+        UNION ALL
+        SELECT DIGEST, SQL_TEXT FROM performance_schema.events_statements_history
+        WHERE DIGEST IN ({placeholders}) AND SQL_TEXT IS NOT NULL
+    """
+
+
+def _ps_to_ms(picoseconds: int) -> float:
+    return round(picoseconds / 1e9, 3)
+
+
+class DigestHistory:
+    """Ring of performance_schema digest snapshots for one database.
+
+    Each digest gets a fixed slot the first time it is seen, and its text
+    is stored once. The latest counters are kept in one unsigned 64-bit
+    array; a snapshot stores only the slots whose counters moved since the
+    previous one, with their increments. The delta over any window is the
+    sum of the snapshots after its start, so idle digests cost nothing per
+    snapshot.
+    """
+
+    def __init__(self, retention: int = Config.DIGEST_RETENTION):
+        self.slots: Dict[str, int] = {}
+        self.digests: List[str] = []
+        self.texts: List[str] = []
+        self.samples: Dict[str, str] = {}
+        self.p95_digests: Set[str] = set()
+        self.current = array("Q")
+        # (taken_at, changed slots, their counter increments: _N per slot)
+        self.snapshots: Deque[Tuple[float, array, array]] = deque(maxlen=retention)
+
+    def add(self, rows, taken_at: Optional[float] = None):
+        """Store one snapshot from (digest, text, *COUNTERS) rows."""
+        changed, increments = array("I"), array("Q")
+        for row in rows:
+            slot = self.slots.get(row[0])
+            if slot is None:
+                slot = self.slots[row[0]] = len(self.texts)
+                self.digests.append(row[0])
+                self.texts.append(row[1] or "")
+                self.current.extend(array("Q", bytes(8 * _N)))
+            base = slot * _N
+            values = [int(v or 0) for v in row[2:2 + _N]]
+            previous = self.current[base:base + _N]
+            if values == list(previous):
+                continue
+            if values[0] < previous[0]:
+                # Counters reset by TRUNCATE / restart: everything since is new
+                previous = [0] * _N
+            changed.append(slot)
+            increments.extend(max(v - p, 0) for v, p in zip(values, previous))
+            self.current[base:base + _N] = array("Q", values)
+        self.snapshots.append((taken_at if taken_at is not None else time.time(), changed, increments))
+
+    def _baseline(self, window: Optional[float]) -> Optional[int]:
+        """Index of the snapshot a window starts at, or None to count from server start."""
+        if len(self.snapshots) < 2:
+            return None
+        last = len(self.snapshots) - 1
+        if window is None:
+            return last - 1
+        cutoff = self.snapshots[-1][0] - window
+        for i, (taken_at, _, _) in enumerate(self.snapshots):
+            if taken_at >= cutoff:
+                return min(i, last - 1)
+        return last - 1
+
+    def delta(self, window: Optional[float] = None) -> Dict[str, Any]:
+        """Per-digest counter deltas between the latest snapshot and `window` seconds earlier.
+
+        With no window the previous snapshot is used. With a single snapshot
+        the totals since server start are returned.
+        """
+        if not self.snapshots:
+            return {"window_seconds": 0, "since_server_start": True, "digests": []}
+        latest_at = self.snapshots[-1][0]
+        baseline = self._baseline(window)
+        totals: Dict[int, List[int]] = {}
+        for _, changed, increments in islice(self.snapshots, 0 if baseline is None else baseline + 1, None):
+            for j, slot in enumerate(changed):
+                acc = totals.setdefault(slot, [0] * _N)
+                for i in range(_N):
+                    acc[i] += increments[j * _N + i]
+        return {
+            "window_seconds": round(latest_at - self.snapshots[baseline][0], 1) if baseline is not None else None,
+            "since_server_start": baseline is None,
+            "digests": [self._describe(self.digests[slot], values)
+                        for slot, values in sorted(totals.items()) if values[0] > 0],
+        }
+
+    def _describe(self, digest: str, values: List[int]) -> Dict[str, Any]:
+        stats = dict(zip(COUNTERS, values))
+        count = stats["count"]
+        return {
+            "digest": digest,
+            "digest_text": self.texts[self.slots[digest]],
+            "sample_query": self.samples.get(digest),
+            "count": count,
+            "total_latency_ms": _ps_to_ms(stats["timer_wait"]),
+            "avg_latency_ms": _ps_to_ms(stats["timer_wait"] // count),
+            "lock_time_ms": _ps_to_ms(stats["lock_time"]),
+            "rows_examined": stats["rows_examined"],
+            "rows_examined_avg": round(stats["rows_examined"] / count, 1),
+            "rows_sent": stats["rows_sent"],
+            "no_index_used": stats["no_index_used"],
+            "tmp_disk_tables": stats["tmp_disk_tables"],
+            "in_p95_runtime": digest in self.p95_digests,
+        }
+
+    def top(self, n: int, window: Optional[float] = None) -> Dict[str, Any]:
+        delta = self.delta(window)
+        delta["digests"] = sorted(delta["digests"], key=lambda d: d["total_latency_ms"], reverse=True)[:n]
+        return delta
+
+    def footprint(self) -> Dict[str, Any]:
+        return {
+            "digests": len(self.slots),
+            "snapshots": len(self.snapshots),
+            "bytes": self.current.itemsize * len(self.current) + sum(
+                c.itemsize * len(c) + v.itemsize * len(v) for _, c, v in self.snapshots),
+        }
+
+
+async def harvest(pool, history: DigestHistory) -> int:
+    """Take one digest snapshot into `history`; returns the number of digests read."""
+    async with pool.acquire() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(_DIGEST_SQL)
+            rows = await cur.fetchall()
+            history.add(rows)
+
+            await cur.execute(_SYS_SQL)
+            if await cur.fetchone():
+                try:
+                    await cur.execute(_SYS_P95_SQL)
+                    history.p95_digests = {r[0] for r in await cur.fetchall()}
+                except Exception as e:
+                    logger.debug(f"sys 95th percentile view unavailable: {e}")
+    return len(rows)
+
+
+async def fetch_samples(pool, history: DigestHistory, digests: List[str]):
+    """Fill in a runnable example statement for `digests` from the statement history tables.
+
+    DIGEST_TEXT has literals replaced by `?` and can't be EXPLAINed, so a
+    real statement is preferred whenever the history consumers kept one.
+    """
+    wanted = [d for d in digests if d not in history.samples]
+    if not wanted:
+        return
+    try:
+        async with pool.acquire() as conn:
+            async with conn.cursor(aiomysql.DictCursor) as cur:
+                await cur.execute(_sample_sql(len(wanted)), wanted * 2)
+                for row in await cur.fetchall():
+                    history.samples.setdefault(row["DIGEST"], row["SQL_TEXT"])
+    except Exception as e:
+        logger.info(f"Statement history unavailable for samples: {e}")
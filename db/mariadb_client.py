@@ -1,20 +1,204 @@
 import aiomysql
+import hashlib
+import json
 import re
 import logging
+from collections import namedtuple
+
+from db.query_benchmark import benchmark_query
+from db.result_verifier import verify_equivalent
+from db.shadow_schema import evaluate_indexes, shadow_schemas
+from utils.analysis_cache import database_identity
+from utils.sql_parser import parse_sql
 
 logger = logging.getLogger(__name__)
 
+# Compact per-column record; DESCRIBE-style dicts are built from it on demand
+ColumnRecord = namedtuple("ColumnRecord", "name column_type data_type nullable key default extra")
+
+
+def _schema_batch_sql(n_tables=None) -> str:
+    """One query returning columns (C), index parts (I) and table stats (T).
+
+    With `n_tables` the query is restricted to that many TABLE_NAME
+    placeholders (pass the names three times); otherwise it covers the
+    whole database.
+    """
+    where = "TABLE_SCHEMA = DATABASE()"
+    if n_tables:
+        where += f" AND TABLE_NAME IN ({', '.join(['%s'] * n_tables)})"
+    return f"""
+        SELECT 'C' AS kind, TABLE_NAME AS tbl, ORDINAL_POSITION AS pos,
+               COLUMN_NAME AS name, COLUMN_TYPE AS a, IS_NULLABLE AS b,
+               COLUMN_KEY AS c, COLUMN_DEFAULT AS d, EXTRA AS e, DATA_TYPE AS f
+        FROM information_schema.COLUMNS
+        WHERE {where}
+        UNION ALL
+        SELECT 'I', TABLE_NAME, SEQ_IN_INDEX,
+               INDEX_NAME, COLUMN_NAME, NON_UNIQUE,
+               CARDINALITY, INDEX_TYPE, SUB_PART, NULLABLE
+        FROM information_schema.STATISTICS
+        WHERE {where}
+        UNION ALL
+        SELECT 'T', TABLE_NAME, 0,
+               ENGINE, TABLE_ROWS, DATA_LENGTH,
+               INDEX_LENGTH, AVG_ROW_LENGTH, CREATE_TIME, UPDATE_TIME
+        FROM information_schema.TABLES
+        WHERE {where}
+        ORDER BY tbl, kind, name, pos
+    """
+
+
+def _to_int(value):
+    try:
+        return int(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _describe_default(value):
+    """Map information_schema COLUMN_DEFAULT to what DESCRIBE shows."""
+    if value is None or value == "NULL":
+        return None
+    if isinstance(value, str) and len(value) >= 2 and value[0] == value[-1] == "'":
+        return value[1:-1].replace("''", "'")
+    return value
+
+
+def _parse_schema_rows(rows):
+    """Turn batched schema rows into {table: {"columns", "indexes", "stats"}}."""
+    records = {}
+    for r in rows:
+        rec = records.setdefault(r["tbl"], {"columns": [], "indexes": {}, "stats": {}})
+        kind = r["kind"]
+        if kind == "C":
+            rec["columns"].append((_to_int(r["pos"]) or 0, ColumnRecord(
+                r["name"], r["a"], r["f"], r["b"], r["c"] or "", _describe_default(r["d"]), r["e"] or "",
+            )))
+        elif kind == "I":
+            idx = rec["indexes"].setdefault(r["name"], {
+                "name": r["name"],
+                "columns": [],
+                "unique": str(r["b"]) == "0",
+                "type": r["d"],
+                "cardinality": None,
+            })
+            idx["columns"].append((_to_int(r["pos"]) or 0, r["a"] + (f"({r['e']})" if r["e"] else "")))
+            # Cardinality of the full key is reported on its last part
+            idx["cardinality"] = _to_int(r["c"])
+        elif kind == "T":
+            rec["stats"] = {
+                "engine": r["name"],
+                "rows_estimate": _to_int(r["a"]),
+                "data_length": _to_int(r["b"]),
+                "index_length": _to_int(r["c"]),
+                "avg_row_length": _to_int(r["d"]),
+                "create_time": r["e"],
+                "update_time": r["f"],
+            }
+
+    for rec in records.values():
+        rec["columns"] = [col for _, col in sorted(rec["columns"], key=lambda c: c[0])]
+        indexes = []
+        for idx in rec["indexes"].values():
+            idx["columns"] = [c for _, c in sorted(idx["columns"], key=lambda c: c[0])]
+            indexes.append(idx)
+        rec["indexes"] = indexes
+    # A table with no column rows (e.g. dropped between queries) is not usable
+    return {tbl: rec for tbl, rec in records.items() if rec["columns"]}
+
+
+def _describe_rows(record):
+    return [{
+        "Field": c.name,
+        "Type": c.column_type,
+        "Null": c.nullable,
+        "Key": c.key,
+        "Default": c.default,
+        "Extra": c.extra,
+    } for c in record["columns"]]
+
+
+def _schema_context_from_records(tables, records):
+    schema = {}
+    table_stats = {}
+    by_lower = {name.lower(): rec for name, rec in records.items()}
+    for tbl in tables:
+        rec = records.get(tbl) or by_lower.get(tbl.lower())
+        if rec is None:
+            schema[tbl] = {"error": f"Table '{tbl}' doesn't exist"}
+            continue
+        schema[tbl] = _describe_rows(rec)
+        table_stats[tbl] = {**rec["stats"], "indexes": rec["indexes"]}
+    if table_stats:
+        schema["_table_stats"] = table_stats
+    return schema
+
+
+def _full_schema_from_records(records):
+    tables = {}
+    for tbl in sorted(records):
+        tables[tbl] = [{
+            "TABLE_NAME": tbl,
+            "COLUMN_NAME": c.name,
+            "DATA_TYPE": c.data_type,
+            "IS_NULLABLE": c.nullable,
+            "COLUMN_KEY": c.key,
+            "COLUMN_TYPE": c.column_type,
+        } for c in records[tbl]["columns"]]
+    return tables
+
+
+def version_token(records):
+    """Combine per-table record versions (set by SchemaCache) into one token."""
+    material = "|".join(f"{t}:{records[t]['version']}" for t in sorted(records))
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()[:32]
+
+
+async def fetch_schema_records(pool, tables=None):
+    """Run the batched schema query for `tables` (or every table)."""
+    async with pool.acquire() as conn:
+        async with conn.cursor(aiomysql.DictCursor) as cur:
+            if tables:
+                await cur.execute(_schema_batch_sql(len(tables)), list(tables) * 3)
+            else:
+                await cur.execute(_schema_batch_sql())
+            return _parse_schema_rows(await cur.fetchall())
+
+
 class MariaDBClient:
-    def __init__(self, host, user, password, database, port=3306):
+    def __init__(self, host, user, password, database, port=3306, registry=None, schema_cache=None, ssh=None):
         self.host = host
         self.user = user
         self.password = password
         self.database = database
         self.port = port
+        # (host, port, user) of the SSH bastion, when the server is reached through one
+        self.ssh = tuple(ssh) if ssh else None
         self.pool = None
+        # When a PoolRegistry is given, pools are borrowed from it and kept warm
+        # across requests instead of being created and closed per client.
+        self.registry = registry
+        self._pool_key = None
+        # Optional SchemaCache; when set, schema_version holds the token for
+        # the tables most recently read so callers can key caches on it.
+        self.schema_cache = schema_cache
+        self.schema_version = None
 
     async def connect(self, host=None, port=None):
-        if self.pool is None:
+        if self.pool is None and self.registry is not None:
+            try:
+                self._pool_key, self.pool = await self.registry.acquire(
+                    host=host or self.host,
+                    port=port or self.port,
+                    user=self.user,
+                    password=self.password,
+                    database=self.database,
+                )
+            except Exception as e:
+                logger.error(f"Failed to connect to MariaDB: {e}")
+                self.pool = None
+        elif self.pool is None:
             try:
                 self.pool = await aiomysql.create_pool(
                     host=host or self.host,
@@ -31,7 +215,11 @@ class MariaDBClient:
                 self.pool = None
 
     async def disconnect(self):
-        if self.pool:
+        if self.pool and self.registry is not None:
+            await self.registry.release(self._pool_key, self.pool)
+            self.pool = None
+            self._pool_key = None
+        elif self.pool:
             self.pool.close()
             await self.pool.wait_closed()
             self.pool = None
@@ -49,6 +237,58 @@ class MariaDBClient:
             logger.error(f"EXPLAIN failed: {e}")
             return {"error": str(e)}
 
+    async def explain_json(self, query: str, analyze: bool = False, max_statement_time: float = 10):
+        """EXPLAIN FORMAT=JSON, or ANALYZE FORMAT=JSON when `analyze` is set.
+
+        ANALYZE executes the statement, so it is capped with
+        max_statement_time; if it fails or hits the cap the estimated plan
+        is returned instead. Returns {"mode", "plan"} or an error dict.
+        """
+        if self.pool is None:
+            return {"error": "Database connection not available"}
+        q = query.rstrip().rstrip(";")
+        if analyze:
+            statement = f"SET STATEMENT max_statement_time={max_statement_time:g} FOR ANALYZE FORMAT=JSON {q}"
+        else:
+            statement = f"EXPLAIN FORMAT=JSON {q}"
+        try:
+            async with self.pool.acquire() as conn:
+                async with conn.cursor() as cur:
+                    await cur.execute(statement)
+                    row = await cur.fetchone()
+        except Exception as e:
+            if analyze:
+                logger.warning(f"ANALYZE FORMAT=JSON failed, using the estimated plan: {e}")
+                return await self.explain_json(query)
+            logger.error(f"EXPLAIN FORMAT=JSON failed: {e}")
+            return {"error": str(e)}
+        if not row or not row[0]:
+            return {"error": "EXPLAIN FORMAT=JSON returned no plan"}
+        try:
+            return {"mode": "analyze" if analyze else "explain", "plan": json.loads(row[0])}
+        except ValueError as e:
+            return {"error": f"Unreadable JSON plan: {e}"}
+
+    async def benchmark(self, query: str, **options):
+        """Time repeated executions of `query`; see db.query_benchmark.benchmark_query."""
+        if self.pool is None:
+            return {"error": "Database connection not available"}
+        return await benchmark_query(self.pool, query, **options)
+
+    async def verify_equivalent(self, original: str, optimized: str, **options):
+        """Compare two queries' result sets; see db.result_verifier.verify_equivalent."""
+        if self.pool is None:
+            return {"status": "error", "error": "Database connection not available"}
+        return await verify_equivalent(self.pool, original, optimized, **options)
+
+    async def what_if_indexes(self, query: str, statements, **options):
+        """Evaluate recommended indexes on shadow copies; see db.shadow_schema.evaluate_indexes."""
+        if self.pool is None:
+            return {"status": "error", "error": "Database connection not available"}
+        identity = database_identity(self.host, self.port, self.user, self.database, ssh=self.ssh)
+        return await evaluate_indexes(self.pool, shadow_schemas, identity, self.database, query,
+                                      list(statements), **options)
+
     async def fetch_sample_rows(self, query: str, limit: int = 5):
         """Fetch sample rows from query safely (works with aggregates too)."""
         if self.pool is None:
@@ -101,58 +341,75 @@ class MariaDBClient:
                     return {"error": f"Sample row fetch failed: {str(e)}"}
 
     async def get_schema_context(self, query: str):
-        """Extract table names from query and return schema details."""
+        """Extract table names from query and return schema details.
+
+        Columns, indexes and table sizes for every referenced table come back
+        from one UNION ALL over information_schema, so the cost is a single
+        round trip regardless of how many tables the query joins. Each table
+        maps to DESCRIBE-shaped column rows as before; index and size data
+        sits under the reserved "_table_stats" key. With a SchemaCache only
+        tables whose CREATE_TIME/UPDATE_TIME moved are re-read.
+        """
         if self.pool is None:
             return {"error": "Database connection not available"}
         tables = self._extract_tables(query)
-        schema = {}
+        if not tables:
+            return {}
         try:
-            async with self.pool.acquire() as conn:
-                async with conn.cursor(aiomysql.DictCursor) as cur:
-                    for tbl in tables:
-                        try:
-                            await cur.execute(f"DESCRIBE {tbl}")
-                            schema[tbl] = await cur.fetchall()
-                        except Exception as e:
-                            schema[tbl] = {"error": str(e)}
-            return schema
+            if self.schema_cache is not None:
+                records, self.schema_version = await self.schema_cache.get_tables(self, tables)
+            else:
+                records = await fetch_schema_records(self.pool, tables)
+            return _schema_context_from_records(tables, records)
         except Exception as e:
             logger.error(f"Schema context failed: {e}")
             return {"error": str(e)}
 
+    async def get_schema_snapshot(self, queries):
+        """Fetch schema records for every table any of `queries` references.
+
+        Used by batch analysis so a whole workload shares one schema read;
+        per-query contexts come from schema_context_from_snapshot.
+        """
+        if self.pool is None:
+            return {"error": "Database connection not available"}
+        tables = sorted({t for q in queries for t in self._extract_tables(q)})
+        if not tables:
+            return {}
+        try:
+            if self.schema_cache is not None:
+                records, self.schema_version = await self.schema_cache.get_tables(self, tables)
+                return records
+            return await fetch_schema_records(self.pool, tables)
+        except Exception as e:
+            logger.error(f"Schema snapshot failed: {e}")
+            return {"error": str(e)}
+
+    def schema_context_from_snapshot(self, query: str, records):
+        """Return (schema context, version token or None) for one query."""
+        tables = self._extract_tables(query)
+        context = _schema_context_from_records(tables, records)
+        by_lower = {name.lower(): name for name in records}
+        used = {by_lower[t.lower()]: records[by_lower[t.lower()]] for t in tables if t.lower() in by_lower}
+        token = None
+        if used and all("version" in rec for rec in used.values()):
+            token = version_token(used)
+        return context, token
+
     async def get_full_schema(self):
         """Return full database schema overview via information_schema."""
         if self.pool is None:
             return {"error": "Database connection not available"}
         try:
-            async with self.pool.acquire() as conn:
-                async with conn.cursor(aiomysql.DictCursor) as cur:
-                    await cur.execute(
-                        """
-                        SELECT TABLE_NAME, COLUMN_NAME, DATA_TYPE, IS_NULLABLE, COLUMN_KEY, COLUMN_TYPE
-                        FROM information_schema.columns
-                        WHERE table_schema = DATABASE()
-                        ORDER BY TABLE_NAME, ORDINAL_POSITION
-                        """
-                    )
-                    rows = await cur.fetchall()
-            tables = {}
-            for r in rows:
-                t = r["TABLE_NAME"]
-                tables.setdefault(t, []).append(r)
-            return tables
+            if self.schema_cache is not None:
+                records, self.schema_version = await self.schema_cache.get_tables(self)
+            else:
+                records = await fetch_schema_records(self.pool)
+            return _full_schema_from_records(records)
         except Exception as e:
             logger.error(f"Full schema fetch failed: {e}")
             return {"error": str(e)}
 
     def _extract_tables(self, query: str):
-        """More tolerant regex-based table extractor: handles backticks, schema-qualified, subqueries/CTEs."""
-        # matches from/join followed by optional schema and backticks, also in subqueries
-        matches = re.findall(r"(?:from|join)\s+(`?[\w\.]+`?)", query, re.IGNORECASE)
-        # Also check for CTEs: WITH cte AS (SELECT ... FROM table)
-        cte_matches = re.findall(r"with\s+\w+\s+as\s*\(\s*select.*?\s+from\s+(`?[\w\.]+`?)", query, re.IGNORECASE | re.DOTALL)
-        matches.extend(cte_matches)
-        # Strip backticks
-        cleaned = [m.replace("`", "") for m in matches]
-        # Only table part if schema qualified
-        return list(set(c.split(".")[-1] for c in cleaned if c))  # dedupe
+        """Base tables referenced anywhere in the query (CTE names and derived aliases excluded)."""
+        return parse_sql(query).table_names
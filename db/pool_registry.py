@@ -0,0 +1,239 @@
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+import aiomysql
+
+from utils.config import Config
+
+logger = logging.getLogger(__name__)
+
+
+def pool_key(host: str, port: int, user: str, password: str, database: str) -> str:
+    """Hash the connection identity, credentials included, into a registry key.
+
+    Two requests only share a pool when every field matches, so one user's
+    credentials are never used to serve another user's analysis. Hashing
+    keeps the plaintext password out of the registry and the stats output.
+    """
+    identity = json.dumps([host, int(port), user, password, database])
+    return hashlib.sha256(identity.encode("utf-8")).hexdigest()
+
+
+class _PoolEntry:
+    def __init__(self, pool, host: str, port: int, database: str):
+        self.pool = pool
+        self.host = host
+        self.port = port
+        self.database = database
+        self.refs = 0
+        self.hits = 0
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self.last_ping = self.created_at
+
+
+class PoolRegistry:
+    """Process-wide registry of aiomysql pools shared across requests.
+
+    Pools are kept warm between analyses and evicted least-recently-used
+    first once `max_pools` is exceeded, or after sitting unused for
+    `idle_ttl` seconds. Pools with outstanding references are never evicted.
+    A pool that fails its health ping while in use is retired: new requests
+    get a fresh pool, and the old one is closed once its last reference is
+    released.
+    """
+
+    def __init__(self,
+                 minsize: int = Config.DB_POOL_MIN_SIZE,
+                 maxsize: int = Config.DB_POOL_MAX_SIZE,
+                 max_pools: int = Config.DB_POOL_MAX_POOLS,
+                 idle_ttl: float = Config.DB_POOL_IDLE_TTL,
+                 ping_interval: float = Config.DB_POOL_PING_INTERVAL):
+        self.minsize = minsize
+        self.maxsize = maxsize
+        self.max_pools = max_pools
+        self.idle_ttl = idle_ttl
+        self.ping_interval = ping_interval
+        self._entries: "OrderedDict[str, _PoolEntry]" = OrderedDict()
+        self._retired: List[_PoolEntry] = []
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._reaper: Optional[asyncio.Task] = None
+        self.created = 0
+        self.reused = 0
+        self.evicted = 0
+        self.ping_failures = 0
+
+    async def acquire(self, host: str, port: int, user: str, password: str, database: str):
+        """Return a warm pool for the given identity, creating it if needed."""
+        key = pool_key(host, port, user, password, database)
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            entry = self._entries.get(key)
+            if entry is not None and not await self._healthy(entry):
+                if entry.refs > 0:
+                    # Don't close a pool out from under requests that are still using it
+                    self._entries.pop(key)
+                    self._retired.append(entry)
+                else:
+                    await self._drop(key)
+                entry = None
+
+            if entry is None:
+                pool = await aiomysql.create_pool(
+                    host=host,
+                    user=user,
+                    password=password,
+                    db=database,
+                    port=port,
+                    minsize=self.minsize,
+                    maxsize=self.maxsize,
+                    autocommit=True,
+                    connect_timeout=10,
+                    pool_recycle=Config.DB_POOL_RECYCLE,
+                )
+                entry = _PoolEntry(pool, host, port, database)
+                self._entries[key] = entry
+                self.created += 1
+                logger.info(f"Created MariaDB pool for {host}:{port}/{database}")
+            else:
+                entry.hits += 1
+                self.reused += 1
+
+            entry.refs += 1
+            entry.last_used = time.monotonic()
+            self._entries.move_to_end(key)
+
+        await self._evict_lru()
+        return key, entry.pool
+
+    async def release(self, key: str, pool=None):
+        """Drop one reference to a pool; the pool stays open unless it was retired.
+
+        `pool` is the pool acquire() returned, needed to tell a retired pool
+        from the fresh one now registered under the same key.
+        """
+        entry = self._entries.get(key)
+        if entry is not None and (pool is None or entry.pool is pool):
+            entry.refs = max(0, entry.refs - 1)
+            entry.last_used = time.monotonic()
+            return
+        retired = next((e for e in self._retired if e.pool is pool), None)
+        if retired is None:
+            return
+        retired.refs = max(0, retired.refs - 1)
+        if retired.refs == 0:
+            self._retired.remove(retired)
+            await self._close(retired)
+
+    async def _healthy(self, entry: _PoolEntry) -> bool:
+        if entry.pool.closed:
+            return False
+        if time.monotonic() - entry.last_ping < self.ping_interval:
+            return True
+        if entry.pool.freesize == 0 and entry.pool.size >= entry.pool.maxsize:
+            # Every connection is busy serving requests; waiting for one to ping would
+            # hold the per-key lock, and the busy connections show the server is there
+            return True
+        try:
+            # The acquire is inside the timeout too: it waits while the pool is exhausted
+            await asyncio.wait_for(self._ping(entry), timeout=5)
+            entry.last_ping = time.monotonic()
+            return True
+        except Exception as e:
+            self.ping_failures += 1
+            logger.warning(f"Pool health ping failed for {entry.host}:{entry.port}: {e}")
+            return False
+
+    async def _ping(self, entry: _PoolEntry):
+        async with entry.pool.acquire() as conn:
+            await conn.ping(reconnect=True)
+
+    async def _drop(self, key: str):
+        entry = self._entries.pop(key, None)
+        lock = self._locks.get(key)
+        if lock is not None and not lock.locked():
+            del self._locks[key]
+        if entry is None:
+            return
+        await self._close(entry)
+
+    async def _close(self, entry: _PoolEntry):
+        entry.pool.close()
+        try:
+            await entry.pool.wait_closed()
+        except Exception as e:
+            logger.warning(f"Error closing pool for {entry.host}:{entry.port}: {e}")
+        self.evicted += 1
+        logger.info(f"Closed MariaDB pool for {entry.host}:{entry.port}/{entry.database}")
+
+    async def _evict_lru(self):
+        while len(self._entries) > self.max_pools:
+            victim = next((k for k, e in self._entries.items() if e.refs == 0), None)
+            if victim is None:
+                return
+            await self._drop(victim)
+
+    async def evict_idle(self):
+        """Close pools nobody has used for longer than `idle_ttl`."""
+        now = time.monotonic()
+        idle = [k for k, e in self._entries.items()
+                if e.refs == 0 and now - e.last_used > self.idle_ttl]
+        for key in idle:
+            await self._drop(key)
+
+    async def _reap_forever(self):
+        interval = max(1.0, min(self.idle_ttl / 2, 60.0))
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.evict_idle()
+            except Exception as e:
+                logger.exception(f"Pool reaper failed: {e}")
+
+    def start(self):
+        if self._reaper is None or self._reaper.done():
+            self._reaper = asyncio.ensure_future(self._reap_forever())
+
+    async def close_all(self):
+        if self._reaper is not None:
+            self._reaper.cancel()
+            self._reaper = None
+        for key in list(self._entries):
+            await self._drop(key)
+        retired, self._retired = self._retired, []
+        for entry in retired:
+            await self._close(entry)
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        pools = []
+        for key, e in self._entries.items():
+            pools.append({
+                "key": key[:12],
+                "size": e.pool.size,
+                "free": e.pool.freesize,
+                "minsize": e.pool.minsize,
+                "maxsize": e.pool.maxsize,
+                "in_use_by_requests": e.refs,
+                "hits": e.hits,
+                "idle_seconds": round(now - e.last_used, 1),
+                "age_seconds": round(now - e.created_at, 1),
+            })
+        return {
+            "pools": pools,
+            "open_pools": len(self._entries),
+            "retired_pools": len(self._retired),
+            "max_pools": self.max_pools,
+            "created": self.created,
+            "reused": self.reused,
+            "evicted": self.evicted,
+            "ping_failures": self.ping_failures,
+        }
+
+
+pool_registry = PoolRegistry()
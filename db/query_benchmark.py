@@ -0,0 +1,128 @@
+import logging
+import math
+import time
+from typing import Any, Dict, List, Optional
+
+import aiomysql
+
+from utils.config import Config
+
+logger = logging.getLogger(__name__)
+
+_STATUS_SQL = """
+    SHOW SESSION STATUS
+    WHERE Variable_name LIKE 'Handler\\_%' OR Variable_name IN ('Innodb_rows_read', 'Bytes_sent')
+"""
+
+# Handler counters that each count one row read by the storage engine
+_READ_HANDLERS = ("Handler_read_first", "Handler_read_key", "Handler_read_last", "Handler_read_next",
+                  "Handler_read_prev", "Handler_read_rnd", "Handler_read_rnd_next")
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    """Nearest-rank percentile of `values`, or None when empty."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = min(max(math.ceil(pct / 100.0 * len(ordered)), 1), len(ordered))
+    return ordered[rank - 1]
+
+
+async def _status(cur) -> Dict[str, int]:
+    await cur.execute(_STATUS_SQL)
+    out = {}
+    for name, value in await cur.fetchall():
+        try:
+            out[name] = int(value)
+        except (TypeError, ValueError):
+            continue
+    return out
+
+
+def _delta(before: Dict[str, int], after: Dict[str, int], overhead: Dict[str, int]) -> Dict[str, int]:
+    return {name: max(after[name] - before.get(name, 0) - overhead.get(name, 0), 0)
+            for name in after if name in before}
+
+
+class _Run:
+    __slots__ = ("ms", "rows", "status")
+
+    def __init__(self, ms: float, rows: int, status: Dict[str, int]):
+        self.ms = ms
+        self.rows = rows
+        self.status = status
+
+
+async def _execute(conn, statement: str, fetch_size: int) -> int:
+    """Run `statement` on a server-side cursor, discarding rows; returns the row count."""
+    rows = 0
+    async with conn.cursor(aiomysql.SSCursor) as cur:
+        await cur.execute(statement)
+        while True:
+            chunk = await cur.fetchmany(fetch_size)
+            if not chunk:
+                break
+            rows += len(chunk)
+    return rows
+
+
+def _summarize(runs: List[_Run]) -> Dict[str, Any]:
+    timings = [r.ms for r in runs]
+    status = {}
+    for run in runs:
+        for name, value in run.status.items():
+            status[name] = status.get(name, 0) + value
+    n = len(runs)
+    return {
+        "runs": n,
+        "p50_ms": round(percentile(timings, 50), 3),
+        "p95_ms": round(percentile(timings, 95), 3),
+        "min_ms": round(min(timings), 3),
+        "max_ms": round(max(timings), 3),
+        "rows_sent": runs[-1].rows,
+        "rows_examined": sum(status.get(h, 0) for h in _READ_HANDLERS) // n,
+        "innodb_rows_read": status.get("Innodb_rows_read", 0) // n,
+        "bytes_sent": status.get("Bytes_sent", 0) // n,
+        "handlers": {name: value // n for name, value in sorted(status.items())
+                     if name.startswith("Handler_") and value},
+    }
+
+
+async def benchmark_query(pool, query: str, runs: int = Config.BENCHMARK_RUNS,
+                          warmup: int = Config.BENCHMARK_WARMUP,
+                          max_statement_time: float = Config.BENCHMARK_MAX_STATEMENT_TIME,
+                          fetch_size: int = Config.BENCHMARK_FETCH_SIZE) -> Dict[str, Any]:
+    """Time `query` over `runs` executions on one connection after `warmup` unmeasured ones.
+
+    Rows are streamed through a server-side cursor and discarded. Session
+    Handler_* / Bytes_sent deltas are taken around every run, minus the
+    cost of the SHOW STATUS calls themselves; figures are per-run averages.
+    Innodb_rows_read is a global counter, so concurrent load inflates it.
+    Each execution is capped with max_statement_time; the first failure
+    ends the benchmark with an error.
+    """
+    statement = f"SET STATEMENT max_statement_time={max_statement_time:g} FOR {query.rstrip().rstrip(';')}"
+    measured: List[_Run] = []
+    try:
+        async with pool.acquire() as conn:
+            for _ in range(max(warmup, 0)):
+                await _execute(conn, statement, fetch_size)
+            async with conn.cursor() as cur:
+                first = await _status(cur)
+                overhead = _delta(first, await _status(cur), {})
+            for _ in range(max(runs, 1)):
+                async with conn.cursor() as cur:
+                    before = await _status(cur)
+                started = time.perf_counter()
+                rows = await _execute(conn, statement, fetch_size)
+                elapsed = (time.perf_counter() - started) * 1000
+                async with conn.cursor() as cur:
+                    after = await _status(cur)
+                measured.append(_Run(elapsed, rows, _delta(before, after, overhead)))
+    except Exception as e:
+        logger.warning(f"Benchmark run failed: {e}")
+        result = {"error": str(e)}
+        if measured:
+            result["partial"] = _summarize(measured)
+        return result
+    return _summarize(measured)
@@ -0,0 +1,218 @@
+import asyncio
+import decimal
+import hashlib
+import logging
+import time
+from array import array
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import aiomysql
+
+from utils.config import Config
+
+logger = logging.getLogger(__name__)
+
+_MASK = (1 << 64) - 1
+
+# ER_STATEMENT_TIMEOUT: the server killed a statement at max_statement_time
+_STATEMENT_TIMEOUT = 1969
+
+
+def _canonical(value: Any) -> str:
+    """Type-tolerant text form of a column value, so 1, 1.0 and Decimal('1.00') hash alike."""
+    if value is None:
+        return "\x00"
+    if isinstance(value, (bytes, bytearray)):
+        return "b" + value.hex()
+    if isinstance(value, bool):
+        return str(int(value))
+    if isinstance(value, (int, float, decimal.Decimal)):
+        number = decimal.Decimal(str(value)) if isinstance(value, float) else decimal.Decimal(value)
+        return format(number.normalize(), "f") if number.is_finite() else str(number)
+    return str(value)
+
+
+def row_hash(row: Tuple[Any, ...]) -> int:
+    material = "\x1f".join(_canonical(v) for v in row).encode("utf-8", "surrogatepass")
+    return int.from_bytes(hashlib.blake2b(material, digest_size=8).digest(), "little")
+
+
+def _timed_out(error: Exception) -> bool:
+    args = getattr(error, "args", ())
+    return (bool(args) and args[0] == _STATEMENT_TIMEOUT) or "max_statement_time exceeded" in str(error)
+
+
+def _display(row: Tuple[Any, ...]) -> List[Any]:
+    return [v.hex() if isinstance(v, (bytes, bytearray)) else v for v in row]
+
+
+class _Side:
+    """Per-bucket row counts and hash sums for one result set.
+
+    Summing row hashes makes the digest independent of row order while
+    still counting duplicates; bucketing by hash lets a mismatch be traced
+    to a few buckets without holding any rows.
+    """
+
+    __slots__ = ("rows", "columns", "truncated", "counts", "sums")
+
+    def __init__(self, buckets: int):
+        self.rows = 0
+        self.columns: Optional[int] = None
+        self.truncated = False
+        self.counts = array("Q", [0]) * buckets
+        self.sums = array("Q", [0]) * buckets
+
+
+async def _stream(pool, statement: str, fetch_size: int, on_chunk) -> Optional[int]:
+    """Feed `statement`'s rows to `on_chunk` in chunks from a server-side cursor.
+
+    Stops early when `on_chunk` returns False; returns the column count.
+    Closing an unbuffered cursor reads the rest of the result, so on an
+    early stop (or cancellation) the connection is closed instead.
+    """
+    async with pool.acquire() as conn:
+        cur = await conn.cursor(aiomysql.SSCursor)
+        try:
+            await cur.execute(statement)
+            columns = len(cur.description or ())
+            while True:
+                chunk = await cur.fetchmany(fetch_size)
+                if not chunk:
+                    break
+                if on_chunk(chunk) is False:
+                    conn.close()
+                    return columns
+        except BaseException:
+            conn.close()
+            raise
+        await cur.close()
+        return columns
+
+
+async def _digest(pool, statement: str, buckets: int, max_rows: int, deadline: float, fetch_size: int) -> _Side:
+    side = _Side(buckets)
+
+    def add(chunk):
+        for row in chunk:
+            if side.rows >= max_rows:
+                side.truncated = True
+                return False
+            h = row_hash(row)
+            slot = h % buckets
+            side.counts[slot] += 1
+            side.sums[slot] = (side.sums[slot] + h) & _MASK
+            side.rows += 1
+        if time.monotonic() >= deadline:
+            side.truncated = True
+            return False
+        return True
+
+    side.columns = await _stream(pool, statement, fetch_size, add)
+    return side
+
+
+async def _collect(pool, statement: str, buckets: int, wanted: Set[int], fetch_size: int,
+                   limit: int) -> Tuple[Dict[int, List[Any]], bool]:
+    """Row hash -> [count, first row] for up to `limit` distinct rows in the `wanted` buckets.
+
+    Also returns whether every distinct row in those buckets was kept.
+    """
+    seen: Dict[int, List[Any]] = {}
+    complete = [True]
+
+    def add(chunk):
+        for row in chunk:
+            h = row_hash(row)
+            if h % buckets in wanted:
+                entry = seen.get(h)
+                if entry is not None:
+                    entry[0] += 1
+                elif len(seen) < limit:
+                    seen[h] = [1, row]
+                else:
+                    complete[0] = False
+
+    await _stream(pool, statement, fetch_size, add)
+    return seen, complete[0]
+
+
+def _only_in(a: Dict[int, List[Any]], b: Dict[int, List[Any]], b_complete: bool, limit: int) -> List[Dict[str, Any]]:
+    out = []
+    for h, (count, row) in a.items():
+        if h not in b and not b_complete:
+            # `b` may hold this row among the ones it did not keep
+            continue
+        extra = count - b.get(h, [0])[0]
+        if extra > 0:
+            out.append({"row": _display(row), "extra_copies": extra})
+            if len(out) >= limit:
+                break
+    return out
+
+
+async def verify_equivalent(pool, original: str, optimized: str,
+                            max_rows: int = Config.VERIFY_MAX_ROWS,
+                            time_budget: float = Config.VERIFY_TIME_BUDGET,
+                            buckets: int = Config.VERIFY_BUCKETS,
+                            sample_rows: int = Config.VERIFY_SAMPLE_ROWS,
+                            fetch_size: int = Config.VERIFY_FETCH_SIZE) -> Dict[str, Any]:
+    """Check that two queries return the same multiset of rows, ignoring order.
+
+    Both result sets are streamed concurrently on separate connections and
+    reduced to bucketed hash sums, so memory does not grow with the result
+    size. On a mismatch the differing buckets are streamed once more to
+    report sample rows found in only one result; at most `sample_rows`
+    distinct rows are kept per side, so the samples may be incomplete.
+    Reaching `max_rows` or `time_budget` makes the result "inconclusive",
+    and the early stop closes the connection instead of draining the
+    rest of the result. The server-side cap sits slightly below the budget
+    so a slow query is stopped before the deadline; a query the server
+    kills is also reported as "inconclusive". Column values are
+    compared by position, not by name.
+    """
+    started = time.monotonic()
+    deadline = started + time_budget
+    cap = f"SET STATEMENT max_statement_time={time_budget * 0.9:g} FOR "
+    statements = [cap + q.rstrip().rstrip(";") for q in (original, optimized)]
+    try:
+        left, right = await asyncio.gather(
+            *(_digest(pool, s, buckets, max_rows, deadline, fetch_size) for s in statements))
+    except Exception as e:
+        if _timed_out(e):
+            return {"status": "inconclusive",
+                    "reason": f"The server stopped a query at the time ({time_budget:g}s) budget",
+                    "elapsed_ms": round((time.monotonic() - started) * 1000, 1)}
+        logger.warning(f"Result verification failed: {e}")
+        return {"status": "error", "error": str(e)}
+
+    result: Dict[str, Any] = {
+        "original_rows": left.rows,
+        "optimized_rows": right.rows,
+        "columns": [left.columns, right.columns],
+    }
+    if left.columns != right.columns:
+        result.update(status="mismatch", reason="Column counts differ")
+    elif left.truncated or right.truncated:
+        result.update(status="inconclusive",
+                      reason=f"Stopped at the row ({max_rows}) or time ({time_budget:g}s) budget")
+    elif left.counts == right.counts and left.sums == right.sums:
+        result.update(status="match")
+    else:
+        result.update(status="mismatch", reason="Results contain different rows"
+                      if left.rows == right.rows else "Row counts differ")
+        differing = [i for i in range(buckets)
+                     if left.counts[i] != right.counts[i] or left.sums[i] != right.sums[i]]
+        wanted = set(differing[:max(sample_rows, 1)])
+        remaining = deadline - time.monotonic()
+        if remaining > 0:
+            try:
+                (seen_left, left_complete), (seen_right, right_complete) = await asyncio.wait_for(
+                    asyncio.gather(*(_collect(pool, s, buckets, wanted, fetch_size, max(sample_rows, 1))
+                                     for s in statements)), remaining)
+                result["only_in_original"] = _only_in(seen_left, seen_right, right_complete, sample_rows)
+                result["only_in_optimized"] = _only_in(seen_right, seen_left, left_complete, sample_rows)
+            except Exception as e:
+                logger.info(f"Could not collect differing rows: {e}")
+    result["elapsed_ms"] = round((time.monotonic() - started) * 1000, 1)
+    return result
@@ -0,0 +1,135 @@
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import aiomysql
+
+from db.mariadb_client import fetch_schema_records, version_token
+from utils.analysis_cache import database_identity
+from utils.config import Config
+
+logger = logging.getLogger(__name__)
+
+
+def _signature_sql(n_tables=None) -> str:
+    where = "TABLE_SCHEMA = DATABASE()"
+    if n_tables:
+        where += f" AND TABLE_NAME IN ({', '.join(['%s'] * n_tables)})"
+    return f"SELECT TABLE_NAME, CREATE_TIME, UPDATE_TIME FROM information_schema.TABLES WHERE {where}"
+
+
+def _record_version(record: Dict[str, Any]) -> str:
+    """Structural hash of one table: columns and index definitions only."""
+    material = json.dumps([
+        [list(c) for c in record["columns"]],
+        [(i["name"], i["columns"], i["unique"]) for i in record["indexes"]],
+    ], default=str)
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()[:16]
+
+
+class _DatabaseEntry:
+    def __init__(self):
+        self.tables: Dict[str, Dict[str, Any]] = {}
+        self.signatures: Dict[str, Tuple[str, str]] = {}
+        self.loaded_at = time.monotonic()
+        self.lock = asyncio.Lock()
+
+
+class SchemaCache:
+    """Per-database cache of compact table/column/index records.
+
+    Every lookup first reads CREATE_TIME and UPDATE_TIME for the requested
+    tables from information_schema.TABLES, which is far cheaper than COLUMNS
+    or STATISTICS on large catalogs, and re-reads only the tables whose
+    signature moved. Entries are fully reloaded after `max_age` seconds as a
+    safety net for changes that don't touch either timestamp.
+    """
+
+    def __init__(self,
+                 max_databases: int = Config.SCHEMA_CACHE_MAX_DATABASES,
+                 max_age: float = Config.SCHEMA_CACHE_MAX_AGE):
+        self.max_databases = max_databases
+        self.max_age = max_age
+        self._entries: "OrderedDict[str, _DatabaseEntry]" = OrderedDict()
+        self.signature_checks = 0
+        self.tables_reused = 0
+        self.tables_refreshed = 0
+
+    def _entry(self, key: str) -> _DatabaseEntry:
+        entry = self._entries.get(key)
+        if entry is None or time.monotonic() - entry.loaded_at > self.max_age:
+            entry = _DatabaseEntry()
+            self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_databases:
+            self._entries.popitem(last=False)
+        return entry
+
+    async def _signatures(self, pool, tables: Optional[List[str]]) -> Dict[str, Tuple[str, str]]:
+        async with pool.acquire() as conn:
+            async with conn.cursor(aiomysql.DictCursor) as cur:
+                await cur.execute(_signature_sql(len(tables) if tables else None), tables or ())
+                rows = await cur.fetchall()
+        self.signature_checks += 1
+        return {r["TABLE_NAME"]: (str(r["CREATE_TIME"]), str(r["UPDATE_TIME"])) for r in rows}
+
+    async def get_tables(self, client, tables: Optional[List[str]] = None) -> Tuple[Dict[str, Dict[str, Any]], str]:
+        """Return (records, version token) for `tables`, or every table if None.
+
+        The token changes only when a column or index definition of one of
+        the returned tables changes, so other layers can key caches on it.
+        """
+        key = database_identity(client.host, client.port, client.user, client.database,
+                                ssh=getattr(client, "ssh", None))
+        entry = self._entry(key)
+        async with entry.lock:
+            signatures = await self._signatures(client.pool, tables)
+            if tables:
+                # Use the server's spelling of each name (lower_case_table_names)
+                by_lower = {name.lower(): name for name in signatures}
+                wanted = [by_lower.get(t.lower(), t) for t in tables]
+            else:
+                wanted = list(signatures)
+
+            for name in [t for t in entry.tables if t not in signatures and (tables is None or t in wanted)]:
+                entry.tables.pop(name, None)
+                entry.signatures.pop(name, None)
+
+            stale = [t for t in wanted
+                     if t in signatures and (t not in entry.tables or entry.signatures.get(t) != signatures[t])]
+            if stale:
+                # A cold full-database load doesn't need a giant IN list
+                full_load = tables is None and not entry.tables
+                fresh = await fetch_schema_records(client.pool, None if full_load else stale)
+                for name in stale:
+                    record = fresh.get(name)
+                    if record is None:
+                        entry.tables.pop(name, None)
+                        entry.signatures.pop(name, None)
+                        continue
+                    record["version"] = _record_version(record)
+                    entry.tables[name] = record
+                    entry.signatures[name] = signatures[name]
+                self.tables_refreshed += len(stale)
+                logger.info(f"Schema cache refreshed {len(stale)} table(s) for {client.database}")
+            self.tables_reused += sum(1 for t in wanted if t in signatures) - len(stale)
+
+            records = {t: entry.tables[t] for t in wanted if t in entry.tables}
+        return records, version_token(records)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "databases": len(self._entries),
+            "max_databases": self.max_databases,
+            "cached_tables": sum(len(e.tables) for e in self._entries.values()),
+            "signature_checks": self.signature_checks,
+            "tables_reused": self.tables_reused,
+            "tables_refreshed": self.tables_refreshed,
+        }
+
+
+schema_cache = SchemaCache()
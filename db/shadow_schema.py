@@ -0,0 +1,350 @@
+import asyncio
+import hashlib
+import json
+import logging
+import math
+import re
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from utils.config import Config
+from utils.plan_tree import parse_plan, summarize_plan
+from utils.sql_parser import parse_sql, unqualify
+
+logger = logging.getLogger(__name__)
+
+_INTEGER_TYPES = ("tinyint", "smallint", "mediumint", "int", "integer", "bigint")
+
+_COLUMNS_SQL = """
+    SELECT COLUMN_NAME, COLUMN_TYPE, DATA_TYPE, COLUMN_KEY
+    FROM information_schema.COLUMNS
+    WHERE TABLE_SCHEMA = %s AND TABLE_NAME = %s
+    ORDER BY ORDINAL_POSITION
+"""
+
+_TABLE_ROWS_SQL = """
+    SELECT TABLE_ROWS FROM information_schema.TABLES
+    WHERE TABLE_SCHEMA = %s AND TABLE_NAME = %s
+"""
+
+_WHATIF_INDEXES_SQL = """
+    SELECT DISTINCT INDEX_NAME FROM information_schema.STATISTICS
+    WHERE TABLE_SCHEMA = %s AND TABLE_NAME = %s AND INDEX_NAME LIKE 'whatif\\_%%'
+"""
+
+_CREATE_INDEX_RE = re.compile(
+    r"^\s*CREATE\s+(UNIQUE\s+)?INDEX\s+(?:IF\s+NOT\s+EXISTS\s+)?`?[\w$]+`?\s+ON\s+"
+    r"(?:`?[\w$]+`?\s*\.\s*)?`?([\w$]+)`?\s*\((.+)\)\s*;?\s*$", re.IGNORECASE | re.DOTALL)
+_ALTER_INDEX_RE = re.compile(
+    r"^\s*ALTER\s+TABLE\s+(?:`?[\w$]+`?\s*\.\s*)?`?([\w$]+)`?\s+ADD\s+(UNIQUE\s+)?(?:INDEX|KEY)\s+"
+    r"(?:`?[\w$]+`?\s*)?\((.+)\)\s*;?\s*$", re.IGNORECASE | re.DOTALL)
+_INDEX_PART_RE = re.compile(r"^\s*`?[\w$]+`?\s*(\(\s*\d+\s*\))?\s*(ASC|DESC)?\s*$", re.IGNORECASE)
+
+
+def _q(name: str) -> str:
+    return "`" + name.replace("`", "``") + "`"
+
+
+def parse_index_statement(statement: str) -> Optional[Tuple[str, str]]:
+    """(table, column list) from CREATE INDEX / ALTER TABLE ... ADD INDEX, or None.
+
+    Only plain column lists (with optional prefix length and direction)
+    are accepted, so the parts can be replayed safely on the shadow copy.
+    Uniqueness is dropped: it does not change the plan for a lookup and
+    sampled data may not satisfy it.
+    """
+    match = _CREATE_INDEX_RE.match(statement)
+    if match:
+        table, columns = match.group(2), match.group(3)
+    else:
+        match = _ALTER_INDEX_RE.match(statement)
+        if not match:
+            return None
+        table, columns = match.group(1), match.group(3)
+    parts = columns.split(",")
+    if not all(_INDEX_PART_RE.match(p) for p in parts):
+        return None
+    return table, ", ".join(p.strip() for p in parts)
+
+
+class ShadowTable:
+    """Bookkeeping for one sampled copy of a source table."""
+
+    __slots__ = ("table", "structure", "pk", "max_pk", "source_rows", "rows", "refreshed_at")
+
+    def __init__(self, table: str, structure: str, pk: Optional[str]):
+        self.table = table
+        self.structure = structure
+        self.pk = pk
+        self.max_pk: Optional[int] = None
+        self.source_rows = 0
+        self.rows = 0
+        self.refreshed_at = 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "table": self.table,
+            "sampled_rows": self.rows,
+            "source_rows": self.source_rows,
+            "sampling": "pk_ranges" if self.pk else "first_rows",
+            "refreshed_at": self.refreshed_at,
+        }
+
+
+class ShadowSchemaManager:
+    """Keeps sampled copies of source tables in a scratch schema for what-if tests.
+
+    Each source database gets its own scratch schema, `<prefix><database>`.
+    A table is copied with CREATE TABLE ... LIKE and filled from evenly
+    spaced primary-key ranges (or the first rows when there is no integer
+    primary key). Copies are reused across analyses: a changed column
+    definition rebuilds the copy, and after `refresh_after` seconds rows
+    past the last copied key are sampled in at the same rate.
+    """
+
+    def __init__(self,
+                 prefix: str = Config.WHATIF_SCHEMA_PREFIX,
+                 sample_rows: int = Config.WHATIF_SAMPLE_ROWS,
+                 ranges: int = Config.WHATIF_SAMPLE_RANGES,
+                 refresh_after: float = Config.WHATIF_REFRESH_AFTER,
+                 statement_time: float = Config.WHATIF_STATEMENT_TIME):
+        self.prefix = prefix
+        self.sample_rows = sample_rows
+        self.ranges = max(ranges, 1)
+        self.refresh_after = refresh_after
+        self.statement_time = statement_time
+        self._tables: Dict[Tuple[str, str], ShadowTable] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+    def schema_name(self, database: str) -> str:
+        return (self.prefix + database)[:64]
+
+    def lock(self, identity: str) -> asyncio.Lock:
+        """Serializes shadow builds and index experiments for one source database."""
+        return self._locks.setdefault(identity, asyncio.Lock())
+
+    def _capped(self, statement: str) -> str:
+        return f"SET STATEMENT max_statement_time={self.statement_time:g} FOR {statement}"
+
+    async def _structure(self, cur, schema: str, table: str) -> Optional[Tuple[str, Optional[str]]]:
+        await cur.execute(_COLUMNS_SQL, (schema, table))
+        columns = await cur.fetchall()
+        if not columns:
+            return None
+        token = hashlib.sha256(json.dumps([[c[0], c[1]] for c in columns]).encode("utf-8")).hexdigest()[:16]
+        pk = [c for c in columns if c[3] == "PRI"]
+        integer_pk = pk[0][0] if len(pk) == 1 and pk[0][2].lower() in _INTEGER_TYPES else None
+        return token, integer_pk
+
+    async def _scalar(self, cur, statement: str, args=None):
+        await cur.execute(statement, args)
+        row = await cur.fetchone()
+        return row[0] if row else None
+
+    async def _source_rows(self, cur, database: str, table: str) -> int:
+        """The engine's row estimate; an exact COUNT(*) would scan the production table."""
+        return int(await self._scalar(cur, _TABLE_ROWS_SQL, (database, table)) or 0)
+
+    async def _drop_whatif_indexes(self, cur, database: str, table: str):
+        """Drop what-if indexes a cancelled evaluation left on the copy."""
+        schema = self.schema_name(database)
+        await cur.execute(_WHATIF_INDEXES_SQL, (schema, table))
+        for (name,) in await cur.fetchall():
+            logger.info(f"Dropping leftover index {name} from shadow copy {schema}.{table}")
+            await cur.execute(f"ALTER TABLE {_q(schema)}.{_q(table)} DROP INDEX {_q(name)}")
+
+    async def _build(self, cur, database: str, shadow: ShadowTable):
+        source, target = f"{_q(database)}.{_q(shadow.table)}", f"{_q(self.schema_name(database))}.{_q(shadow.table)}"
+        await cur.execute(f"DROP TABLE IF EXISTS {target}")
+        await cur.execute(f"CREATE TABLE {target} LIKE {source}")
+        shadow.source_rows = await self._source_rows(cur, database, shadow.table)
+        if shadow.pk:
+            pk = _q(shadow.pk)
+            low, high = await self._bounds(cur, source, pk)
+            if low is not None:
+                per_range = max(self.sample_rows // self.ranges, 1)
+                step = max((high - low + 1) / self.ranges, 1)
+                for i in range(self.ranges):
+                    await cur.execute(self._capped(
+                        f"INSERT IGNORE INTO {target} SELECT * FROM {source} "
+                        f"WHERE {pk} >= %s ORDER BY {pk} LIMIT {per_range}"), (low + int(i * step),))
+            shadow.max_pk = high
+        else:
+            await cur.execute(self._capped(
+                f"INSERT IGNORE INTO {target} SELECT * FROM {source} LIMIT {self.sample_rows}"))
+        await self._finish(cur, target, shadow)
+
+    async def _bounds(self, cur, source: str, pk: str) -> Tuple[Optional[int], Optional[int]]:
+        await cur.execute(f"SELECT MIN({pk}), MAX({pk}) FROM {source}")
+        low, high = await cur.fetchone()
+        return (int(low), int(high)) if low is not None else (None, None)
+
+    async def _refresh(self, cur, database: str, shadow: ShadowTable):
+        """Sample rows added since the last copy, at the table's sampling rate."""
+        source, target = f"{_q(database)}.{_q(shadow.table)}", f"{_q(self.schema_name(database))}.{_q(shadow.table)}"
+        pk = _q(shadow.pk)
+        new_rows = int(await self._scalar(
+            cur, self._capped(f"SELECT COUNT(*) FROM {source} WHERE {pk} > %s"), (shadow.max_pk,)) or 0)
+        if new_rows:
+            rate = shadow.rows / max(shadow.source_rows, 1)
+            await cur.execute(self._capped(
+                f"INSERT IGNORE INTO {target} SELECT * FROM {source} WHERE {pk} > %s "
+                f"ORDER BY {pk} LIMIT {max(math.ceil(new_rows * rate), 1)}"), (shadow.max_pk,))
+            shadow.max_pk = (await self._bounds(cur, source, pk))[1]
+            shadow.source_rows += new_rows
+        await self._finish(cur, target, shadow)
+
+    async def _finish(self, cur, target: str, shadow: ShadowTable):
+        await cur.execute(f"ANALYZE TABLE {target}")
+        await cur.fetchall()
+        shadow.rows = int(await self._scalar(cur, f"SELECT COUNT(*) FROM {target}") or 0)
+        shadow.refreshed_at = time.time()
+
+    async def _adopt(self, cur, database: str, table: str, structure: Tuple[str, Optional[str]]) -> Optional[ShadowTable]:
+        """Reuse a copy left by an earlier process if its columns still match."""
+        if await self._structure(cur, self.schema_name(database), table) != structure:
+            return None
+        shadow = ShadowTable(table, *structure)
+        target = f"{_q(self.schema_name(database))}.{_q(table)}"
+        shadow.rows = int(await self._scalar(cur, f"SELECT COUNT(*) FROM {target}") or 0)
+        shadow.source_rows = await self._source_rows(cur, database, table)
+        if shadow.pk:
+            shadow.max_pk = await self._scalar(cur, f"SELECT MAX({_q(shadow.pk)}) FROM {target}")
+        return shadow
+
+    async def prepare(self, cur, identity: str, database: str, tables: List[str]) -> Dict[str, Any]:
+        """Make sure every table in `tables` has an up-to-date shadow copy.
+
+        Call with lock(identity) held. Returns per-table copy details.
+        """
+        await cur.execute(f"CREATE DATABASE IF NOT EXISTS {_q(self.schema_name(database))}")
+        prepared = {}
+        for table in tables:
+            structure = await self._structure(cur, database, table)
+            if structure is None:
+                raise LookupError(f"Table '{table}' doesn't exist in {database}")
+            key = (identity, table.lower())
+            shadow = self._tables.get(key)
+            if shadow is None or shadow.structure != structure[0]:
+                shadow = await self._adopt(cur, database, table, structure)
+                if shadow is None:
+                    shadow = ShadowTable(table, *structure)
+                    await self._build(cur, database, shadow)
+                    logger.info(f"Built shadow copy of {database}.{table} ({shadow.rows} rows)")
+                self._tables[key] = shadow
+            elif time.time() - shadow.refreshed_at >= self.refresh_after:
+                if shadow.pk and shadow.max_pk is not None:
+                    await self._refresh(cur, database, shadow)
+                else:
+                    await self._build(cur, database, shadow)
+            await self._drop_whatif_indexes(cur, database, table)
+            prepared[table] = shadow.to_dict()
+        return prepared
+
+
+async def _plan(cur, query: str, analyze: bool, statement_time: float) -> Dict[str, Any]:
+    q = query.rstrip().rstrip(";")
+    if analyze:
+        await cur.execute(f"SET STATEMENT max_statement_time={statement_time:g} FOR ANALYZE FORMAT=JSON {q}")
+    else:
+        await cur.execute(f"EXPLAIN FORMAT=JSON {q}")
+    row = await cur.fetchone()
+    root = parse_plan(row[0])
+    summary = summarize_plan(root)
+    summary["access"] = [{"table": n.table, "access_type": n.access_type, "key": n.key}
+                         for n in root.walk() if n.node_type == "table"]
+    return summary
+
+
+def _delta(before: Dict[str, Any], after: Dict[str, Any]) -> Dict[str, Any]:
+    delta = {}
+    for field in ("estimated_cost", "estimated_rows", "total_time_ms", "actual_rows_read"):
+        if before.get(field) is not None and after.get(field) is not None:
+            delta[field] = round(after[field] - before[field], 3)
+    return delta
+
+
+async def evaluate_indexes(pool, manager: ShadowSchemaManager, identity: str, database: str, query: str,
+                           statements: List[str], analyze: bool = True,
+                           max_indexes: int = Config.WHATIF_MAX_INDEXES) -> Dict[str, Any]:
+    """Measure each recommended index on sampled shadow copies of the query's tables.
+
+    The query's plan is taken on the shadow schema without the indexes,
+    then with each index added alone, then with all of them together;
+    every index is dropped again afterwards. A failed or cancelled run
+    closes its connection instead of returning it to the pool, and the
+    next prepare() drops any index it left behind. With `analyze` the plans come
+    from ANALYZE FORMAT=JSON, which is safe here since only the copies are
+    read. Row counts reflect the sample, not the source table.
+    """
+    parsed = parse_sql(query)
+    if parsed.statement != "select":
+        return {"status": "skipped", "reason": "What-if evaluation only runs for SELECT queries"}
+    if any(ref.schema and ref.schema.lower() != database.lower() for ref in parsed.tables):
+        return {"status": "skipped", "reason": "Query references tables in other schemas"}
+    tables = {name.lower(): name for name in parsed.table_names}
+    # Qualified names would read the source tables instead of the copies
+    shadow_query = unqualify(query, database)
+
+    candidates, results = [], []
+    for statement in statements[:max_indexes]:
+        index = parse_index_statement(statement)
+        if index is None or index[0].lower() not in tables:
+            results.append({"index": statement, "status": "skipped",
+                            "reason": "Not a plain index on a table used by the query"})
+            continue
+        candidates.append((statement, tables[index[0].lower()], index[1]))
+    if not candidates:
+        return {"status": "skipped", "reason": "No recommended index could be evaluated", "indexes": results}
+
+    shadow_schema = manager.schema_name(database)
+    async with manager.lock(identity):
+        async with pool.acquire() as conn:
+            cur = await conn.cursor()
+            try:
+                shadow_tables = await manager.prepare(cur, identity, database, list(tables.values()))
+                await cur.execute(f"USE {_q(shadow_schema)}")
+                before = await _plan(cur, shadow_query, analyze, manager.statement_time)
+                for i, (statement, table, columns) in enumerate(candidates):
+                    name = f"whatif_{i}"
+                    await cur.execute(f"ALTER TABLE {_q(table)} ADD INDEX {_q(name)} ({columns})")
+                    after = await _plan(cur, shadow_query, analyze, manager.statement_time)
+                    await cur.execute(f"ALTER TABLE {_q(table)} DROP INDEX {_q(name)}")
+                    results.append({
+                        "index": statement,
+                        "status": "evaluated",
+                        "used": any(a["key"] == name for a in after["access"]),
+                        "after": after,
+                        "delta": _delta(before, after),
+                    })
+                combined = None
+                if len(candidates) > 1:
+                    for i, (_, table, columns) in enumerate(candidates):
+                        await cur.execute(f"ALTER TABLE {_q(table)} ADD INDEX {_q(f'whatif_{i}')} ({columns})")
+                    after = await _plan(cur, shadow_query, analyze, manager.statement_time)
+                    combined = {"after": after, "delta": _delta(before, after)}
+                    for i, (_, table, _) in enumerate(candidates):
+                        await cur.execute(f"ALTER TABLE {_q(table)} DROP INDEX {_q(f'whatif_{i}')}")
+                await cur.execute(f"USE {_q(database)}")
+            except BaseException as e:
+                # The connection may still be in the shadow schema, or mid-statement after a
+                # cancellation: close it so the pool never hands it out again. Indexes left
+                # on the copies are dropped by the next prepare().
+                conn.close()
+                if not isinstance(e, Exception):
+                    raise
+                logger.warning(f"What-if index evaluation failed: {e}")
+                return {"status": "error", "error": str(e), "indexes": results}
+            await cur.close()
+    return {
+        "status": "success",
+        "mode": "analyze" if analyze else "explain",
+        "shadow_schema": shadow_schema,
+        "shadow_tables": shadow_tables,
+        "before": before,
+        "indexes": results,
+        "combined": combined,
+    }
+
+
+shadow_schemas = ShadowSchemaManager()
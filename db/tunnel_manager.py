@@ -0,0 +1,170 @@
+import asyncio
+import hashlib
+import io
+import json
+import logging
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from sshtunnel import SSHTunnelForwarder
+
+from utils.config import Config
+
+logger = logging.getLogger(__name__)
+
+
+def tunnel_key(ssh_host: str, ssh_port: int, ssh_user: str,
+               ssh_password: Optional[str], ssh_private_key: Optional[str],
+               remote_host: str, remote_port: int) -> str:
+    """Hash the SSH identity and remote bind address into a manager key."""
+    identity = json.dumps([ssh_host, int(ssh_port), ssh_user, ssh_password,
+                           ssh_private_key, remote_host, int(remote_port)])
+    return hashlib.sha256(identity.encode("utf-8")).hexdigest()
+
+
+class _TunnelEntry:
+    def __init__(self, forwarder: SSHTunnelForwarder, ssh_host: str, remote_host: str, remote_port: int):
+        self.forwarder = forwarder
+        self.ssh_host = ssh_host
+        self.remote_host = remote_host
+        self.remote_port = remote_port
+        self.refs = 0
+        self.hits = 0
+        self.reconnects = 0
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+
+
+class TunnelManager:
+    """Shares SSH tunnels across requests with the same SSH config.
+
+    SSHTunnelForwarder.start() and stop() do blocking network I/O, so they
+    always run in a worker thread. Tunnels are reference counted, restarted
+    when their transport has died, and closed once idle for `idle_ttl`.
+    """
+
+    def __init__(self, idle_ttl: float = Config.SSH_TUNNEL_IDLE_TTL):
+        self.idle_ttl = idle_ttl
+        self._entries: Dict[str, _TunnelEntry] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._reaper: Optional[asyncio.Task] = None
+        self.created = 0
+        self.reused = 0
+        self.reconnected = 0
+        self.closed = 0
+
+    async def acquire(self, ssh_host: str, ssh_port: int, ssh_user: str,
+                      ssh_password: Optional[str], ssh_private_key: Optional[str],
+                      remote_host: str, remote_port: int) -> Tuple[str, int]:
+        """Return (key, local_port) for a running tunnel, starting one if needed."""
+        key = tunnel_key(ssh_host, ssh_port, ssh_user, ssh_password,
+                         ssh_private_key, remote_host, remote_port)
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            entry = self._entries.get(key)
+            if entry is not None and not entry.forwarder.is_active:
+                logger.warning(f"SSH tunnel via {ssh_host} is down, reconnecting")
+                await asyncio.to_thread(entry.forwarder.restart)
+                entry.reconnects += 1
+                self.reconnected += 1
+            elif entry is not None:
+                entry.hits += 1
+                self.reused += 1
+            else:
+                tunnel_kwargs = {
+                    "ssh_address_or_host": (ssh_host, ssh_port),
+                    "ssh_username": ssh_user,
+                    "remote_bind_address": (remote_host, remote_port),
+                    "set_keepalive": Config.SSH_TUNNEL_KEEPALIVE,
+                }
+                if ssh_private_key:
+                    tunnel_kwargs["ssh_pkey"] = io.StringIO(ssh_private_key)
+                else:
+                    tunnel_kwargs["ssh_password"] = ssh_password
+
+                forwarder = SSHTunnelForwarder(**tunnel_kwargs)
+                await asyncio.to_thread(forwarder.start)
+                entry = _TunnelEntry(forwarder, ssh_host, remote_host, remote_port)
+                self._entries[key] = entry
+                self.created += 1
+                logger.info(f"Opened SSH tunnel via {ssh_host} to {remote_host}:{remote_port}")
+
+            entry.refs += 1
+            entry.last_used = time.monotonic()
+            return key, entry.forwarder.local_bind_port
+
+    async def release(self, key: str):
+        """Drop one reference; the tunnel stays up until it has been idle for a while."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return
+        entry.refs = max(0, entry.refs - 1)
+        entry.last_used = time.monotonic()
+
+    async def _close(self, key: str):
+        entry = self._entries.pop(key, None)
+        lock = self._locks.get(key)
+        if lock is not None and not lock.locked():
+            del self._locks[key]
+        if entry is None:
+            return
+        try:
+            await asyncio.to_thread(entry.forwarder.stop)
+        except Exception as e:
+            logger.warning(f"Error stopping SSH tunnel via {entry.ssh_host}: {e}")
+        self.closed += 1
+        logger.info(f"Closed SSH tunnel via {entry.ssh_host}")
+
+    async def reap_idle(self):
+        """Close tunnels that nobody has used for longer than `idle_ttl`."""
+        now = time.monotonic()
+        idle = [k for k, e in self._entries.items()
+                if e.refs == 0 and now - e.last_used > self.idle_ttl]
+        for key in idle:
+            await self._close(key)
+
+    async def _reap_forever(self):
+        interval = max(1.0, min(self.idle_ttl / 2, 60.0))
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.reap_idle()
+            except Exception as e:
+                logger.exception(f"SSH tunnel reaper failed: {e}")
+
+    def start(self):
+        if self._reaper is None or self._reaper.done():
+            self._reaper = asyncio.ensure_future(self._reap_forever())
+
+    async def close_all(self):
+        if self._reaper is not None:
+            self._reaper.cancel()
+            self._reaper = None
+        for key in list(self._entries):
+            await self._close(key)
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        tunnels = []
+        for key, e in self._entries.items():
+            tunnels.append({
+                "key": key[:12],
+                "local_port": e.forwarder.local_bind_port if e.forwarder.is_active else None,
+                "active": e.forwarder.is_active,
+                "in_use_by_requests": e.refs,
+                "hits": e.hits,
+                "reconnects": e.reconnects,
+                "idle_seconds": round(now - e.last_used, 1),
+                "age_seconds": round(now - e.created_at, 1),
+            })
+        return {
+            "tunnels": tunnels,
+            "open_tunnels": len(self._entries),
+            "created": self.created,
+            "reused": self.reused,
+            "reconnected": self.reconnected,
+            "closed": self.closed,
+        }
+
+
+tunnel_manager = TunnelManager()
@@ -1,35 +1,58 @@
-from fastapi import FastAPI, HTTPException, Request, Depends, status, Form
+from fastapi import FastAPI, HTTPException, Request, Depends, status, Form, File, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse, HTMLResponse, RedirectResponse
+from fastapi.responses import FileResponse, HTMLResponse, RedirectResponse, StreamingResponse
 from fastapi.templating import Jinja2Templates
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from pydantic import BaseModel, EmailStr
 from datetime import datetime, timedelta
 import os
 import re
+import json
+import asyncio
 import logging
-from sshtunnel import SSHTunnelForwarder
-import io
 import aiomysql
 from typing import Optional, List
+from contextlib import asynccontextmanager
 import certifi
 
 # Internal imports
 from utils.config import Config
 from utils.response_formatter import ResponseFormatter
 from db.mariadb_client import MariaDBClient
-from agents.query_optimizer import optimize_query
-from agents.cost_advisor import estimate_cost
-from agents.schema_advisor import advise_schema
-from agents.data_validator import validate_query
+from db.pool_registry import pool_registry
+from db.tunnel_manager import tunnel_manager
+from db.schema_cache import schema_cache
+from utils.analysis_pipeline import run_analysis, stream_analysis
+from utils.claude_client import init_http_client, close_http_client, http_stats
+from utils.llm_cache import llm_cache
+from utils.llm_providers import llm_providers
+from utils.analysis_cache import analysis_cache
+from utils.job_queue import job_queue
+from utils.batch_analysis import run_batch
+from utils.sql_fingerprint import split_statements
+from utils.slow_log import ingest_log, analyze_digests
+from utils.digest_monitor import DigestMonitor, digest_monitors
 from utils.auth_utils import get_password_hash, verify_password, create_access_token, decode_access_token
 
 # Logging
 logging.basicConfig(level=logging.INFO, format='%(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="QueryVault Enterprise")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    pool_registry.start()
+    tunnel_manager.start()
+    await init_http_client()
+    job_queue.start()
+    yield
+    await digest_monitors.stop_all()
+    await job_queue.stop()
+    await close_http_client()
+    await pool_registry.close_all()
+    await tunnel_manager.close_all()
+
+app = FastAPI(title="QueryVault Enterprise", lifespan=lifespan)
 templates = Jinja2Templates(directory="templates")
 
 app.add_middleware(
@@ -117,10 +140,35 @@ class QueryRequest(BaseModel):
     sql: str
     database: DatabaseConfig
     run_in_sandbox: bool = True
+    # ANALYZE FORMAT=JSON executes the query itself, so it is never on by default
+    run_analyze: bool = False
+    bypass_cache: bool = False
+    benchmark: bool = False
+    benchmark_runs: Optional[int] = None
+    verify_results: bool = False
+    what_if_indexes: bool = False
+
+    def benchmark_run_count(self) -> int:
+        """Measured runs per query for the benchmark stage; 0 when not requested."""
+        if not self.benchmark:
+            return 0
+        return max(1, min(self.benchmark_runs or Config.BENCHMARK_RUNS, Config.BENCHMARK_MAX_RUNS))
 
 class SchemaRequest(BaseModel):
     database: DatabaseConfig
 
+class DigestMonitorRequest(BaseModel):
+    database: DatabaseConfig
+    interval: float = Config.DIGEST_INTERVAL
+    top: int = Config.DIGEST_TOP
+    auto_analyze: bool = True
+
+class BatchRequest(BaseModel):
+    queries: List[str]
+    database: DatabaseConfig
+    bypass_cache: bool = False
+    concurrency: Optional[int] = None
+
 # --- Helper Logic ---
 async def get_connection_details(db_config: DatabaseConfig):
     tunnel = None
@@ -129,30 +177,62 @@ async def get_connection_details(db_config: DatabaseConfig):
 
     if db_config.use_ssh and db_config.ssh_config:
         ssh_cfg = db_config.ssh_config
-        tunnel_kwargs = {
-            "ssh_address_or_host": (ssh_cfg.host, ssh_cfg.port),
-            "ssh_username": ssh_cfg.user,
-            "remote_bind_address": (db_config.host, db_config.port),
-        }
-        if ssh_cfg.private_key:
-            tunnel_kwargs["ssh_pkey"] = io.StringIO(ssh_cfg.private_key)
-        else:
-            tunnel_kwargs["ssh_password"] = ssh_cfg.password
-
-        tunnel = SSHTunnelForwarder(**tunnel_kwargs)
-        tunnel.start()
+        tunnel, port = await tunnel_manager.acquire(
+            ssh_host=ssh_cfg.host,
+            ssh_port=ssh_cfg.port,
+            ssh_user=ssh_cfg.user,
+            ssh_password=ssh_cfg.password,
+            ssh_private_key=ssh_cfg.private_key,
+            remote_host=db_config.host,
+            remote_port=db_config.port,
+        )
         host = "127.0.0.1"
-        port = tunnel.local_bind_port
+
+    ssh = None
+    if db_config.use_ssh and db_config.ssh_config:
+        ssh = (db_config.ssh_config.host, db_config.ssh_config.port, db_config.ssh_config.user)
 
     db_client = MariaDBClient(
         host=db_config.host,
         user=db_config.user,
         password=db_config.password,
         database=db_config.database,
-        port=db_config.port
+        port=db_config.port,
+        registry=pool_registry,
+        schema_cache=schema_cache,
+        ssh=ssh
     )
     return db_client, tunnel, host, port
 
+async def release_connection(db_client: MariaDBClient, tunnel: Optional[str]):
+    await db_client.disconnect()
+    if tunnel: await tunnel_manager.release(tunnel)
+
+@asynccontextmanager
+async def connected_client(db_config: DatabaseConfig):
+    db_client, tunnel, host, port = await get_connection_details(db_config)
+    try:
+        await db_client.connect(host=host, port=port)
+        yield db_client
+    finally:
+        await release_connection(db_client, tunnel)
+
+def analysis_runner(db_config: DatabaseConfig, query: str, bypass_cache: bool = False, analyze: bool = False,
+                    benchmark_runs: int = 0, verify: bool = False, what_if: bool = False):
+    """Build a job_queue runner that analyzes `query` on its own connection."""
+    async def runner(on_stage_complete):
+        async with connected_client(db_config) as db_client:
+            async def formatted(name, result):
+                sections = ResponseFormatter.format_stage(name, result)
+                if sections:
+                    await on_stage_complete(name, sections)
+
+            return await run_analysis(db_client, query, db_config.database,
+                                      bypass_cache=bypass_cache, on_stage_complete=formatted,
+                                      analyze=analyze, benchmark_runs=benchmark_runs, verify=verify,
+                                      what_if=what_if)
+    return runner
+
 # --- AUTH ENDPOINTS ---
 @app.post("/auth/register")
 async def register(user: UserRegister):
@@ -277,21 +357,248 @@ async def analyze(request: QueryRequest, user=Depends(get_current_user)):
     db_client, tunnel, host, port = await get_connection_details(request.database)
     try:
         await db_client.connect(host=host, port=port)
-        schema_context = await db_client.get_schema_context(query)
-        explain_plan = await db_client.explain(query) if query.lower().startswith("select") else {}
-        sample_rows = await db_client.fetch_sample_rows(query) if query.lower().startswith("select") else {}
-        
-        opt = await optimize_query(query, schema_context, explain_plan, sample_rows)
-        cost = await estimate_cost(query, explain_plan)
-        schema_adv = await advise_schema(query, schema_context)
-        data_val = await validate_query(query, sample_rows)
-
-        return ResponseFormatter.format_analysis(
-            query, schema_context, explain_plan, sample_rows, opt, cost, schema_adv, data_val, request.database.database
-        )
+        return await run_analysis(db_client, query, request.database.database,
+                                  bypass_cache=request.bypass_cache, analyze=request.run_analyze,
+                                  benchmark_runs=request.benchmark_run_count(),
+                                  verify=request.verify_results, what_if=request.what_if_indexes)
     finally:
-        await db_client.disconnect()
-        if tunnel: tunnel.stop()
+        await release_connection(db_client, tunnel)
+
+def sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+@app.post("/analyze/stream")
+async def analyze_stream(request: QueryRequest, user=Depends(get_current_user)):
+    """Server-Sent Events variant of /analyze that emits sections as they finish."""
+    if not user: raise HTTPException(status_code=401)
+    query = request.sql.strip()
+
+    async def events():
+        # Tunnel and pool are taken inside the generator: if the client disconnects
+        # before the body is iterated, nothing has been acquired that needs releasing
+        try:
+            async with connected_client(request.database) as db_client:
+                async for event, data in stream_analysis(db_client, query, request.database.database,
+                                                         bypass_cache=request.bypass_cache,
+                                                         analyze=request.run_analyze,
+                                                         benchmark_runs=request.benchmark_run_count(),
+                                                         verify=request.verify_results,
+                                                         what_if=request.what_if_indexes):
+                    yield sse_event(event, data)
+        except Exception as e:
+            logger.exception(f"Streaming analysis failed: {e}")
+            yield sse_event("error", ResponseFormatter.format_error(str(e)))
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+# --- ANALYSIS JOBS ---
+@app.post("/analyze/jobs")
+async def submit_analysis_job(request: QueryRequest, user=Depends(get_current_user)):
+    """Queue an analysis and return its job id immediately."""
+    if not user: raise HTTPException(status_code=401)
+    runner = analysis_runner(request.database, request.sql.strip(), request.bypass_cache,
+                             request.run_analyze, request.benchmark_run_count(),
+                             request.verify_results, request.what_if_indexes)
+    try:
+        job = job_queue.submit(user["email"], runner)
+    except asyncio.QueueFull:
+        raise HTTPException(status_code=503, detail="Analysis queue is full, retry shortly")
+    return {"job_id": job.id, "status": job.status}
+
+@app.get("/analyze/jobs/metrics")
+async def analysis_job_metrics(user=Depends(get_current_user)):
+    if not user: raise HTTPException(status_code=401)
+    return job_queue.metrics()
+
+@app.get("/analyze/jobs/{job_id}")
+async def get_analysis_job(job_id: str, user=Depends(get_current_user)):
+    if not user: raise HTTPException(status_code=401)
+    job = job_queue.get(job_id, owner=user["email"])
+    if not job: raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
+
+@app.get("/analyze/jobs/{job_id}/stream")
+async def stream_analysis_job(job_id: str, user=Depends(get_current_user)):
+    if not user: raise HTTPException(status_code=401)
+    job = job_queue.get(job_id, owner=user["email"])
+    if not job: raise HTTPException(status_code=404, detail="Job not found")
+
+    async def events():
+        async for event, data in job_queue.stream(job):
+            yield sse_event(event, data)
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.delete("/analyze/jobs/{job_id}")
+async def cancel_analysis_job(job_id: str, user=Depends(get_current_user)):
+    if not user: raise HTTPException(status_code=401)
+    job = job_queue.get(job_id, owner=user["email"])
+    if not job: raise HTTPException(status_code=404, detail="Job not found")
+    if not job_queue.cancel(job_id):
+        raise HTTPException(status_code=409, detail=f"Job already {job.status}")
+    return {"job_id": job_id, "status": "cancelling"}
+
+# --- BATCH ANALYSIS ---
+def batch_response(db_config: DatabaseConfig, queries: List[str], bypass_cache: bool,
+                   concurrency: Optional[int]) -> StreamingResponse:
+    """Stream run_batch output as NDJSON, one result per distinct query shape."""
+    queries = [q.strip() for q in queries if q and q.strip()]
+    if not queries:
+        raise HTTPException(status_code=400, detail="No queries supplied")
+    if len(queries) > Config.BATCH_MAX_QUERIES:
+        raise HTTPException(status_code=413, detail=f"Batch limited to {Config.BATCH_MAX_QUERIES} queries")
+    concurrency = min(concurrency or Config.BATCH_CONCURRENCY, Config.BATCH_CONCURRENCY)
+
+    async def lines():
+        db_client, tunnel, host, port = await get_connection_details(db_config)
+        try:
+            await db_client.connect(host=host, port=port)
+            async for item in run_batch(db_client, queries, db_config.database,
+                                        bypass_cache=bypass_cache, concurrency=concurrency):
+                yield json.dumps(item, default=str) + "\n"
+        except Exception as e:
+            logger.exception(f"Batch analysis failed: {e}")
+            yield json.dumps({"type": "error", **ResponseFormatter.format_error(str(e))}, default=str) + "\n"
+        finally:
+            await release_connection(db_client, tunnel)
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.post("/analyze/batch")
+async def analyze_batch(request: BatchRequest, user=Depends(get_current_user)):
+    """Analyze a list of queries, deduplicated by fingerprint, as NDJSON."""
+    if not user: raise HTTPException(status_code=401)
+    return batch_response(request.database, request.queries, request.bypass_cache, request.concurrency)
+
+@app.post("/analyze/batch/upload")
+async def analyze_batch_upload(file: UploadFile = File(...), database: str = Form(...),
+                               bypass_cache: bool = Form(False), concurrency: Optional[int] = Form(None),
+                               user=Depends(get_current_user)):
+    """Same as /analyze/batch for a .sql file; `database` is a JSON DatabaseConfig."""
+    if not user: raise HTTPException(status_code=401)
+    try:
+        db_config = DatabaseConfig(**json.loads(database))
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Invalid database config: {e}")
+    text = (await file.read()).decode("utf-8", errors="replace")
+    return batch_response(db_config, split_statements(text), bypass_cache, concurrency)
+
+# --- LOG INGESTION ---
+def resolve_log_path(path: str) -> str:
+    """Only allow server-side logs under Config.SLOW_LOG_DIR."""
+    if not Config.SLOW_LOG_DIR:
+        raise HTTPException(status_code=400, detail="Server-side log paths are disabled (SLOW_LOG_DIR unset)")
+    root = os.path.realpath(Config.SLOW_LOG_DIR)
+    resolved = os.path.realpath(os.path.join(root, path))
+    if os.path.commonpath([root, resolved]) != root or not os.path.isfile(resolved):
+        raise HTTPException(status_code=404, detail="Log file not found")
+    return resolved
+
+@app.post("/analyze/slow-log")
+async def analyze_slow_log(file: Optional[UploadFile] = File(None), path: Optional[str] = Form(None),
+                           log_format: str = Form("auto"), top: int = Form(Config.SLOW_LOG_TOP),
+                           order_by: str = Form("total_time"), analyze_top: int = Form(0),
+                           database: Optional[str] = Form(None), bypass_cache: bool = Form(False),
+                           user=Depends(get_current_user)):
+    """Digest a slow or general query log and optionally analyze the top digests.
+
+    Streams NDJSON: a "digest_report" line first, then one "result" line per
+    analyzed digest. The log comes from an upload or a file under SLOW_LOG_DIR.
+    """
+    if not user: raise HTTPException(status_code=401)
+    if log_format not in ("auto", "slow", "general"):
+        raise HTTPException(status_code=400, detail="log_format must be auto, slow or general")
+    db_config = None
+    if database:
+        try:
+            db_config = DatabaseConfig(**json.loads(database))
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=f"Invalid database config: {e}")
+
+    if file is not None:
+        agg = await asyncio.to_thread(ingest_log, file.file, log_format)
+    elif path:
+        resolved = resolve_log_path(path)
+
+        def ingest_path():
+            with open(resolved, "rb") as fh:
+                return ingest_log(fh, log_format)
+
+        agg = await asyncio.to_thread(ingest_path)
+    else:
+        raise HTTPException(status_code=400, detail="Provide a log file upload or a path")
+
+    report = agg.report(max(1, top), order_by)
+    to_analyze = report["digests"][:max(0, min(analyze_top, Config.BATCH_MAX_QUERIES))]
+
+    async def lines():
+        yield json.dumps({"type": "digest_report", **report}, default=str) + "\n"
+        if not to_analyze:
+            return
+        db_client = tunnel = None
+        try:
+            if db_config is not None:
+                db_client, tunnel, host, port = await get_connection_details(db_config)
+                await db_client.connect(host=host, port=port)
+            async for item in analyze_digests(to_analyze, db_client, db_config.database if db_config else "",
+                                              bypass_cache=bypass_cache):
+                yield json.dumps(item, default=str) + "\n"
+        except Exception as e:
+            logger.exception(f"Digest analysis failed: {e}")
+            yield json.dumps({"type": "error", **ResponseFormatter.format_error(str(e))}, default=str) + "\n"
+        finally:
+            if db_client is not None:
+                await release_connection(db_client, tunnel)
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+# --- DIGEST MONITORS ---
+@app.post("/digests/monitors")
+async def start_digest_monitor(request: DigestMonitorRequest, user=Depends(get_current_user)):
+    """Snapshot performance_schema digests periodically and queue the heaviest for analysis."""
+    if not user: raise HTTPException(status_code=401)
+    db_config = request.database
+    monitor = DigestMonitor(
+        owner=user["email"],
+        database=db_config.database,
+        connect=lambda: connected_client(db_config),
+        make_runner=lambda query: analysis_runner(db_config, query),
+        queue=job_queue,
+        interval=request.interval,
+        top=request.top,
+        auto_analyze=request.auto_analyze,
+    )
+    try:
+        digest_monitors.add(monitor)
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return monitor.to_dict()
+
+@app.get("/digests/monitors")
+async def list_digest_monitors(user=Depends(get_current_user)):
+    if not user: raise HTTPException(status_code=401)
+    return [m.to_dict() for m in digest_monitors.list(user["email"])]
+
+@app.get("/digests/monitors/{monitor_id}")
+async def digest_monitor_report(monitor_id: str, window: Optional[float] = None, top: Optional[int] = None,
+                                user=Depends(get_current_user)):
+    """Top digests by total latency over the last `window` seconds (default: last interval)."""
+    if not user: raise HTTPException(status_code=401)
+    monitor = digest_monitors.get(monitor_id, owner=user["email"])
+    if not monitor: raise HTTPException(status_code=404, detail="Monitor not found")
+    return monitor.report(window, top)
+
+@app.delete("/digests/monitors/{monitor_id}")
+async def stop_digest_monitor(monitor_id: str, user=Depends(get_current_user)):
+    if not user: raise HTTPException(status_code=401)
+    if not digest_monitors.get(monitor_id, owner=user["email"]):
+        raise HTTPException(status_code=404, detail="Monitor not found")
+    await digest_monitors.remove(monitor_id)
+    return {"monitor_id": monitor_id, "status": "stopped"}
 
 @app.post("/analyze-schema")
 async def analyze_schema(request: SchemaRequest, user=Depends(get_current_user)):
@@ -301,8 +608,34 @@ async def analyze_schema(request: SchemaRequest, user=Depends(get_current_user))
         await db_client.connect(host=host, port=port)
         return {"database": request.database.database, "tables": await db_client.get_full_schema()}
     finally:
-        await db_client.disconnect()
-        if tunnel: tunnel.stop()
+        await release_connection(db_client, tunnel)
+
+def require_admin(user):
+    """Server-wide stats span every user's connections, so only ADMIN_EMAILS may read them."""
+    if not user: raise HTTPException(status_code=401)
+    if str(user.get("email", "")).lower() not in Config.ADMIN_EMAILS:
+        raise HTTPException(status_code=403, detail="Admin access required")
+
+@app.get("/pools/stats")
+async def pool_stats(user=Depends(get_current_user)):
+    require_admin(user)
+    return pool_registry.stats()
+
+@app.get("/schema-cache/stats")
+async def schema_cache_stats(user=Depends(get_current_user)):
+    if not user: raise HTTPException(status_code=401)
+    return schema_cache.stats()
+
+@app.get("/tunnels/stats")
+async def tunnel_stats(user=Depends(get_current_user)):
+    require_admin(user)
+    return tunnel_manager.stats()
+
+@app.get("/llm/stats")
+async def llm_stats(user=Depends(get_current_user)):
+    if not user: raise HTTPException(status_code=401)
+    return {"http": http_stats(), "cache": llm_cache.stats(), "analysis_cache": analysis_cache.stats(),
+            "providers": llm_providers.stats()}
 
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
@@ -1,5 +1,6 @@
 document.addEventListener("DOMContentLoaded", () => {
   const API = "/analyze";
+  const STREAM_API = "/analyze/stream";
 
   // Prevent browser autofill from lingering
   const clearForm = () => {
@@ -19,6 +20,7 @@ document.addEventListener("DOMContentLoaded", () => {
 
   const sqlEl = document.getElementById("sql");
   const sandboxEl = document.getElementById("sandbox");
+  const runAnalyzeEl = document.getElementById("run_analyze");
   const runBtn = document.getElementById("run");
   const clearBtn = document.getElementById("clear");
 
@@ -105,15 +107,17 @@ document.addEventListener("DOMContentLoaded", () => {
       }
 
       const run_in_sandbox = sandboxEl.value === "true";
+      const run_analyze = !!(runAnalyzeEl && runAnalyzeEl.checked);
 
       runBtn.disabled = true;
       runBtn.textContent = "⏳ Running...";
 
       try {
-        const resp = await fetch(API, {
+        const body = JSON.stringify({ sql, database, run_in_sandbox, run_analyze });
+        let resp = await fetch(STREAM_API, {
           method: "POST",
           headers: { "Content-Type": "application/json" },
-          body: JSON.stringify({ sql, database, run_in_sandbox })
+          body
         });
 
         if (resp.status === 401) {
@@ -121,6 +125,25 @@ document.addEventListener("DOMContentLoaded", () => {
           return;
         }
 
+        if (resp.ok && resp.body && resp.body.getReader) {
+          await readAnalysisStream(resp.body.getReader(), { original_query: sql, database: database.database });
+          return;
+        }
+
+        // Fall back to the single-response endpoint only when the server has no stream route;
+        // any other failure is reported rather than re-running the analysis
+        if (!resp.ok && resp.status !== 404 && resp.status !== 405) {
+          const txt = await resp.text();
+          showMessage("Server error: " + resp.status + " - " + txt, "error");
+          return;
+        }
+
+        resp = await fetch(API, {
+          method: "POST",
+          headers: { "Content-Type": "application/json" },
+          body
+        });
+
         if (!resp.ok) {
           const txt = await resp.text();
           showMessage("Server error: " + resp.status + " - " + txt, "error");
@@ -140,6 +163,49 @@ document.addEventListener("DOMContentLoaded", () => {
     };
   }
 
+  // Reads Server-Sent Events from /analyze/stream and re-renders as each section lands
+  async function readAnalysisStream(reader, partial) {
+    const decoder = new TextDecoder();
+    let buffer = "";
+    partial.technical_details = partial.technical_details || {};
+    renderResults(partial);
+
+    while (true) {
+      const { value, done } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+
+      let sep;
+      while ((sep = buffer.indexOf("\n\n")) !== -1) {
+        const chunk = buffer.slice(0, sep);
+        buffer = buffer.slice(sep + 2);
+
+        let event = "message";
+        let dataText = "";
+        chunk.split("\n").forEach(line => {
+          if (line.startsWith("event: ")) event = line.slice(7);
+          else if (line.startsWith("data: ")) dataText += line.slice(6);
+        });
+        if (!dataText) continue;
+        const data = JSON.parse(dataText);
+
+        if (event === "error") {
+          showMessage("Analysis failed: " + (data.error || "unknown error"), "error");
+        } else if (event === "complete") {
+          console.log("Response:", data);
+          renderResults(data);
+        } else if (Object.keys(data).length) {
+          if (data.technical_details) {
+            Object.assign(partial.technical_details, data.technical_details);
+            delete data.technical_details;
+          }
+          Object.assign(partial, data);
+          renderResults(partial);
+        }
+      }
+    }
+  }
+
   if (clearBtn) {
     clearBtn.onclick = () => {
       sqlEl.value = "";
@@ -234,6 +300,9 @@ document.addEventListener("DOMContentLoaded", () => {
 <p><strong>Database:</strong> ${db}</p>
 <p><strong>Performance Impact:</strong> <span class="impact-${impactLevel}">${impactLevel.charAt(0).toUpperCase() + impactLevel.slice(1)}</span></p>
 <p><strong>Key Findings:</strong> ${summary.optimization_reason || "Query analyzed"}</p>`;
+    if (data.cache && data.cache.hit) {
+      summaryEl.innerHTML += `<p><strong>⚡ Cached Result:</strong> reused an analysis from ${Math.round(data.cache.age_seconds)}s ago for a query with the same shape</p>`;
+    }
 
     if (opt.status === "success") {
       const optimizedQuery = opt.optimized_query || query;
@@ -274,6 +343,8 @@ document.addEventListener("DOMContentLoaded", () => {
       if (cost.warnings && cost.warnings.length > 0) {
         aiHTML += `<p><strong>Warnings:</strong><ul>${cost.warnings.map(w => `<li>${w}</li>`).join("")}</ul></p>`;
       }
+    } else if (!data.cost_analysis) {
+      aiHTML += `<p>⏳ Running cost analysis...</p>`;
     } else {
       aiHTML += `<p>⚠ ${cost.error || "Cost analysis unavailable"}</p>`;
     }
@@ -291,6 +362,8 @@ document.addEventListener("DOMContentLoaded", () => {
       }
     } else if (schema.status === "unsafe") {
       aiHTML += `<p>⚠️ Query contains unsafe operations</p>`;
+    } else if (!data.schema_improvements) {
+      aiHTML += `<p>⏳ Running schema analysis...</p>`;
     } else {
       aiHTML += `<p>⚠ ${schema.error || "Schema analysis unavailable"}</p>`;
     }
@@ -304,6 +377,8 @@ document.addEventListener("DOMContentLoaded", () => {
         aiHTML += `<p>✓ Data quality looks good</p>`;
         if (validator.reasoning) aiHTML += `<p><em>${validator.reasoning}</em></p>`;
       }
+    } else if (!data.data_quality) {
+      aiHTML += `<p>⏳ Running data validation...</p>`;
     } else {
       aiHTML += `<p>⚠ ${validator.error || "Data validation unavailable"}</p>`;
     }
@@ -312,6 +387,8 @@ document.addEventListener("DOMContentLoaded", () => {
 
     if (Array.isArray(technical.explain_plan) && technical.explain_plan.length > 0) {
       planEl.innerHTML = makeTable(technical.explain_plan);
+    } else if (!("explain_plan" in technical)) {
+      planEl.innerHTML = "<p>⏳ Fetching explain plan...</p>";
     } else {
       planEl.innerHTML = "<p>⚠ No explain plan available</p>";
     }
@@ -337,7 +414,9 @@ document.addEventListener("DOMContentLoaded", () => {
       html += `<h3>📂 Schema Context</h3>`;
       const schema = technical.schema_context;
       if (typeof schema === "object" && !Array.isArray(schema)) {
+        const tableStats = schema._table_stats || {};
         for (const [table, cols] of Object.entries(schema)) {
+          if (table.startsWith("_")) continue;
           html += `
 <div style="margin-top: 1.5rem; padding: 1rem; background: rgba(0,217,255,0.05); border: 1px solid rgba(0,217,255,0.2); border-radius: 12px;">
   <h4 style="color: var(--primary-blue); margin-top: 0;">📋 Table: <code>${escapeHtml(table)}</code></h4>`;
@@ -385,7 +464,17 @@ document.addEventListener("DOMContentLoaded", () => {
             html += `
     </tbody>
   </table>
-  </div>
+  </div>`;
+            const stats = tableStats[table];
+            if (stats) {
+              if (stats.rows_estimate != null) {
+                html += `<p><strong>Rows (est.):</strong> ${escapeHtml(String(stats.rows_estimate))}</p>`;
+              }
+              if (stats.indexes && stats.indexes.length > 0) {
+                html += `<p><strong>Indexes:</strong></p><ul>${stats.indexes.map(idx => `<li><code>${escapeHtml(idx.name)}</code> (${escapeHtml(idx.columns.join(", "))})${idx.unique ? " unique" : ""}</li>`).join("")}</ul>`;
+              }
+            }
+            html += `
 </div>`;
           } else if (cols && typeof cols === "object") {
             html += `<p>${JSON.stringify(cols)}</p>`;
@@ -0,0 +1,107 @@
+import asyncio
+
+import pytest
+
+from utils import analysis_pipeline
+from utils.analysis_cache import AnalysisCache, database_identity
+from utils.config import Config
+
+
+def test_identity_depends_on_every_field():
+    base = database_identity("10.0.0.5", 3306, "app", "shop")
+    assert base == database_identity("10.0.0.5", "3306", "app", "shop")
+    assert len({base,
+                database_identity("10.0.0.6", 3306, "app", "shop"),
+                database_identity("10.0.0.5", 3307, "app", "shop"),
+                database_identity("10.0.0.5", 3306, "report", "shop"),
+                database_identity("10.0.0.5", 3306, "app", "billing")}) == 5
+
+
+def test_identity_distinguishes_ssh_bastions():
+    direct = database_identity("10.0.0.5", 3306, "app", "shop")
+    east = database_identity("10.0.0.5", 3306, "app", "shop", ssh=("bastion-east", 22, "ops"))
+    west = database_identity("10.0.0.5", 3306, "app", "shop", ssh=("bastion-west", 22, "ops"))
+    assert len({direct, east, west}) == 3
+    assert east != database_identity("10.0.0.5", 3306, "app", "shop", ssh=("bastion-east", 2222, "ops"))
+    assert east != database_identity("10.0.0.5", 3306, "app", "shop", ssh=("bastion-east", 22, "root"))
+    assert east == database_identity("10.0.0.5", 3306, "app", "shop", ssh=["bastion-east", "22", "ops"])
+
+
+class FakeClient:
+    """Two servers behind different bastions, sharing one private address."""
+
+    host, port, user, database = "10.0.0.5", 3306, "app", "shop"
+
+    def __init__(self, ssh, rows):
+        self.ssh = ssh
+        self.rows = rows
+        self.schema_version = None
+
+    async def get_schema_context(self, query):
+        return {"orders": {"columns": [{"name": "id", "type": "int"}]}}
+
+    async def explain(self, query):
+        return [{"id": 1, "table": "orders", "type": "const", "rows": 1, "key": "PRIMARY",
+                 "possible_keys": "PRIMARY", "Extra": ""}]
+
+    async def fetch_sample_rows(self, query):
+        return {"rows": self.rows}
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    cache = AnalysisCache()
+    monkeypatch.setattr(analysis_pipeline, "analysis_cache", cache)
+    monkeypatch.setattr(Config, "ANALYSIS_CACHE_ENABLED", True)
+    monkeypatch.setattr(Config, "LLM_ENABLED", False)
+    monkeypatch.setattr(Config, "PLAN_TREE_ENABLED", False)
+
+    async def agent(*args, **kwargs):
+        return {"status": "success", "details": {}}
+
+    # The trivial test query skips the LLM for the optimizer and cost agents; stand in for the others
+    monkeypatch.setattr(analysis_pipeline, "advise_schema", agent)
+    monkeypatch.setattr(analysis_pipeline, "validate_query", agent)
+    return cache
+
+
+def _analyze(client):
+    return asyncio.run(analysis_pipeline.run_analysis(client, "SELECT id FROM orders WHERE id = 1", "shop"))
+
+
+def test_servers_behind_different_bastions_do_not_share_cached_analyses(cache):
+    east = _analyze(FakeClient(("bastion-east", 22, "ops"), [{"id": 1}]))
+    west = _analyze(FakeClient(("bastion-west", 22, "ops"), [{"id": 2}]))
+    assert cache.stores == 2
+    assert east["cache"]["hit"] is False and west["cache"]["hit"] is False
+    assert west["technical_details"]["sample_rows"] == {"rows": [{"id": 2}]}
+
+
+def test_same_server_reuses_its_cached_analysis(cache):
+    _analyze(FakeClient(("bastion-east", 22, "ops"), [{"id": 1}]))
+    again = _analyze(FakeClient(("bastion-east", 22, "ops"), [{"id": 1}]))
+    assert again["cache"]["hit"] is True
+
+
+def _stream(client):
+    async def collect():
+        return [item async for item in analysis_pipeline.stream_analysis(
+            client, "SELECT id FROM orders WHERE id = 1", "shop")]
+    return asyncio.run(collect())
+
+
+def test_stream_sections_match_the_final_response(cache, monkeypatch):
+    monkeypatch.setattr(Config, "LLM_FUSED_AGENTS", True)
+    events = _stream(FakeClient(("bastion-east", 22, "ops"), [{"id": 1}]))
+    *stages, (last, response) = events
+    assert last == "complete"
+    # The fused stage has no section of its own and must not send an empty event
+    assert "fused" not in [name for name, _ in stages]
+    assert all(sections for _, sections in stages)
+    for _, sections in stages:
+        for key, value in sections.items():
+            if key == "technical_details":
+                for detail, item in value.items():
+                    assert response["technical_details"][detail] == item
+            else:
+                assert response[key] == value
@@ -0,0 +1,64 @@
+from db.digest_harvester import DigestHistory
+
+
+def _row(digest, count, timer=0, examined=0):
+    # digest, text, count, timer_wait, lock_time, rows_examined, rows_sent, no_index_used, tmp_disk_tables
+    return (digest, f"SELECT {digest}", count, timer, 0, examined, count, 0, 0)
+
+
+def _counts(delta):
+    return {d["digest"]: d["count"] for d in delta["digests"]}
+
+
+def test_single_snapshot_reports_totals_since_server_start():
+    history = DigestHistory()
+    history.add([_row("a", 5), _row("b", 2)], taken_at=0)
+    delta = history.delta()
+    assert delta["since_server_start"] is True
+    assert _counts(delta) == {"a": 5, "b": 2}
+
+
+def test_delta_uses_previous_snapshot_or_window():
+    history = DigestHistory()
+    history.add([_row("a", 5, examined=50), _row("b", 2)], taken_at=0)
+    history.add([_row("a", 8, examined=80), _row("b", 2)], taken_at=60)
+    history.add([_row("a", 9, examined=90), _row("b", 6)], taken_at=120)
+
+    latest = history.delta()
+    assert latest["window_seconds"] == 60
+    assert _counts(latest) == {"a": 1, "b": 4}
+
+    window = history.delta(window=120)
+    assert window["window_seconds"] == 120
+    assert _counts(window) == {"a": 4, "b": 4}
+    assert next(d for d in window["digests"] if d["digest"] == "a")["rows_examined"] == 40
+
+
+def test_counter_reset_counts_from_zero():
+    history = DigestHistory()
+    history.add([_row("a", 100)], taken_at=0)
+    history.add([_row("a", 3)], taken_at=60)
+    assert _counts(history.delta()) == {"a": 3}
+
+
+def test_unchanged_digests_are_not_stored_per_snapshot():
+    history = DigestHistory()
+    rows = [_row(f"d{i}", 10) for i in range(1000)]
+    history.add(rows, taken_at=0)
+    first = history.footprint()["bytes"]
+    for t in range(1, 100):
+        history.add(rows[:-1] + [_row("d999", 10 + t)], taken_at=t * 60)
+    footprint = history.footprint()
+    # 99 snapshots with one changed digest each add a few hundred bytes per snapshot at most
+    assert footprint["bytes"] - first < 99 * 100
+    assert _counts(history.delta()) == {"d999": 1}
+
+
+def test_retention_drops_the_oldest_snapshots():
+    history = DigestHistory(retention=3)
+    for t in range(5):
+        history.add([_row("a", t + 1)], taken_at=t * 60)
+    assert history.footprint()["snapshots"] == 3
+    delta = history.delta(window=10_000)
+    assert delta["window_seconds"] == 120
+    assert _counts(delta) == {"a": 2}
@@ -0,0 +1,93 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from utils import claude_client, llm_providers as providers
+from utils.config import Config
+from utils.llm_providers import LLMEndpoint, LLMProviderPool
+
+
+def _completion(text: str) -> dict:
+    return {"choices": [{"message": {"content": text}}]}
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    """Two stand-in endpoints behind an httpx MockTransport; `replies` maps host -> status list."""
+    pool = LLMProviderPool([LLMEndpoint("a", "http://a.test/v1/chat/completions"),
+                            LLMEndpoint("b", "http://b.test/v1/chat/completions")])
+    pool.replies = {"a.test": [], "b.test": []}
+    pool.hits = []
+    pool.release = asyncio.Event()
+    pool.hold = False
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        host = request.url.host
+        pool.hits.append(host)
+        if pool.hold:
+            await pool.release.wait()
+        status = pool.replies[host].pop(0) if pool.replies[host] else 200
+        if status != 200:
+            return httpx.Response(status, json={"error": "stand-in failure"}, headers={"Retry-After": "0"})
+        return httpx.Response(200, json=_completion(host))
+
+    monkeypatch.setattr(Config, "LLM_RETRIES", 0)
+    monkeypatch.setattr(Config, "LLM_HEDGE_ENABLED", False)
+    monkeypatch.setattr(claude_client, "llm_providers", pool)
+    monkeypatch.setattr(claude_client, "_http_client", httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    return pool
+
+
+def _call(pool):
+    return pool.send(10, lambda endpoint: claude_client.call_claude_raw("hi", "m", endpoint=endpoint))
+
+
+def test_least_outstanding_spreads_concurrent_calls(pool):
+    async def scenario():
+        pool.hold = True
+        calls = [asyncio.ensure_future(_call(pool)) for _ in range(4)]
+        while len(pool.hits) < 4:
+            await asyncio.sleep(0.01)
+        pool.release.set()
+        return await asyncio.gather(*calls)
+
+    results = asyncio.run(scenario())
+    assert sorted(r["text"] for r in results) == ["a.test", "a.test", "b.test", "b.test"]
+
+
+@pytest.mark.parametrize("status", [429, 500, 503])
+def test_fails_over_to_the_other_endpoint(pool, status):
+    pool.replies["a.test"] = [status]
+    result = asyncio.run(_call(pool))
+    assert result["text"] == "b.test"
+    assert pool.hits == ["a.test", "b.test"]
+
+
+def test_bad_request_is_not_failed_over(pool):
+    pool.replies["a.test"] = [400]
+    result = asyncio.run(_call(pool))
+    assert result["status"] == 400
+    assert pool.hits == ["a.test"]
+
+
+def test_per_endpoint_stats(pool):
+    pool.replies["a.test"] = [500]
+    asyncio.run(_call(pool))
+    stats = pool.stats()["endpoints"]
+    assert (stats["a"]["requests"], stats["a"]["errors"], stats["a"]["failovers"]) == (1, 1, 1)
+    assert (stats["b"]["requests"], stats["b"]["errors"], stats["b"]["failovers"]) == (1, 0, 0)
+    assert stats["a"]["circuit"]["consecutive_failures"] == 1
+    assert stats["b"]["latency"]["m"]["samples"] == 1
+
+
+def test_duplicate_endpoint_names_are_suffixed(monkeypatch):
+    monkeypatch.setattr(Config, "LLM_ENDPOINTS", json.dumps([
+        {"name": "groq", "url": "http://a.test"},
+        {"name": "groq", "url": "http://b.test"},
+        {"name": "groq", "url": "http://c.test"},
+    ]))
+    endpoints = providers._load_endpoints()
+    assert [ep.name for ep in endpoints] == ["groq", "groq-2", "groq-3"]
+    assert len(LLMProviderPool(endpoints).stats()["endpoints"]) == 3
@@ -0,0 +1,101 @@
+import asyncio
+
+import pytest
+
+from db import pool_registry as pool_registry_module
+from db.pool_registry import PoolRegistry
+
+
+class FakePool:
+    def __init__(self):
+        self.closed = False
+        self.dead = False
+        self.hang = False
+        self.size, self.freesize, self.minsize, self.maxsize = 1, 1, 1, 2
+
+    def acquire(self):
+        pool = self
+
+        class _Acquire:
+            async def __aenter__(self):
+                if pool.hang:
+                    await asyncio.sleep(60)
+                return self
+
+            async def __aexit__(self, *exc):
+                pass
+
+            async def ping(self, reconnect=True):
+                if pool.dead:
+                    raise ConnectionError("server has gone away")
+
+        return _Acquire()
+
+    def close(self):
+        self.closed = True
+
+    async def wait_closed(self):
+        pass
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    async def create_pool(**kwargs):
+        return FakePool()
+
+    monkeypatch.setattr(pool_registry_module.aiomysql, "create_pool", create_pool)
+    return PoolRegistry(ping_interval=0)
+
+
+IDENTITY = dict(host="127.0.0.1", port=3306, user="app", password="secret", database="shop")
+
+
+def test_dead_pool_in_use_is_retired_and_closed_when_released(registry):
+    async def scenario():
+        key, first = await registry.acquire(**IDENTITY)
+        first.dead = True
+        _, second = await registry.acquire(**IDENTITY)
+        assert second is not first and not first.closed
+        await registry.release(key, first)
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    assert first.closed and not second.closed
+    assert registry.stats()["retired_pools"] == 0
+
+
+def test_exhausted_pool_is_reused_without_waiting_for_a_connection(registry):
+    async def scenario():
+        _, pool = await registry.acquire(**IDENTITY)
+        pool.hang = True
+        pool.size, pool.freesize = pool.maxsize, 0
+        _, again = await asyncio.wait_for(registry.acquire(**IDENTITY), timeout=1)
+        return pool, again
+
+    pool, again = asyncio.run(scenario())
+    assert again is pool
+
+
+def test_health_check_acquire_is_bounded_by_the_timeout(registry, monkeypatch):
+    real_wait_for = asyncio.wait_for
+
+    async def quick_wait_for(awaitable, timeout):
+        return await real_wait_for(awaitable, min(timeout, 0.05))
+
+    monkeypatch.setattr(pool_registry_module.asyncio, "wait_for", quick_wait_for)
+
+    async def scenario():
+        _, pool = await registry.acquire(**IDENTITY)
+        pool.hang = True
+        _, fresh = await real_wait_for(registry.acquire(**IDENTITY), timeout=1)
+        return pool, fresh
+
+    pool, fresh = asyncio.run(scenario())
+    assert fresh is not pool
+    assert registry.ping_failures == 1
+
+
+def test_stats_do_not_expose_hosts_or_databases(registry):
+    asyncio.run(registry.acquire(**IDENTITY))
+    (entry,) = registry.stats()["pools"]
+    assert not {"host", "port", "database"} & set(entry)
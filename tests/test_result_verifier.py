@@ -0,0 +1,92 @@
+import asyncio
+
+import pymysql
+
+from db.result_verifier import verify_equivalent
+
+TIMEOUT = pymysql.err.OperationalError(1969, "Query execution was interrupted (max_statement_time exceeded)")
+
+
+class FakeCursor:
+    def __init__(self, pool):
+        self.pool = pool
+        self.rows = []
+        self.description = None
+
+    async def execute(self, sql):
+        self.pool.statements.append(sql)
+        query = sql.split(" FOR ", 1)[1]
+        if query in self.pool.killed:
+            raise TIMEOUT
+        self.rows = list(self.pool.results[query])
+        self.description = [("c",)] * (len(self.rows[0]) if self.rows else 1)
+
+    async def fetchmany(self, size):
+        chunk, self.rows = self.rows[:size], self.rows[size:]
+        return chunk
+
+    async def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self, pool):
+        self.pool = pool
+
+    async def cursor(self, cursor_class=None):
+        return FakeCursor(self.pool)
+
+    def close(self):
+        self.pool.closed += 1
+
+
+class FakeAcquire:
+    def __init__(self, pool):
+        self.pool = pool
+
+    async def __aenter__(self):
+        return FakeConnection(self.pool)
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+class FakePool:
+    def __init__(self, results, killed=()):
+        self.results = results
+        self.killed = set(killed)
+        self.statements = []
+        self.closed = 0
+
+    def acquire(self):
+        return FakeAcquire(self)
+
+
+def _verify(pool, **kwargs):
+    return asyncio.run(verify_equivalent(pool, "SELECT a", "SELECT b", time_budget=10, **kwargs))
+
+
+def test_same_rows_in_any_order_match():
+    pool = FakePool({"SELECT a": [(1, "x"), (2, "y")], "SELECT b": [(2, "y"), (1, "x")]})
+    assert _verify(pool)["status"] == "match"
+
+
+def test_mismatch_reports_rows_found_in_one_result():
+    pool = FakePool({"SELECT a": [(1,), (2,)], "SELECT b": [(1,), (3,)]})
+    result = _verify(pool)
+    assert result["status"] == "mismatch"
+    assert result["only_in_original"] == [{"row": [2], "extra_copies": 1}]
+    assert result["only_in_optimized"] == [{"row": [3], "extra_copies": 1}]
+
+
+def test_server_cap_sits_below_the_time_budget():
+    pool = FakePool({"SELECT a": [(1,)], "SELECT b": [(1,)]})
+    _verify(pool)
+    assert all(s.startswith("SET STATEMENT max_statement_time=9 FOR ") for s in pool.statements)
+
+
+def test_statement_killed_by_the_server_is_inconclusive():
+    pool = FakePool({"SELECT a": [(1,)]}, killed={"SELECT b"})
+    result = _verify(pool)
+    assert result["status"] == "inconclusive"
+    assert "time (10s) budget" in result["reason"]
@@ -0,0 +1,48 @@
+import asyncio
+
+import pytest
+
+from db import schema_cache as schema_cache_module
+from db.schema_cache import SchemaCache
+
+
+class FakeClient:
+    host, port, user, database = "10.0.0.5", 3306, "app", "shop"
+
+    def __init__(self, ssh, columns):
+        self.ssh = ssh
+        # Stands in for the pool: the records this server's catalog returns
+        self.pool = {"orders": {"columns": columns, "indexes": []}}
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    async def signatures(self, pool, tables):
+        self.signature_checks += 1
+        return {name: ("2024-01-01", None) for name in pool}
+
+    async def fetch(pool, tables=None):
+        return {name: dict(record) for name, record in pool.items() if tables is None or name in tables}
+
+    monkeypatch.setattr(SchemaCache, "_signatures", signatures)
+    monkeypatch.setattr(schema_cache_module, "fetch_schema_records", fetch)
+    return SchemaCache()
+
+
+def test_servers_behind_different_bastions_get_their_own_schema(cache):
+    east = FakeClient(("bastion-east", 22, "ops"), [["id", "int"]])
+    west = FakeClient(("bastion-west", 22, "ops"), [["id", "bigint"], ["total", "decimal"]])
+
+    east_records, east_version = asyncio.run(cache.get_tables(east, ["orders"]))
+    west_records, west_version = asyncio.run(cache.get_tables(west, ["orders"]))
+
+    assert west_records["orders"]["columns"] == [["id", "bigint"], ["total", "decimal"]]
+    assert east_version != west_version
+    assert cache.stats()["databases"] == 2
+
+
+def test_same_server_reuses_cached_tables(cache):
+    client = FakeClient(("bastion-east", 22, "ops"), [["id", "int"]])
+    asyncio.run(cache.get_tables(client, ["orders"]))
+    asyncio.run(cache.get_tables(FakeClient(("bastion-east", 22, "ops"), [["id", "int"]]), ["orders"]))
+    assert (cache.tables_refreshed, cache.tables_reused) == (1, 1)
@@ -0,0 +1,133 @@
+import asyncio
+import json
+import re
+
+import pytest
+
+from db.shadow_schema import ShadowSchemaManager, evaluate_indexes
+
+QUERY = "SELECT * FROM orders WHERE customer_id = 5"
+INDEXES = ["CREATE INDEX idx_c ON orders(customer_id)", "CREATE INDEX idx_s ON orders(status)"]
+
+
+class FakeCursor:
+    """Answers the statements evaluate_indexes and prepare() send; `fail_on` raises for a matching one."""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.closed = False
+        self.rows = []
+
+    async def execute(self, sql, args=None):
+        self.conn.log.append(" ".join(sql.split()))
+        if self.conn.fail_on and re.search(self.conn.fail_on, sql):
+            raise self.conn.error
+        self.rows = []
+        if "information_schema.STATISTICS" in sql:
+            self.rows = [(name,) for name in sorted(self.conn.indexes)]
+        elif "information_schema.COLUMNS" in sql:
+            self.rows = [("id", "int(11)", "int", "PRI"), ("customer_id", "int(11)", "int", "")]
+        elif "information_schema.TABLES" in sql or "COUNT(*)" in sql:
+            self.rows = [(1000,)]
+        elif "MIN(" in sql:
+            self.rows = [(1, 1000)]
+        elif "MAX(" in sql:
+            self.rows = [(1000,)]
+        elif "ADD INDEX" in sql:
+            self.conn.indexes.add(re.search(r"ADD INDEX `(\w+)`", sql).group(1))
+        elif "DROP INDEX" in sql:
+            self.conn.indexes.discard(re.search(r"DROP INDEX `(\w+)`", sql).group(1))
+        elif "FORMAT=JSON" in sql:
+            key = next(iter(sorted(self.conn.indexes)), None)
+            table = {"table_name": "orders", "access_type": "ref" if key else "ALL", "key": key,
+                     "rows": 5 if key else 1000, "r_rows": 5 if key else 1000, "r_loops": 1}
+            self.rows = [(json.dumps({"query_block": {"select_id": 1, "cost": 0.1 if key else 2.0,
+                                                      "table": table}}),)]
+
+    async def fetchone(self):
+        return self.rows[0] if self.rows else None
+
+    async def fetchall(self):
+        return self.rows
+
+    async def close(self):
+        self.closed = True
+
+
+class FakeConnection:
+    def __init__(self, fail_on=None, error=None):
+        self.fail_on = fail_on
+        self.error = error
+        self.closed = False
+        self.log = []
+        self.indexes = set()
+        self.cursors = []
+
+    async def cursor(self, cursor_class=None):
+        cur = FakeCursor(self)
+        self.cursors.append(cur)
+        return cur
+
+    def close(self):
+        self.closed = True
+
+
+class FakePool:
+    def __init__(self, conn):
+        self.conn = conn
+        self.released = False
+
+    def acquire(self):
+        pool = self
+
+        class _Acquire:
+            async def __aenter__(self):
+                return pool.conn
+
+            async def __aexit__(self, *exc):
+                pool.released = True
+
+        return _Acquire()
+
+
+def _evaluate(conn):
+    pool = FakePool(conn)
+    result = asyncio.run(evaluate_indexes(pool, ShadowSchemaManager(), "identity", "shop", QUERY, INDEXES))
+    return result, pool
+
+
+def test_successful_run_resets_the_schema_and_keeps_the_connection():
+    conn = FakeConnection()
+    result, pool = _evaluate(conn)
+    assert result["status"] == "success"
+    assert [r["status"] for r in result["indexes"]] == ["evaluated", "evaluated"]
+    assert conn.log[-1] == "USE `shop`"
+    assert not conn.indexes
+    assert not conn.closed and conn.cursors[0].closed and pool.released
+
+
+def test_failed_alter_closes_the_connection_instead_of_returning_it():
+    conn = FakeConnection(fail_on=r"ADD INDEX `whatif_1`", error=RuntimeError("Lock wait timeout exceeded"))
+    result, pool = _evaluate(conn)
+    assert result["status"] == "error"
+    assert "Lock wait timeout" in result["error"]
+    assert [r["status"] for r in result["indexes"]] == ["evaluated"]
+    assert conn.closed
+    # Nothing is sent on a connection whose state is unknown
+    assert conn.log[-1].startswith("ALTER TABLE `orders` ADD INDEX `whatif_1`")
+
+
+def test_cancellation_closes_the_connection_and_propagates():
+    conn = FakeConnection(fail_on=r"ADD INDEX `whatif_0`", error=asyncio.CancelledError())
+    with pytest.raises(asyncio.CancelledError):
+        _evaluate(conn)
+    assert conn.closed
+    assert "USE `shop`" not in conn.log
+
+
+def test_next_run_drops_indexes_a_failed_run_left_behind():
+    conn = FakeConnection()
+    conn.indexes.add("whatif_0")
+    result, _ = _evaluate(conn)
+    assert "ALTER TABLE `whatif_shop`.`orders` DROP INDEX `whatif_0`" in conn.log
+    assert result["before"]["access"][0]["key"] is None
@@ -0,0 +1,51 @@
+from utils.sql_parser import ColumnRef, JoinKey, TableRef, parse_sql
+
+
+def test_order_by_select_alias_resolves_to_the_aliased_column():
+    parsed = parse_sql("SELECT name AS n FROM t ORDER BY n")
+    assert parsed.order_by == (ColumnRef("t", "name"),)
+    assert ColumnRef("t", "n") not in parsed.columns
+
+
+def test_implicit_alias_and_expression_alias_in_group_and_order_by():
+    parsed = parse_sql("SELECT status s, COUNT(*) AS cnt FROM orders GROUP BY s ORDER BY cnt DESC")
+    assert parsed.group_by == (ColumnRef("orders", "status"),)
+    assert parsed.order_by == ()
+    assert ColumnRef("orders", "cnt") not in parsed.columns
+
+
+def test_self_join_keeps_its_join_key():
+    parsed = parse_sql("SELECT a.id FROM t a JOIN t b ON a.id = b.parent_id")
+    assert parsed.tables == (TableRef(None, "t", "a"), TableRef(None, "t", "b"))
+    assert parsed.join_keys == (JoinKey(ColumnRef("t", "id"), ColumnRef("t", "parent_id")),)
+
+
+def test_same_alias_comparison_is_not_a_join_key():
+    parsed = parse_sql("SELECT * FROM t1 JOIN t2 ON t1.id = t2.t1_id WHERE t1.a = t1.b")
+    assert parsed.join_keys == (JoinKey(ColumnRef("t1", "id"), ColumnRef("t2", "t1_id")),)
+
+
+def test_from_dual_is_not_a_table():
+    assert parse_sql("SELECT 1 FROM dual").tables == ()
+    assert parse_sql("SELECT NOW() FROM DUAL WHERE 1 = 1").table_names == []
+
+
+def test_cte_is_not_reported_as_a_table():
+    parsed = parse_sql("WITH recent AS (SELECT id, user_id FROM orders WHERE created_at > '2024-01-01') "
+                       "SELECT u.name FROM users u JOIN recent r ON r.user_id = u.id")
+    assert parsed.ctes == ("recent",)
+    assert parsed.table_names == ["orders", "users"]
+    assert ColumnRef("orders", "created_at") in parsed.columns
+
+
+def test_derived_table_alias_is_recorded_and_inner_tables_parsed():
+    parsed = parse_sql("SELECT d.total FROM (SELECT customer_id, SUM(amount) AS total FROM payments "
+                       "GROUP BY customer_id) d JOIN customers c ON c.id = d.customer_id")
+    assert parsed.derived == ("d",)
+    assert parsed.table_names == ["payments", "customers"]
+    assert ColumnRef("payments", "customer_id") in parsed.group_by
+
+
+def test_using_records_join_keys_on_both_tables():
+    parsed = parse_sql("SELECT * FROM orders JOIN customers USING (customer_id)")
+    assert parsed.join_keys == (JoinKey(ColumnRef("orders", "customer_id"), ColumnRef("customers", "customer_id")),)
@@ -0,0 +1,98 @@
+import copy
+import hashlib
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+from utils.config import Config
+
+logger = logging.getLogger(__name__)
+
+
+def database_identity(host: str, port: int, user: str, database: str,
+                      ssh: Optional[Sequence[Any]] = None) -> str:
+    """Identify the server/database/user an analysis ran against.
+
+    `ssh` is the (host, port, user) of the bastion the server is reached
+    through: servers behind different bastions can share a private address.
+    """
+    material = [host, int(port), user, database]
+    if ssh:
+        ssh_host, ssh_port, ssh_user = ssh
+        material += [ssh_host, int(ssh_port), ssh_user]
+    material = json.dumps(material)
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()[:32]
+
+
+def schema_version(schema_context: Any) -> str:
+    """Hash the schema context so column or index changes miss the cache.
+
+    Row estimates and update times in "_table_stats" move with every write,
+    so only the index definitions from it are part of the version.
+    """
+    structural = schema_context
+    if isinstance(schema_context, dict) and "_table_stats" in schema_context:
+        structural = {k: v for k, v in schema_context.items() if k != "_table_stats"}
+        structural["_indexes"] = {
+            tbl: [(i["name"], i["columns"], i["unique"]) for i in stats.get("indexes", [])]
+            for tbl, stats in schema_context["_table_stats"].items()
+        }
+    material = json.dumps(structural, sort_keys=True, default=str)
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()[:32]
+
+
+class AnalysisCache:
+    """LRU + TTL cache of complete format_analysis responses.
+
+    Keys are (database identity, SQL fingerprint, schema version), so
+    queries that differ only in literals share one analysis.
+    """
+
+    def __init__(self,
+                 max_entries: int = Config.ANALYSIS_CACHE_MAX_ENTRIES,
+                 ttl: float = Config.ANALYSIS_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[Tuple[str, str, str], Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+
+    def get(self, key: Tuple[str, str, str]) -> Optional[Tuple[float, Dict[str, Any]]]:
+        """Return (age_seconds, response copy) or None."""
+        entry = self._entries.get(key)
+        if entry is not None:
+            stored_at, response = entry
+            age = time.time() - stored_at
+            if age <= self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return age, copy.deepcopy(response)
+            del self._entries[key]
+        self.misses += 1
+        return None
+
+    def set(self, key: Tuple[str, str, str], response: Dict[str, Any]):
+        self._entries[key] = (time.time(), copy.deepcopy(response))
+        self._entries.move_to_end(key)
+        self.stores += 1
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": Config.ANALYSIS_CACHE_ENABLED,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "stores": self.stores,
+        }
+
+
+analysis_cache = AnalysisCache()
@@ -0,0 +1,431 @@
+import asyncio
+import logging
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from utils.config import Config
+from utils.response_formatter import ResponseFormatter
+from utils.stage_executor import Stage, StageExecutor, agent_error
+from utils.llm_cache import bypass_cache as llm_bypass_cache
+from utils.analysis_cache import analysis_cache, database_identity, schema_version
+from utils.sql_fingerprint import fingerprint, split_statements
+from utils.explain_rules import evaluate_explain, rule_based_cost, rule_based_optimizer
+from utils.sql_parser import parse_sql
+from utils.plan_tree import plan_report
+from utils.model_router import RouteDecision, route_model
+from utils.claude_client import llm_enabled
+from agents.query_optimizer import optimize_query
+from agents.cost_advisor import estimate_cost
+from agents.schema_advisor import advise_schema
+from agents.data_validator import validate_query, validator_result
+from agents.fused import analyze_fused
+
+logger = logging.getLogger(__name__)
+
+
+def _is_select(query: str) -> bool:
+    return query.lower().startswith("select")
+
+
+async def _with_rule_fallback(agent: str, call: Callable[[], Awaitable[Dict[str, Any]]], query: str, explain: Any,
+                              fallback: Callable[[Dict[str, Any], str], Dict[str, Any]],
+                              timeout: float) -> Dict[str, Any]:
+    """Run an LLM agent, answering from the local EXPLAIN rules when it can't.
+
+    The rules are used when the LLM is disabled, exceeds `timeout`, or
+    returns an error (429s included). Without an EXPLAIN plan there is
+    nothing to evaluate, so the agent's own result or error stands.
+    """
+    has_plan = isinstance(explain, list) and bool(explain)
+    if has_plan and not llm_enabled():
+        return fallback(evaluate_explain(explain, query), "llm_disabled")
+    try:
+        result = await asyncio.wait_for(call(), timeout=timeout)
+    except asyncio.TimeoutError:
+        logger.warning(f"{agent} timed out after {timeout}s")
+        if has_plan:
+            return fallback(evaluate_explain(explain, query), "llm_timeout")
+        return agent_error(agent)(f"{agent} timed out after {timeout}s")
+    if has_plan and result.get("status") == "error":
+        details = result.get("details", {})
+        reason = "rate_limited" if details.get("http_status") == 429 else "llm_error"
+        logger.info(f"{agent} failed ({reason}), answering from EXPLAIN rules")
+        return fallback(evaluate_explain(explain, query), reason)
+    return result
+
+
+def _routed(result: Dict[str, Any], decision: RouteDecision) -> Dict[str, Any]:
+    return {**result, "routing": decision.to_dict()}
+
+
+def _with_measured_cost(cost: Dict[str, Any], plan: Any) -> Dict[str, Any]:
+    """Replace the cost agent's low/medium/high guess with ANALYZE measurements.
+
+    The agent's (or rule engine's) estimate is kept as `predicted_cost`.
+    Without an ANALYZE plan the cost result is returned unchanged.
+    """
+    summary = plan.get("summary") if isinstance(plan, dict) else None
+    if not summary or not summary.get("analyzed"):
+        return cost
+    measured = {k: summary[k] for k in ("total_time_ms", "actual_rows_read", "estimated_rows",
+                                        "pages_accessed", "misestimates")}
+    warnings = [f"`{m['table']}`: optimizer estimated {m['estimated_rows']:g} rows, read {m['actual_rows']:g}"
+                for m in summary["misestimates"]]
+    if cost.get("status") == "error":
+        details = {"cost_saving_tips": [], "warnings": warnings}
+        predicted = None
+    else:
+        details = dict(cost.get("details", {}))
+        details["warnings"] = list(details.get("warnings", [])) + warnings
+        predicted = details.get("estimated_cost")
+    details.update(estimated_cost=summary["measured_cost"], predicted_cost=predicted, measured=measured)
+    return {**cost, "status": "success", "source": cost.get("source", "llm") if predicted else "analyze",
+            "details": details}
+
+
+def _measured_impact(speedup: float) -> str:
+    if speedup >= 2:
+        return "high"
+    if speedup >= 1.2:
+        return "medium"
+    if speedup >= 1:
+        return "low"
+    return "regression"
+
+
+def _comparable_rewrite(query: str, optimizer: Dict[str, Any]) -> Tuple[Optional[str], Optional[str]]:
+    """(rewrite, None) when the optimizer's rewrite can be executed, else (None, reason).
+
+    Only a single SELECT whose fingerprint differs from the original is run.
+    """
+    details = optimizer.get("details", {}) if optimizer.get("status") != "error" else {}
+    optimized = (details.get("optimized_query") or "").strip()
+    if not optimized:
+        return None, "No optimized query to compare"
+    statements = split_statements(optimized)
+    if len(statements) != 1 or parse_sql(statements[0]).statement != "select":
+        return None, "Optimized query is not a single SELECT"
+    if fingerprint(statements[0]) == fingerprint(query):
+        return None, "Optimized query is the same as the original"
+    return statements[0], None
+
+
+async def _verify_rewrite(db_client, query: str, optimizer: Dict[str, Any]) -> Dict[str, Any]:
+    """Attach a result-equivalence check of the rewrite to the optimizer result."""
+    rewrite, reason = _comparable_rewrite(query, optimizer)
+    if rewrite is None:
+        verification = {"status": "skipped", "reason": reason}
+    else:
+        verification = await db_client.verify_equivalent(query, rewrite)
+    return {**optimizer, "verification": verification}
+
+
+async def _what_if_indexes(db_client, query: str, advisor: Dict[str, Any]) -> Dict[str, Any]:
+    """Attach shadow-schema measurements of the recommended indexes to the schema advice."""
+    indexes = advisor.get("details", {}).get("recommended_indexes") or []
+    if advisor.get("status") != "success" or not indexes:
+        return advisor
+    return {**advisor, "what_if": await db_client.what_if_indexes(query, indexes)}
+
+
+async def _benchmark_rewrite(db_client, query: str, optimizer: Dict[str, Any], runs: int) -> Dict[str, Any]:
+    """Time the original query against the optimizer's rewrite.
+
+    Rewrites that _comparable_rewrite rejects, or that were verified to
+    return different rows, are reported as skipped.
+    """
+    rewrite, reason = _comparable_rewrite(query, optimizer)
+    if rewrite is None:
+        return {"status": "skipped", "reason": reason}
+    if optimizer.get("verification", {}).get("status") == "mismatch":
+        return {"status": "skipped", "reason": "Optimized query returns different rows"}
+    details = optimizer.get("details", {})
+
+    original = await db_client.benchmark(query, runs=runs)
+    if "error" in original:
+        return {"status": "error", "error": f"Original query: {original['error']}", "original": original}
+    rewritten = await db_client.benchmark(rewrite, runs=runs)
+    if "error" in rewritten:
+        return {"status": "error", "error": f"Optimized query: {rewritten['error']}",
+                "original": original, "optimized": rewritten}
+
+    speedup_p50 = original["p50_ms"] / max(rewritten["p50_ms"], 1e-3)
+    speedup_p95 = original["p95_ms"] / max(rewritten["p95_ms"], 1e-3)
+    return {
+        "status": "success",
+        "runs": runs,
+        "original": original,
+        "optimized": rewritten,
+        "speedup_p50": round(speedup_p50, 2),
+        "speedup_p95": round(speedup_p95, 2),
+        "rows_examined_saved": original["rows_examined"] - rewritten["rows_examined"],
+        "estimated_impact": details.get("estimated_impact"),
+        "measured_impact": _measured_impact(speedup_p50),
+    }
+
+
+def build_analysis_stages(db_client, query: str, schema_context: Optional[Dict[str, Any]] = None,
+                          analyze: bool = False, benchmark_runs: int = 0,
+                          verify: bool = False, what_if: bool = False) -> List[Stage]:
+    """Build the /analyze DAG.
+
+    The database stages run concurrently on separate pool connections.
+    Each agent waits only for the inputs its prompt actually uses, so the
+    cost, schema and validator agents overlap with the optimizer. A schema
+    context that was already fetched (for the cache lookup) is reused.
+    With `analyze` SELECTs are also run under ANALYZE FORMAT=JSON and the
+    measured plan replaces the cost agent's estimate. With `benchmark_runs`
+    the optimizer's rewrite is timed against the original afterwards; with
+    `verify` its result set is first checked against the original's.
+    With `what_if` the schema advisor's indexes are tried on shadow copies.
+    In fused mode (LLM_FUSED_AGENTS) one LLM call answers for all four
+    agents; each agent makes its own call only if its section is missing.
+    Each agent's model comes from route_model(); trivial queries skip the
+    LLM, and the decision is kept under the agent result's `routing`.
+    """
+    is_select = _is_select(query)
+    fused_deps = ("fused",) if Config.LLM_FUSED_AGENTS else ()
+    with_plan = is_select and Config.PLAN_TREE_ENABLED
+    prefetched_schema = schema_context
+
+    async def schema_context():
+        if prefetched_schema is not None:
+            return prefetched_schema
+        return await db_client.get_schema_context(query)
+
+    async def explain_plan():
+        return await db_client.explain(query) if is_select else {}
+
+    async def plan_tree():
+        return plan_report(await db_client.explain_json(
+            query, analyze=analyze, max_statement_time=Config.ANALYZE_MAX_STATEMENT_TIME))
+
+    async def sample_rows():
+        return await db_client.fetch_sample_rows(query) if is_select else {}
+
+    async def fused(schema, explain, rows):
+        if not llm_enabled():
+            return {}
+        decision = route_model("fused", query, explain)
+        sections = await analyze_fused(query, schema, explain, rows, model=decision.model)
+        return {agent: _routed(section, decision) for agent, section in sections.items()}
+
+    async def optimizer(schema, explain, rows, fused=None):
+        decision = route_model("query_optimizer", query, explain)
+        if decision.tier == "skip":
+            return _routed(rule_based_optimizer(query, evaluate_explain(explain, query), "simple_query"), decision)
+        if fused and "query_optimizer" in fused:
+            return fused["query_optimizer"]
+        return _routed(await _with_rule_fallback(
+            "query_optimizer", lambda: optimize_query(query, schema, explain, rows, model=decision.model),
+            query, explain, lambda evaluation, reason: rule_based_optimizer(query, evaluation, reason),
+            Config.OPTIMIZER_TIMEOUT), decision)
+
+    async def cost(explain, fused=None):
+        decision = route_model("cost_advisor", query, explain)
+        if decision.tier == "skip":
+            return _routed(rule_based_cost(evaluate_explain(explain, query), "simple_query"), decision)
+        if fused and "cost_advisor" in fused:
+            return fused["cost_advisor"]
+        return _routed(await _with_rule_fallback(
+            "cost_advisor", lambda: estimate_cost(query, explain, model=decision.model), query, explain,
+            rule_based_cost, Config.COST_ADVISOR_TIMEOUT), decision)
+
+    async def schema_advisor(schema, fused=None):
+        if fused and "schema_advisor" in fused:
+            return fused["schema_advisor"]
+        # Waiting for EXPLAIN would delay this agent, so it is routed on the parse alone
+        decision = route_model("schema_advisor", query)
+        return _routed(await advise_schema(query, schema, model=decision.model), decision)
+
+    async def data_validator(rows, fused=None):
+        decision = route_model("data_validator", query, sample_rows=rows)
+        if decision.tier == "skip":
+            return _routed({**validator_result(query, {"issues": [], "confidence": "low",
+                                                       "reasoning": "No sample rows to validate"}),
+                            "source": "rules"}, decision)
+        if fused and "data_validator" in fused:
+            return fused["data_validator"]
+        return _routed(await validate_query(query, rows, model=decision.model), decision)
+
+    async def measured_cost(cost, plan):
+        return _with_measured_cost(cost, plan)
+
+    async def verified_optimizer(optimizer):
+        return await _verify_rewrite(db_client, query, optimizer)
+
+    async def evaluated_schema_advisor(advisor):
+        return await _what_if_indexes(db_client, query, advisor)
+
+    async def benchmark(optimizer):
+        return await _benchmark_rewrite(db_client, query, optimizer, benchmark_runs)
+
+    stages = [
+        Stage("schema_context", schema_context),
+        Stage("explain_plan", explain_plan),
+        Stage("sample_rows", sample_rows),
+        # Optimizer and cost apply their own timeouts so they can fall back to the EXPLAIN rules
+        Stage("optimizer", optimizer,
+              deps=("schema_context", "explain_plan", "sample_rows") + fused_deps,
+              on_error=agent_error("query_optimizer")),
+        Stage("cost", cost,
+              deps=("explain_plan",) + fused_deps,
+              on_error=agent_error("cost_advisor")),
+        Stage("schema_advisor", schema_advisor,
+              deps=("schema_context",) + fused_deps,
+              timeout=Config.SCHEMA_ADVISOR_TIMEOUT,
+              on_error=agent_error("schema_advisor")),
+        Stage("data_validator", data_validator,
+              deps=("sample_rows",) + fused_deps,
+              timeout=Config.DATA_VALIDATOR_TIMEOUT,
+              on_error=agent_error("data_validator")),
+    ]
+    if fused_deps:
+        # A failed or timed-out fused call leaves every agent to make its own call
+        stages.append(Stage("fused", fused, deps=("schema_context", "explain_plan", "sample_rows"),
+                            timeout=Config.FUSED_TIMEOUT, on_error=lambda message: {}))
+    if with_plan:
+        stages.append(Stage("plan_tree", plan_tree))
+        if analyze:
+            stages.append(Stage("measured_cost", measured_cost, deps=("cost", "plan_tree"),
+                                on_error=agent_error("cost_advisor")))
+    optimizer_stage = "optimizer"
+    if is_select and verify:
+        # Runs before the benchmark so the two don't compete for the server
+        optimizer_stage = "verified_optimizer"
+        stages.append(Stage("verified_optimizer", verified_optimizer, deps=("optimizer",),
+                            on_error=agent_error("query_optimizer")))
+    if is_select and what_if:
+        stages.append(Stage("evaluated_schema_advisor", evaluated_schema_advisor, deps=("schema_advisor",),
+                            timeout=Config.WHATIF_TIMEOUT, on_error=agent_error("schema_advisor")))
+    if is_select and benchmark_runs > 0:
+        stages.append(Stage("benchmark", benchmark, deps=(optimizer_stage,), timeout=Config.BENCHMARK_TIMEOUT))
+    return stages
+
+
+def _agents_succeeded(results: Dict[str, Any]) -> bool:
+    """True when every agent answered as routed; rule fallbacks aren't cached.
+
+    Rule answers the model router chose for a simple query are not fallbacks.
+    """
+    return all(results[name].get("status") != "error"
+               and (results[name].get("source") != "rules" or (results[name].get("routing") or {}).get("tier") == "skip")
+               for name in ("optimizer", "cost", "schema_advisor", "data_validator"))
+
+
+async def run_analysis(db_client, query: str, database: str, bypass_cache: bool = False,
+                       on_stage_complete: Optional[Callable[[str, Any], Awaitable[None]]] = None,
+                       schema_context: Optional[Dict[str, Any]] = None,
+                       schema_version_token: Optional[str] = None,
+                       analyze: bool = False,
+                       benchmark_runs: int = 0,
+                       verify: bool = False,
+                       what_if: bool = False) -> Dict[str, Any]:
+    """Run the full analysis DAG and format the result for the API.
+
+    Complete responses are cached by (database identity, SQL fingerprint,
+    schema version). A hit costs one schema lookup and is marked under
+    `cache` with the age of the entry and the query it was computed for.
+    `on_stage_complete` is passed through to the StageExecutor. Callers that
+    already hold a schema context (batch analysis) pass it, with its version
+    token, to skip the lookup. `analyze` runs ANALYZE FORMAT=JSON, which
+    executes the query; such results are cached separately. `benchmark_runs`
+    times the optimized query against the original and always skips the
+    cache, since the point is a fresh measurement. `verify` checks that the
+    rewrite returns the same rows, under `optimization.verification`;
+    `what_if` measures recommended indexes under `schema_improvements.what_if`.
+    """
+    use_cache = Config.ANALYSIS_CACHE_ENABLED and not bypass_cache and not benchmark_runs
+    key = None
+    if use_cache:
+        if schema_context is None:
+            schema_context = await db_client.get_schema_context(query)
+            schema_version_token = getattr(db_client, "schema_version", None)
+        if not (isinstance(schema_context, dict) and "error" in schema_context):
+            identity = database_identity(db_client.host, db_client.port, db_client.user, db_client.database,
+                                         ssh=getattr(db_client, "ssh", None))
+            version = schema_version_token or schema_version(schema_context)
+            key = (identity, fingerprint(query), version, analyze, verify, what_if)
+            cached = analysis_cache.get(key)
+            if cached is not None:
+                age, response = cached
+                source_query = response.get("original_query")
+                response["original_query"] = query
+                response["cache"] = {
+                    "hit": True,
+                    "age_seconds": round(age, 1),
+                    "source_query": source_query,
+                }
+                logger.info(f"Analysis cache hit ({key[1][:12]}, age {age:.0f}s)")
+                return response
+
+    token = llm_bypass_cache.set(bypass_cache)
+    try:
+        executor = StageExecutor(build_analysis_stages(db_client, query, schema_context, analyze,
+                                                       benchmark_runs, verify, what_if),
+                                 on_stage_complete=on_stage_complete)
+        results = await executor.run()
+    finally:
+        llm_bypass_cache.reset(token)
+    response = ResponseFormatter.format_analysis(
+        query,
+        results["schema_context"],
+        results["explain_plan"],
+        results["sample_rows"],
+        results.get("verified_optimizer", results["optimizer"]),
+        results.get("measured_cost", results["cost"]),
+        results.get("evaluated_schema_advisor", results["schema_advisor"]),
+        results["data_validator"],
+        database,
+    )
+    response["technical_details"]["explain_findings"] = evaluate_explain(results["explain_plan"], query)
+    response["technical_details"]["query_structure"] = parse_sql(query).to_dict()
+    if "plan_tree" in results:
+        response["technical_details"]["plan_tree"] = results["plan_tree"]
+    if "fused" in results:
+        response["technical_details"]["fused_agents"] = sorted(results["fused"])
+    response["technical_details"]["model_routing"] = {
+        agent: results[stage].get("routing")
+        for agent, stage in (("query_optimizer", "optimizer"), ("cost_advisor", "cost"),
+                             ("schema_advisor", "schema_advisor"), ("data_validator", "data_validator"))
+        if isinstance(results[stage], dict) and results[stage].get("routing")}
+    if "benchmark" in results:
+        response["benchmark"] = results["benchmark"]
+    if key is not None and _agents_succeeded(results):
+        analysis_cache.set(key, response)
+    response["cache"] = {"hit": False}
+    return response
+
+
+async def stream_analysis(db_client, query: str, database: str,
+                          bypass_cache: bool = False,
+                          analyze: bool = False,
+                          benchmark_runs: int = 0,
+                          verify: bool = False,
+                          what_if: bool = False) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+    """Yield (event, sections) as each stage finishes, then ("complete", response).
+
+    Database stages arrive after one round trip; each agent section follows
+    as soon as that agent is done. A cache hit yields only "complete".
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+
+    async def on_stage_complete(name: str, result: Any):
+        sections = ResponseFormatter.format_stage(name, result)
+        # Stages without a section of their own (fused) send no event
+        if sections:
+            await queue.put((name, sections))
+
+    task = asyncio.ensure_future(run_analysis(db_client, query, database, bypass_cache, on_stage_complete,
+                                            analyze=analyze, benchmark_runs=benchmark_runs,
+                                            verify=verify, what_if=what_if))
+    task.add_done_callback(lambda _: queue.put_nowait(None))
+    try:
+        while True:
+            item = await queue.get()
+            if item is None:
+                break
+            yield item
+        yield "complete", task.result()
+    finally:
+        if not task.done():
+            task.cancel()
@@ -0,0 +1,97 @@
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Dict, List
+
+from utils.analysis_pipeline import run_analysis
+from utils.config import Config
+from utils.explain_rules import explain_rows_product
+from utils.sql_fingerprint import fingerprint
+
+logger = logging.getLogger(__name__)
+
+_COST_RANK = {"high": 3, "medium": 2, "low": 1}
+
+
+def _rank_entry(item: Dict[str, Any]) -> Dict[str, Any]:
+    analysis = item["analysis"]
+    technical = analysis.get("technical_details", {})
+    return {
+        "fingerprint": item["fingerprint"],
+        "query": item["query"],
+        "occurrences": item["occurrences"],
+        "explain_rows": explain_rows_product(technical.get("explain_plan")),
+        "estimated_cost": analysis.get("cost_analysis", {}).get("estimated_cost", "unknown"),
+        "performance_impact": analysis.get("summary", {}).get("performance_impact", "unknown"),
+    }
+
+
+def _rank_key(entry: Dict[str, Any]):
+    return (entry["explain_rows"] * entry["occurrences"],
+            _COST_RANK.get(entry["estimated_cost"], 0),
+            entry["occurrences"])
+
+
+async def run_batch(db_client, queries: List[str], database: str, bypass_cache: bool = False,
+                    concurrency: int = Config.BATCH_CONCURRENCY) -> AsyncIterator[Dict[str, Any]]:
+    """Analyze a workload, yielding one result per distinct query shape.
+
+    Queries are grouped by SQL fingerprint so each shape is analyzed once,
+    using its first occurrence as the representative. Schema metadata for
+    every referenced table is read in a single snapshot up front. Results
+    are yielded as they finish; the last item is a summary ranking the
+    shapes by EXPLAIN row estimate weighted by how often they occur.
+    """
+    groups: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+    for index, query in enumerate(queries):
+        group = groups.setdefault(fingerprint(query), {"query": query, "indexes": []})
+        group["indexes"].append(index)
+
+    snapshot = await db_client.get_schema_snapshot([g["query"] for g in groups.values()])
+    if isinstance(snapshot, dict) and "error" in snapshot:
+        logger.warning(f"Batch schema snapshot failed, falling back to per-query lookups: {snapshot['error']}")
+        snapshot = None
+
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def analyze(fp: str, group: Dict[str, Any]) -> Dict[str, Any]:
+        async with semaphore:
+            context, token = (None, None)
+            if snapshot is not None:
+                context, token = db_client.schema_context_from_snapshot(group["query"], snapshot)
+            try:
+                analysis = await run_analysis(db_client, group["query"], database, bypass_cache,
+                                              schema_context=context, schema_version_token=token)
+            except Exception as e:
+                logger.exception(f"Batch analysis failed for {fp[:12]}: {e}")
+                analysis = {"status": "error", "error": str(e)}
+        return {
+            "type": "result",
+            "index": group["indexes"][0],
+            "indexes": group["indexes"],
+            "occurrences": len(group["indexes"]),
+            "fingerprint": fp,
+            "query": group["query"],
+            "analysis": analysis,
+        }
+
+    tasks = [asyncio.ensure_future(analyze(fp, group)) for fp, group in groups.items()]
+    ranked = []
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            item = await next_done
+            if item["analysis"].get("status") == "success":
+                ranked.append(_rank_entry(item))
+            yield item
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+
+    ranked.sort(key=_rank_key, reverse=True)
+    yield {
+        "type": "summary",
+        "total_queries": len(queries),
+        "unique_queries": len(groups),
+        "ranked": ranked[:Config.BATCH_SUMMARY_TOP],
+    }
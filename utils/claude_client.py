@@ -1,15 +1,193 @@
 import json
+import random
 import re
+import time
 import logging
 import asyncio
 import httpx
+from email.utils import parsedate_to_datetime
+from typing import Any, Dict, Optional
 from utils.config import Config
-
-GROQ_API_KEY = Config.GROQ_API_KEY
+from utils.llm_cache import llm_cache, cache_key, bypass_cache
+from utils.llm_providers import LLMEndpoint, llm_providers
+from utils.prompt_context import estimate_tokens
 
 logger = logging.getLogger(__name__)
 
-GROQ_URL = "https://api.groq.com/openai/v1/chat/completions"
+# Shared client, created in the FastAPI lifespan so every agent call reuses
+# pooled keep-alive connections instead of paying a TLS handshake each time.
+_http_client: Optional[httpx.AsyncClient] = None
+
+_hedge_stats = {"sent": 0, "won": 0}
+
+_http_stats = {
+    "requests": 0,
+    "new_connections": 0,
+    "connect_ms_total": 0.0,
+    "tls_ms_total": 0.0,
+    "model_ms_total": 0.0,
+    "total_ms_total": 0.0,
+}
+
+
+def _build_http_client() -> httpx.AsyncClient:
+    http2 = Config.LLM_HTTP2
+    if http2:
+        try:
+            import h2  # noqa: F401
+        except ImportError:
+            logger.warning("LLM_HTTP2 is set but the 'h2' package is not installed; using HTTP/1.1")
+            http2 = False
+    return httpx.AsyncClient(
+        timeout=httpx.Timeout(Config.LLM_HTTP_TIMEOUT, connect=Config.LLM_HTTP_CONNECT_TIMEOUT),
+        limits=httpx.Limits(
+            max_connections=Config.LLM_HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=Config.LLM_HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=Config.LLM_HTTP_KEEPALIVE_EXPIRY,
+        ),
+        http2=http2,
+    )
+
+
+async def init_http_client():
+    """Create the shared LLM HTTP client. Called from the app lifespan."""
+    global _http_client
+    if _http_client is None:
+        _http_client = _build_http_client()
+        logger.info("Shared LLM HTTP client created")
+
+
+async def close_http_client():
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+        logger.info("Shared LLM HTTP client closed")
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Return the shared client, creating it lazily for scripts outside the app."""
+    global _http_client
+    if _http_client is None:
+        _http_client = _build_http_client()
+    return _http_client
+
+
+def _trace_recorder(events: Dict[str, float]):
+    async def trace(event_name: str, info: Dict[str, Any]):
+        events[event_name] = time.perf_counter()
+    return trace
+
+
+def _span_ms(events: Dict[str, float], name: str) -> float:
+    """Duration of a traced phase, e.g. 'connection.connect_tcp', in ms."""
+    started = events.get(f"{name}.started")
+    complete = events.get(f"{name}.complete")
+    if started is None or complete is None:
+        return 0.0
+    return (complete - started) * 1000
+
+
+def _record_timing(events: Dict[str, float], started: float) -> Dict[str, float]:
+    """Split a request into connect, TLS and model (server wait) time."""
+    connect_ms = _span_ms(events, "connection.connect_tcp")
+    tls_ms = _span_ms(events, "connection.start_tls")
+    model_ms = _span_ms(events, "http11.receive_response_headers") or _span_ms(events, "http2.receive_response_headers")
+    timing = {
+        "connect_ms": round(connect_ms, 1),
+        "tls_ms": round(tls_ms, 1),
+        "model_ms": round(model_ms, 1),
+        "total_ms": round((time.perf_counter() - started) * 1000, 1),
+        "reused_connection": "connection.connect_tcp.started" not in events,
+    }
+    _http_stats["requests"] += 1
+    if not timing["reused_connection"]:
+        _http_stats["new_connections"] += 1
+    _http_stats["connect_ms_total"] += connect_ms
+    _http_stats["tls_ms_total"] += tls_ms
+    _http_stats["model_ms_total"] += model_ms
+    _http_stats["total_ms_total"] += timing["total_ms"]
+    return timing
+
+
+def llm_enabled() -> bool:
+    """True when LLM calls are switched on and an endpoint is configured."""
+    return Config.LLM_ENABLED and bool(llm_providers.endpoints)
+
+
+def http_stats() -> Dict[str, Any]:
+    """Cumulative connect/TLS vs model time for LLM calls since startup."""
+    n = _http_stats["requests"] or 1
+    return {
+        "requests": _http_stats["requests"],
+        "new_connections": _http_stats["new_connections"],
+        "reused_connections": _http_stats["requests"] - _http_stats["new_connections"],
+        "avg_connect_ms": round(_http_stats["connect_ms_total"] / n, 1),
+        "avg_tls_ms": round(_http_stats["tls_ms_total"] / n, 1),
+        "avg_model_ms": round(_http_stats["model_ms_total"] / n, 1),
+        "avg_total_ms": round(_http_stats["total_ms_total"] / n, 1),
+        "http2": bool(_http_client is not None and Config.LLM_HTTP2),
+        "hedged_requests": _hedge_stats["sent"],
+        "hedges_won": _hedge_stats["won"],
+    }
+
+def _retry_after(response: httpx.Response) -> Optional[float]:
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP-date)."""
+    value = response.headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+async def _post(client: httpx.AsyncClient, endpoint: LLMEndpoint, payload: Dict[str, Any], timeout: float):
+    events: Dict[str, float] = {}
+    started = time.perf_counter()
+    r = await client.post(endpoint.url, headers=endpoint.headers(), json=payload,
+                          timeout=httpx.Timeout(timeout, connect=Config.LLM_HTTP_CONNECT_TIMEOUT),
+                          extensions={"trace": _trace_recorder(events)})
+    return r, _record_timing(events, started)
+
+
+async def _post_hedged(client: httpx.AsyncClient, endpoint: LLMEndpoint, payload: Dict[str, Any],
+                       model: str, timeout: float):
+    """POST, sending a duplicate if no reply arrives within the model's p95 latency.
+
+    The first usable reply (not a network error or 5xx) wins and the other
+    request is cancelled. The hedge needs a spare request token from the
+    endpoint's rate limiter, so it never pushes calls over its RPM.
+    """
+    primary = asyncio.ensure_future(_post(client, endpoint, payload, timeout))
+    delay = endpoint.latency.hedge_delay(model) if Config.LLM_HEDGE_ENABLED else None
+    if delay is None:
+        return await primary
+    hedge = None
+    try:
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+        if done or not endpoint.scheduler.try_admit():
+            return await primary
+        _hedge_stats["sent"] += 1
+        logger.info(f"No reply from {endpoint.name} after {delay:.1f}s (p95), sending hedged request")
+        hedge = asyncio.ensure_future(_post(client, endpoint, payload, timeout))
+        pending = {primary, hedge}
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None and task.result()[0].status_code < 500:
+                    if task is hedge:
+                        _hedge_stats["won"] += 1
+                    return task.result()
+        return task.result()
+    finally:
+        for task in (primary, hedge):
+            if task is not None and not task.done():
+                task.cancel()
+
 
 def _extract_json_from_text(text: str):
     """Extract JSON from Groq's text response."""
@@ -30,103 +208,158 @@ def _extract_json_from_text(text: str):
     except json.JSONDecodeError as e:
         raise ValueError(f"Could not parse JSON from text: {e}")
 
-async def call_claude_raw(prompt: str, model: str = "llama-3.3-70b-versatile", max_tokens: int = 800, temperature: float = 0.7):
-    """Call Groq API and return raw response with retry logic."""
-    if not GROQ_API_KEY:
-        logger.error("GROQ_API_KEY not configured")
-        return {"error": "GROQ_API_KEY not set in environment."}
-    
+def _backoff(attempt: int) -> float:
+    """Jittered exponential delay before retry `attempt` (1-based)."""
+    return Config.LLM_RETRY_BACKOFF * 2 ** (attempt - 1) * random.uniform(0.5, 1.0)
+
+async def call_claude_raw(prompt: str, model: str = "llama-3.3-70b-versatile", max_tokens: int = 800, temperature: float = 0.7,
+                          endpoint: Optional[LLMEndpoint] = None):
+    """Call an OpenAI-compatible endpoint (Groq by default) and return the raw response.
+
+    Without `endpoint` the provider pool picks one. The request timeout
+    adapts to the model's observed p99 latency on that endpoint, a hedged
+    duplicate is sent after its p95 when LLM_HEDGE_ENABLED, and the
+    endpoint's circuit breaker fails fast while it keeps failing.
+    Failures are retried up to LLM_RETRIES times, after a short jittered
+    backoff, while the circuit allows. Half-open probes and retries get the
+    full LLM_HTTP_TIMEOUT, and a timed-out attempt is recorded as a latency
+    sample, so the adaptive timeout can grow back when the provider slows down.
+    """
+    if not Config.LLM_ENABLED:
+        return {"error": "LLM calls are disabled (LLM_ENABLED=false)"}
+    if not llm_providers.endpoints:
+        logger.error("No LLM endpoint configured")
+        return {"error": "GROQ_API_KEY or LLM_ENDPOINTS not set in environment."}
+    endpoint = endpoint or llm_providers.pick()
+    if endpoint is None or not endpoint.breaker.allow():
+        retry_in = min(ep.breaker.retry_in() for ep in llm_providers.endpoints)
+        return {"error": "LLM circuit open - all endpoints unhealthy", "status": 503, "retry_in": round(retry_in, 1)}
+
     payload = {
-        "model": model,
+        "model": endpoint.model_for(model),
         "max_tokens": max_tokens,
         "temperature": temperature,
         "messages": [{"role": "user", "content": prompt}],
     }
-    
-    logger.debug(f"Groq API Request - Model: {model}, Max Tokens: {max_tokens}")
-    logger.debug(f"Payload keys: {list(payload.keys())}")
 
-    headers = {
-        "Authorization": f"Bearer {GROQ_API_KEY}",
-        "Content-Type": "application/json"
-    }
+    logger.debug(f"LLM request to {endpoint.name} - Model: {payload['model']}, Max Tokens: {max_tokens}")
 
-    max_retries = 2
+    breaker = endpoint.breaker
+    probing = breaker.state == "half_open"
     last_error = None
-    
-    for attempt in range(max_retries):
-        try:
-            async with httpx.AsyncClient(timeout=120.0, limits=httpx.Limits(max_connections=5)) as client:
-                logger.debug(f"POST {GROQ_URL} (attempt {attempt + 1}/{max_retries})")
-                r = await client.post(GROQ_URL, headers=headers, json=payload)
+    try:
+        for attempt in range(Config.LLM_RETRIES + 1):
+            if attempt:
+                await asyncio.sleep(_backoff(attempt))
+            timeout = endpoint.latency.max_timeout if probing or attempt else endpoint.latency.timeout(model)
+            try:
+                client = get_http_client()
+                logger.debug(f"POST {endpoint.url} (attempt {attempt + 1}, timeout {timeout:.1f}s)")
+                r, timing = await _post_hedged(client, endpoint, payload, model, timeout)
+                logger.info(f"{endpoint.name} call timing: {timing}")
                 text = r.text
-                
+
                 try:
                     data = r.json()
                 except Exception:
                     data = None
-                
+
                 logger.debug(f"Response Status: {r.status_code}")
-                
+
                 if r.status_code == 400:
-                    logger.error(f"400 Bad Request from Groq: {text}")
+                    logger.error(f"400 Bad Request from {endpoint.name}: {text}")
                     if data:
                         logger.error(f"Error details: {json.dumps(data, indent=2)}")
+                    breaker.release()
                     return {"error": "Bad Request", "status": 400, "body": text}
-                
+
                 if r.status_code == 401:
                     logger.error(f"401 Unauthorized - Invalid or expired API key")
+                    breaker.release()
                     return {"error": "Unauthorized - Check your API key", "status": 401, "body": text}
-                
+
                 if r.status_code == 429:
                     logger.warning(f"429 Rate Limited - Free tier quota exceeded")
-                    return {"error": "Rate limited - Free tier quota exceeded", "status": 429, "body": text}
-                
+                    breaker.release()
+                    return {"error": "Rate limited - Free tier quota exceeded", "status": 429, "body": text,
+                            "retry_after": _retry_after(r)}
+
                 if r.status_code < 200 or r.status_code >= 300:
-                    logger.error(f"Groq returned {r.status_code}: {text}")
-                    last_error = {"error": "Groq request failed", "status": r.status_code, "body": text}
-                    if attempt < max_retries - 1:
-                        logger.info(f"Retrying... (attempt {attempt + 2}/{max_retries})")
-                        await asyncio.sleep(2 ** attempt)
+                    logger.error(f"{endpoint.name} returned {r.status_code}: {text}")
+                    breaker.record_failure()
+                    last_error = {"error": "LLM request failed", "status": r.status_code, "body": text}
+                    if attempt < Config.LLM_RETRIES and breaker.allow():
+                        logger.info(f"Retrying... (attempt {attempt + 2})")
+                        probing = probing or breaker.state == "half_open"
                         continue
                     return last_error
-                
+
+                breaker.record_success()
+                endpoint.record_latency(model, timing["total_ms"] / 1000)
                 if isinstance(data, dict):
                     choices = data.get("choices", [])
                     if isinstance(choices, list) and len(choices) > 0:
                         message = choices[0].get("message", {})
                         text_out = message.get("content", "")
-                        return {"text": text_out, "raw": data}
-                
-                return {"text": str(data) if data is not None else text, "raw": data}
-                
-        except (httpx.TimeoutException, httpx.ConnectError, httpx.ReadError) as e:
-            last_error = str(e)
-            logger.warning(f"Network error on attempt {attempt + 1}/{max_retries}: {type(e).__name__}: {e}")
-            if attempt < max_retries - 1:
-                wait_time = 2 ** attempt
-                logger.info(f"Waiting {wait_time}s before retry...")
-                await asyncio.sleep(wait_time)
-                continue
-            else:
-                logger.error(f"All retries failed. Last error: {last_error}")
-                return {"error": "Network timeout - Groq API unavailable", "details": str(last_error)}
-        except Exception as e:
-            logger.exception(f"Exception calling Groq API: {e}")
-            return {"error": "Request failed", "details": str(e)}
-    
+                        return {"text": text_out, "raw": data, "timing": timing}
+
+                return {"text": str(data) if data is not None else text, "raw": data, "timing": timing}
+
+            except (httpx.TimeoutException, httpx.ConnectError, httpx.ReadError) as e:
+                last_error = str(e)
+                logger.warning(f"Network error on attempt {attempt + 1}: {type(e).__name__}: {e}")
+                if isinstance(e, httpx.TimeoutException) and not isinstance(e, httpx.ConnectTimeout):
+                    # The call took at least this long; without the sample the p99 could never grow back
+                    endpoint.record_latency(model, timeout)
+                breaker.record_failure()
+                if attempt < Config.LLM_RETRIES and breaker.allow():
+                    probing = probing or breaker.state == "half_open"
+                    continue
+                logger.error(f"LLM call failed. Last error: {last_error}")
+                return {"error": f"Network timeout - {endpoint.name} unavailable", "details": str(last_error)}
+            except Exception as e:
+                logger.exception(f"Exception calling {endpoint.name}: {e}")
+                return {"error": "Request failed", "details": str(e)}
+    finally:
+        # A cancelled or otherwise unresolved half-open probe must not block the next one
+        if breaker.state == "half_open":
+            breaker.release()
+
     return {"error": "Failed after retries", "details": str(last_error)}
 
-async def call_claude_json(prompt: str, model: str = "llama-3.3-70b-versatile", max_tokens: int = 1200, temperature: float = 0.1):
-    """Call Groq and parse JSON response."""
-    raw_response = await call_claude_raw(prompt, model, max_tokens, temperature)
+async def call_claude_json(prompt: str, model: str = "llama-3.3-70b-versatile", max_tokens: int = 1200, temperature: float = 0.1, agent: Optional[str] = None):
+    """Call the LLM and parse JSON response.
+
+    Successful parses are cached by (model, temperature, max_tokens, prompt)
+    with the TTL configured for `agent`, unless the request set bypass_cache.
+    The call itself goes through the provider pool: it is routed to an
+    endpoint, waits for that endpoint's RPM/TPM budget, fails over on
+    errors another endpoint may not have, and shares one request with
+    identical calls in flight.
+    """
+    use_cache = Config.LLM_CACHE_ENABLED and not bypass_cache.get()
+    key = cache_key(model, temperature, max_tokens, prompt)
+    if use_cache:
+        cached = await llm_cache.get(key)
+        if cached is not None:
+            logger.debug(f"LLM cache hit for {agent or 'agent'} ({key[:12]})")
+            return cached
+
+    if llm_enabled():
+        raw_response = await llm_providers.run(
+            key, estimate_tokens(prompt) + max_tokens,
+            lambda endpoint: call_claude_raw(prompt, model, max_tokens, temperature, endpoint=endpoint))
+    else:
+        raw_response = await call_claude_raw(prompt, model, max_tokens, temperature)
     
     if "error" in raw_response:
-        return {"error": raw_response["error"], "raw": raw_response.get("raw")}
+        return {"error": raw_response["error"], "status": raw_response.get("status"), "raw": raw_response.get("raw")}
     
     text = raw_response.get("text", "")
     try:
         parsed = _extract_json_from_text(text)
+        if use_cache and isinstance(parsed, dict):
+            await llm_cache.set(key, parsed, llm_cache.ttl_for(agent))
         return parsed
     except Exception as e:
         logger.warning("Failed to parse JSON from Groq output: %s", e)
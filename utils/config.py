@@ -18,4 +18,158 @@ class Config:
     
     # Groq API
     GROQ_API_KEY = os.getenv("GROQ_API_KEY")
+    # Set to false to answer the optimizer and cost sections from local EXPLAIN rules only
+    LLM_ENABLED = os.getenv("LLM_ENABLED", "true").lower() in ("1", "true", "yes")
 
+    # Per-agent timeouts (seconds) for the /analyze stage executor
+    OPTIMIZER_TIMEOUT = float(os.getenv("OPTIMIZER_TIMEOUT", 90))
+    COST_ADVISOR_TIMEOUT = float(os.getenv("COST_ADVISOR_TIMEOUT", 60))
+    SCHEMA_ADVISOR_TIMEOUT = float(os.getenv("SCHEMA_ADVISOR_TIMEOUT", 60))
+    DATA_VALIDATOR_TIMEOUT = float(os.getenv("DATA_VALIDATOR_TIMEOUT", 45))
+    # One LLM call for all four agents (agents/fused.py), falling back to separate calls
+    LLM_FUSED_AGENTS = os.getenv("LLM_FUSED_AGENTS", "false").lower() in ("1", "true", "yes")
+    FUSED_TIMEOUT = float(os.getenv("FUSED_TIMEOUT", 90))
+
+    # Shared MariaDB pool registry
+    DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", 1))
+    DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", 10))
+    DB_POOL_MAX_POOLS = int(os.getenv("DB_POOL_MAX_POOLS", 32))
+    DB_POOL_IDLE_TTL = float(os.getenv("DB_POOL_IDLE_TTL", 300))
+    DB_POOL_PING_INTERVAL = float(os.getenv("DB_POOL_PING_INTERVAL", 30))
+    DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 3600))
+
+    # Comma-separated emails allowed to see server-wide stats (pools, tunnels)
+    ADMIN_EMAILS = {e.strip().lower() for e in os.getenv("ADMIN_EMAILS", "").split(",") if e.strip()}
+
+    # Shared SSH tunnels
+    SSH_TUNNEL_IDLE_TTL = float(os.getenv("SSH_TUNNEL_IDLE_TTL", 600))
+    SSH_TUNNEL_KEEPALIVE = float(os.getenv("SSH_TUNNEL_KEEPALIVE", 30))
+
+    # Shared LLM HTTP client
+    LLM_HTTP_TIMEOUT = float(os.getenv("LLM_HTTP_TIMEOUT", 120))
+    LLM_HTTP_CONNECT_TIMEOUT = float(os.getenv("LLM_HTTP_CONNECT_TIMEOUT", 10))
+    LLM_HTTP_MAX_CONNECTIONS = int(os.getenv("LLM_HTTP_MAX_CONNECTIONS", 20))
+    LLM_HTTP_MAX_KEEPALIVE = int(os.getenv("LLM_HTTP_MAX_KEEPALIVE", 10))
+    LLM_HTTP_KEEPALIVE_EXPIRY = float(os.getenv("LLM_HTTP_KEEPALIVE_EXPIRY", 60))
+    LLM_HTTP2 = os.getenv("LLM_HTTP2", "false").lower() in ("1", "true", "yes")
+
+    # OpenAI-compatible LLM endpoints (utils/llm_providers.py): a JSON list of
+    # {"name", "url", "api_key" or "api_key_env", "rpm", "tpm", "models"}; defaults to Groq with GROQ_API_KEY
+    LLM_ENDPOINTS = os.getenv("LLM_ENDPOINTS", "")
+    LLM_BALANCE_STRATEGY = os.getenv("LLM_BALANCE_STRATEGY", "least_outstanding")
+
+    # Client-side LLM admission (utils/llm_scheduler.py), per endpoint, sized to the provider's limits
+    LLM_RPM = float(os.getenv("LLM_RPM", 30))
+    LLM_TPM = float(os.getenv("LLM_TPM", 12000))
+    LLM_RATE_LIMIT_RETRIES = int(os.getenv("LLM_RATE_LIMIT_RETRIES", 3))
+    LLM_RETRY_AFTER_DEFAULT = float(os.getenv("LLM_RETRY_AFTER_DEFAULT", 5))
+
+    # Adaptive LLM timeouts (p99 x factor once warmed up), hedged requests and circuit breaker
+    LLM_LATENCY_WINDOW = int(os.getenv("LLM_LATENCY_WINDOW", 200))
+    LLM_LATENCY_MIN_SAMPLES = int(os.getenv("LLM_LATENCY_MIN_SAMPLES", 20))
+    LLM_TIMEOUT_P99_FACTOR = float(os.getenv("LLM_TIMEOUT_P99_FACTOR", 2.0))
+    LLM_TIMEOUT_MIN = float(os.getenv("LLM_TIMEOUT_MIN", 10))
+    LLM_HEDGE_ENABLED = os.getenv("LLM_HEDGE_ENABLED", "false").lower() in ("1", "true", "yes")
+    LLM_HEDGE_MIN_DELAY = float(os.getenv("LLM_HEDGE_MIN_DELAY", 1.0))
+    LLM_RETRIES = int(os.getenv("LLM_RETRIES", 1))
+    LLM_RETRY_BACKOFF = float(os.getenv("LLM_RETRY_BACKOFF", 0.5))
+    LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", 5))
+    LLM_BREAKER_COOLDOWN = float(os.getenv("LLM_BREAKER_COOLDOWN", 30))
+
+    # LLM response cache (TTLs in seconds; LLM_CACHE_DIR enables the disk tier)
+    LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+    LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", 32 * 1024 * 1024))
+    LLM_CACHE_DIR = os.getenv("LLM_CACHE_DIR", "")
+    LLM_CACHE_DISK_MAX_BYTES = int(os.getenv("LLM_CACHE_DISK_MAX_BYTES", 512 * 1024 * 1024))
+    LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", 3600))
+    LLM_CACHE_TTL_OPTIMIZER = float(os.getenv("LLM_CACHE_TTL_OPTIMIZER", 24 * 3600))
+    LLM_CACHE_TTL_COST = float(os.getenv("LLM_CACHE_TTL_COST", 6 * 3600))
+    LLM_CACHE_TTL_SCHEMA = float(os.getenv("LLM_CACHE_TTL_SCHEMA", 24 * 3600))
+    LLM_CACHE_TTL_VALIDATOR = float(os.getenv("LLM_CACHE_TTL_VALIDATOR", 600))
+
+    # Whole-analysis cache keyed by SQL fingerprint
+    ANALYSIS_CACHE_ENABLED = os.getenv("ANALYSIS_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+    ANALYSIS_CACHE_MAX_ENTRIES = int(os.getenv("ANALYSIS_CACHE_MAX_ENTRIES", 2000))
+    ANALYSIS_CACHE_TTL = float(os.getenv("ANALYSIS_CACHE_TTL", 1800))
+
+    # Versioned schema metadata cache
+    SCHEMA_CACHE_MAX_DATABASES = int(os.getenv("SCHEMA_CACHE_MAX_DATABASES", 64))
+    SCHEMA_CACHE_MAX_AGE = float(os.getenv("SCHEMA_CACHE_MAX_AGE", 6 * 3600))
+
+    # Background analysis jobs
+    JOB_WORKERS = int(os.getenv("JOB_WORKERS", 4))
+    JOB_QUEUE_MAX = int(os.getenv("JOB_QUEUE_MAX", 100))
+    JOB_RETENTION = float(os.getenv("JOB_RETENTION", 3600))
+
+    # Batch workload analysis
+    BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", 4))
+    BATCH_MAX_QUERIES = int(os.getenv("BATCH_MAX_QUERIES", 500))
+    BATCH_SUMMARY_TOP = int(os.getenv("BATCH_SUMMARY_TOP", 10))
+
+    # Slow/general query log ingestion
+    SLOW_LOG_DIR = os.getenv("SLOW_LOG_DIR", "")
+    SLOW_LOG_TOP = int(os.getenv("SLOW_LOG_TOP", 10))
+    SLOW_LOG_MAX_DIGESTS = int(os.getenv("SLOW_LOG_MAX_DIGESTS", 10000))
+    SLOW_LOG_MAX_QUERY_BYTES = int(os.getenv("SLOW_LOG_MAX_QUERY_BYTES", 16384))
+
+    # performance_schema digest monitors
+    DIGEST_INTERVAL = float(os.getenv("DIGEST_INTERVAL", 300))
+    DIGEST_MIN_INTERVAL = float(os.getenv("DIGEST_MIN_INTERVAL", 10))
+    DIGEST_RETENTION = int(os.getenv("DIGEST_RETENTION", 288))
+    DIGEST_TOP = int(os.getenv("DIGEST_TOP", 10))
+    DIGEST_REANALYZE_AFTER = float(os.getenv("DIGEST_REANALYZE_AFTER", 3600))
+    DIGEST_MAX_MONITORS = int(os.getenv("DIGEST_MAX_MONITORS", 16))
+
+    # Local EXPLAIN rule engine thresholds
+    EXPLAIN_LARGE_ROWS = int(os.getenv("EXPLAIN_LARGE_ROWS", 10000))
+    EXPLAIN_ROWS_PRODUCT_LIMIT = int(os.getenv("EXPLAIN_ROWS_PRODUCT_LIMIT", 1000000))
+
+    # Memoized SQL parses (utils/sql_parser.py)
+    SQL_PARSE_CACHE_SIZE = int(os.getenv("SQL_PARSE_CACHE_SIZE", 4096))
+
+    # EXPLAIN/ANALYZE FORMAT=JSON plan trees; ANALYZE runs the query, so only when run_analyze is set
+    PLAN_TREE_ENABLED = os.getenv("PLAN_TREE_ENABLED", "true").lower() in ("1", "true", "yes")
+    ANALYZE_MAX_STATEMENT_TIME = float(os.getenv("ANALYZE_MAX_STATEMENT_TIME", 10))
+
+    # Opt-in original vs optimized query benchmark
+    BENCHMARK_RUNS = int(os.getenv("BENCHMARK_RUNS", 5))
+    BENCHMARK_MAX_RUNS = int(os.getenv("BENCHMARK_MAX_RUNS", 50))
+    BENCHMARK_WARMUP = int(os.getenv("BENCHMARK_WARMUP", 1))
+    BENCHMARK_MAX_STATEMENT_TIME = float(os.getenv("BENCHMARK_MAX_STATEMENT_TIME", 10))
+    BENCHMARK_FETCH_SIZE = int(os.getenv("BENCHMARK_FETCH_SIZE", 1000))
+    BENCHMARK_TIMEOUT = float(os.getenv("BENCHMARK_TIMEOUT", 300))
+
+    # Result-equivalence check for optimized queries
+    VERIFY_MAX_ROWS = int(os.getenv("VERIFY_MAX_ROWS", 1000000))
+    VERIFY_TIME_BUDGET = float(os.getenv("VERIFY_TIME_BUDGET", 60))
+    VERIFY_BUCKETS = int(os.getenv("VERIFY_BUCKETS", 256))
+    VERIFY_SAMPLE_ROWS = int(os.getenv("VERIFY_SAMPLE_ROWS", 5))
+    VERIFY_FETCH_SIZE = int(os.getenv("VERIFY_FETCH_SIZE", 1000))
+
+    # What-if index evaluation on sampled shadow copies of the queried tables
+    WHATIF_SCHEMA_PREFIX = os.getenv("WHATIF_SCHEMA_PREFIX", "whatif_")
+    WHATIF_SAMPLE_ROWS = int(os.getenv("WHATIF_SAMPLE_ROWS", 10000))
+    WHATIF_SAMPLE_RANGES = int(os.getenv("WHATIF_SAMPLE_RANGES", 10))
+    WHATIF_REFRESH_AFTER = float(os.getenv("WHATIF_REFRESH_AFTER", 3600))
+    WHATIF_STATEMENT_TIME = float(os.getenv("WHATIF_STATEMENT_TIME", 30))
+    WHATIF_MAX_INDEXES = int(os.getenv("WHATIF_MAX_INDEXES", 5))
+    WHATIF_TIMEOUT = float(os.getenv("WHATIF_TIMEOUT", 300))
+
+    # Complexity-based model routing per agent (utils/model_router.py)
+    MODEL_ROUTING_ENABLED = os.getenv("MODEL_ROUTING_ENABLED", "true").lower() in ("1", "true", "yes")
+    LLM_MODEL_LARGE = os.getenv("LLM_MODEL_LARGE", "llama-3.3-70b-versatile")
+    LLM_MODEL_SMALL = os.getenv("LLM_MODEL_SMALL", "llama-3.1-8b-instant")
+    ROUTER_SKIP_MAX_SCORE = int(os.getenv("ROUTER_SKIP_MAX_SCORE", 0))
+    ROUTER_SMALL_MAX_SCORE = int(os.getenv("ROUTER_SMALL_MAX_SCORE", 3))
+    ROUTER_VALIDATOR_SMALL_ROWS = int(os.getenv("ROUTER_VALIDATOR_SMALL_ROWS", 20))
+
+    # Prompt context compaction (utils/prompt_context.py); budgets are estimated tokens
+    PROMPT_COMPACTION_ENABLED = os.getenv("PROMPT_COMPACTION_ENABLED", "true").lower() in ("1", "true", "yes")
+    PROMPT_EXPLAIN_MAX_ROWS = int(os.getenv("PROMPT_EXPLAIN_MAX_ROWS", 32))
+    PROMPT_SAMPLE_MAX_ROWS = int(os.getenv("PROMPT_SAMPLE_MAX_ROWS", 5))
+    PROMPT_VALUE_MAX_CHARS = int(os.getenv("PROMPT_VALUE_MAX_CHARS", 120))
+    PROMPT_BUDGET_OPTIMIZER = int(os.getenv("PROMPT_BUDGET_OPTIMIZER", 3000))
+    PROMPT_BUDGET_COST = int(os.getenv("PROMPT_BUDGET_COST", 1500))
+    PROMPT_BUDGET_SCHEMA = int(os.getenv("PROMPT_BUDGET_SCHEMA", 2000))
+    PROMPT_BUDGET_VALIDATOR = int(os.getenv("PROMPT_BUDGET_VALIDATOR", 1500))
+    PROMPT_BUDGET_FUSED = int(os.getenv("PROMPT_BUDGET_FUSED", 4000))
@@ -0,0 +1,153 @@
+import asyncio
+import logging
+import time
+import uuid
+from typing import Any, AsyncContextManager, Callable, Dict, List, Optional
+
+from db.digest_harvester import DigestHistory, fetch_samples, harvest
+from utils.config import Config
+from utils.job_queue import JobQueue, JobRunner
+
+logger = logging.getLogger(__name__)
+
+
+class DigestMonitor:
+    """Periodically snapshots performance_schema digests for one database.
+
+    After each snapshot the top digests of the last interval, by total
+    latency, are submitted to the job queue for a full analysis. A digest
+    is not resubmitted until `reanalyze_after` seconds have passed.
+    """
+
+    def __init__(self,
+                 owner: str,
+                 database: str,
+                 connect: Callable[[], AsyncContextManager[Any]],
+                 make_runner: Callable[[str], JobRunner],
+                 queue: JobQueue,
+                 interval: float = Config.DIGEST_INTERVAL,
+                 top: int = Config.DIGEST_TOP,
+                 auto_analyze: bool = True,
+                 reanalyze_after: float = Config.DIGEST_REANALYZE_AFTER):
+        self.id = uuid.uuid4().hex
+        self.owner = owner
+        self.database = database
+        self.connect = connect
+        self.make_runner = make_runner
+        self.queue = queue
+        self.interval = max(interval, Config.DIGEST_MIN_INTERVAL)
+        self.top = top
+        self.auto_analyze = auto_analyze
+        self.reanalyze_after = reanalyze_after
+        self.history = DigestHistory()
+        self.jobs: Dict[str, str] = {}
+        self._queued_at: Dict[str, float] = {}
+        self.snapshots_taken = 0
+        self.last_snapshot_at: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.snapshot()
+            except Exception as e:
+                self.last_error = str(e)
+                logger.warning(f"Digest snapshot failed for {self.database}: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def snapshot(self):
+        async with self.connect() as client:
+            count = await harvest(client.pool, self.history)
+            self.snapshots_taken += 1
+            self.last_snapshot_at = time.time()
+            self.last_error = None
+            top = self.history.top(self.top)["digests"]
+            await fetch_samples(client.pool, self.history, [d["digest"] for d in top])
+        logger.info(f"Digest snapshot for {self.database}: {count} digests")
+        if self.auto_analyze and len(self.history.snapshots) > 1:
+            self._queue_top(self.history.top(self.top)["digests"])
+
+    def _queue_top(self, digests: List[Dict[str, Any]]):
+        now = time.time()
+        for digest in digests:
+            key = digest["digest"]
+            if now - self._queued_at.get(key, float("-inf")) < self.reanalyze_after:
+                continue
+            # DIGEST_TEXT has `?` placeholders and can't be EXPLAINed or run
+            query = digest["sample_query"]
+            if not query:
+                continue
+            try:
+                job = self.queue.submit(self.owner, self.make_runner(query), kind="digest")
+            except asyncio.QueueFull:
+                logger.warning("Job queue full, deferring digest analysis to the next snapshot")
+                return
+            self.jobs[key] = job.id
+            self._queued_at[key] = now
+
+    def report(self, window: Optional[float] = None, n: Optional[int] = None) -> Dict[str, Any]:
+        top = self.history.top(n or self.top, window)
+        for digest in top["digests"]:
+            digest["job_id"] = self.jobs.get(digest["digest"])
+            if self.auto_analyze and not digest["sample_query"]:
+                digest["analysis"] = "no sample available"
+        return {**self.to_dict(), **top}
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "monitor_id": self.id,
+            "database": self.database,
+            "interval_seconds": self.interval,
+            "top": self.top,
+            "auto_analyze": self.auto_analyze,
+            "snapshots_taken": self.snapshots_taken,
+            "last_snapshot_at": self.last_snapshot_at,
+            "last_error": self.last_error,
+            "storage": self.history.footprint(),
+        }
+
+
+class DigestMonitorRegistry:
+    def __init__(self, max_monitors: int = Config.DIGEST_MAX_MONITORS):
+        self.max_monitors = max_monitors
+        self._monitors: Dict[str, DigestMonitor] = {}
+
+    def add(self, monitor: DigestMonitor) -> DigestMonitor:
+        """Register and start a monitor. Raises RuntimeError when at capacity."""
+        if len(self._monitors) >= self.max_monitors:
+            raise RuntimeError(f"At most {self.max_monitors} digest monitors can run at once")
+        self._monitors[monitor.id] = monitor
+        monitor.start()
+        return monitor
+
+    def get(self, monitor_id: str, owner: Optional[str] = None) -> Optional[DigestMonitor]:
+        monitor = self._monitors.get(monitor_id)
+        if monitor is None or (owner is not None and monitor.owner != owner):
+            return None
+        return monitor
+
+    def list(self, owner: str) -> List[DigestMonitor]:
+        return [m for m in self._monitors.values() if m.owner == owner]
+
+    async def remove(self, monitor_id: str):
+        monitor = self._monitors.pop(monitor_id, None)
+        if monitor is not None:
+            await monitor.stop()
+
+    async def stop_all(self):
+        for monitor_id in list(self._monitors):
+            await self.remove(monitor_id)
+
+
+digest_monitors = DigestMonitorRegistry()
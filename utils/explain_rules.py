@@ -0,0 +1,195 @@
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from utils.config import Config
+from utils.sql_parser import parse_sql
+
+_SEVERITY_RANK = {"high": 3, "medium": 2, "low": 1}
+
+# Extra values meaning the optimizer resolved the table without reading rows
+_NO_READ_EXTRA = ("Impossible WHERE", "No tables used", "Select tables optimized away",
+                  "no matching row in const table", "Impossible HAVING")
+
+
+def _rows(row: Dict[str, Any]) -> int:
+    try:
+        return max(int(row.get("rows") or 0), 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+def _is_derived(table: Optional[str]) -> bool:
+    return not table or table.startswith(("<derived", "<union", "<subquery", "<materialize"))
+
+
+def explain_rows_product(explain_plan: Any) -> int:
+    """Multiply the `rows` estimates of every EXPLAIN row (nested-loop work)."""
+    if not isinstance(explain_plan, list) or not explain_plan:
+        return 0
+    product = 1
+    for row in explain_plan:
+        if isinstance(row, dict):
+            product *= max(_rows(row), 1)
+    return product
+
+
+def _index_columns(query: Optional[str]) -> Dict[str, Any]:
+    """Candidate index columns per table name/alias: equality filters, then ranges, then join keys."""
+    if not query:
+        return {}
+    parsed = parse_sql(query)
+    by_table: Dict[str, List[str]] = {}
+    ordered = sorted(parsed.predicates, key=lambda p: p.op not in ("=", "<=>", "IN", "IS"))
+    for table, column in [(p.table, p.column) for p in ordered] + \
+            [(side.table, side.column) for j in parsed.join_keys for side in (j.left, j.right)]:
+        if table and column not in by_table.setdefault(table.lower(), []):
+            by_table[table.lower()].append(column)
+    # EXPLAIN reports aliases, so key the same columns under each alias too
+    hints = {name: (name, cols) for name, cols in by_table.items()}
+    for ref in parsed.tables:
+        if ref.name.lower() in by_table:
+            hints[ref.name.lower()] = (ref.name, by_table[ref.name.lower()])
+            if ref.alias:
+                hints[ref.alias.lower()] = (ref.name, by_table[ref.name.lower()])
+    return hints
+
+
+def _index_hint(columns: Dict[str, Any], table: Optional[str], default: str) -> str:
+    hint = columns.get((table or "").lower())
+    if not hint:
+        return default
+    name, cols = hint
+    return f"Add an index on `{name}` ({', '.join(cols[:3])})"
+
+
+def _finding(rule: str, severity: str, row: Dict[str, Any], message: str, suggestion: str) -> Dict[str, Any]:
+    return {
+        "rule": rule,
+        "severity": severity,
+        "table": row.get("table"),
+        "rows": _rows(row),
+        "key": row.get("key"),
+        "possible_keys": row.get("possible_keys"),
+        "message": message,
+        "suggestion": suggestion,
+    }
+
+
+def evaluate_explain(explain_plan: Any, query: Optional[str] = None) -> Dict[str, Any]:
+    """Flag common plan problems in tabular EXPLAIN rows, without an LLM.
+
+    Each finding names the table, row estimate and key that triggered it.
+    `severity` is the worst finding's severity, or "low" if none fired.
+    With the query, index suggestions name the filtered and joined columns.
+    """
+    if not isinstance(explain_plan, list):
+        return {"findings": [], "severity": "low", "rows_product": 0}
+    columns = _index_columns(query)
+
+    findings: List[Dict[str, Any]] = []
+    large = Config.EXPLAIN_LARGE_ROWS
+    by_select: "OrderedDict[Any, List[Dict[str, Any]]]" = OrderedDict()
+
+    for row in explain_plan:
+        if not isinstance(row, dict):
+            continue
+        table = row.get("table")
+        extra = row.get("Extra") or ""
+        access = (row.get("type") or "").upper()
+        rows = _rows(row)
+        by_select.setdefault(row.get("id"), []).append(row)
+
+        if any(marker in extra for marker in _NO_READ_EXTRA):
+            continue
+        if access == "ALL" and not _is_derived(table):
+            findings.append(_finding(
+                "full_table_scan", "high" if rows >= large else "medium", row,
+                f"Full table scan on `{table}` reading ~{rows} rows",
+                _index_hint(columns, table,
+                            f"Add an index on `{table}` covering the WHERE / JOIN columns used for this table")))
+        if "Using filesort" in extra:
+            findings.append(_finding(
+                "filesort", "medium" if rows < large else "high", row,
+                f"`{table}` needs a filesort over ~{rows} rows",
+                "Index the ORDER BY columns (after any equality filters) so rows come back pre-sorted"))
+        if "Using temporary" in extra:
+            findings.append(_finding(
+                "temporary_table", "medium", row,
+                f"`{table}` builds a temporary table (GROUP BY / DISTINCT / UNION)",
+                "Align GROUP BY / DISTINCT columns with an index, or reduce the rows reaching the grouping"))
+        if "Using join buffer" in extra:
+            findings.append(_finding(
+                "join_buffer", "high" if rows >= large else "medium", row,
+                f"`{table}` is joined through a join buffer without a usable index",
+                _index_hint(columns, table, f"Index the join column(s) of `{table}` referenced in the ON clause")))
+        if not _is_derived(table) and access not in ("SYSTEM", "CONST", "EQ_REF", "REF"):
+            if not row.get("possible_keys"):
+                findings.append(_finding(
+                    "no_possible_keys", "high" if rows >= large else "low", row,
+                    f"No index on `{table}` matches the query's conditions",
+                    _index_hint(columns, table, f"Create an index on `{table}` for the filtered or joined columns")))
+            elif not row.get("key"):
+                findings.append(_finding(
+                    "possible_keys_unused", "medium", row,
+                    f"`{table}` has candidate indexes ({row.get('possible_keys')}) but none was chosen",
+                    "Check column types/collations match, avoid functions on indexed columns, refresh statistics"))
+
+    for select_rows in by_select.values():
+        if len(select_rows) < 2:
+            continue
+        product = explain_rows_product(select_rows)
+        if product >= Config.EXPLAIN_ROWS_PRODUCT_LIMIT:
+            findings.append({
+                "rule": "large_join_product",
+                "severity": "high",
+                "table": ", ".join(str(r.get("table")) for r in select_rows),
+                "rows": product,
+                "key": None,
+                "possible_keys": None,
+                "message": f"Join over {len(select_rows)} tables examines ~{product:,} row combinations",
+                "suggestion": "Filter the driving table earlier and index every join column so each step is a ref/eq_ref lookup",
+            })
+
+    severity = max((f["severity"] for f in findings), key=_SEVERITY_RANK.get, default="low")
+    return {"findings": findings, "severity": severity, "rows_product": explain_rows_product(explain_plan)}
+
+
+def rule_based_optimizer(sql: str, evaluation: Dict[str, Any], reason: str) -> Dict[str, Any]:
+    """Optimizer-agent-shaped result built from evaluate_explain output."""
+    findings = evaluation["findings"]
+    recommendations = list(OrderedDict.fromkeys(f["suggestion"] for f in findings))
+    if sql.lstrip().lower().startswith("select *"):
+        recommendations.append("Select only the columns you need instead of SELECT *")
+    return {
+        "agent": "query_optimizer",
+        "status": "success",
+        "source": "rules",
+        "fallback_reason": reason,
+        "details": {
+            "optimized_query": sql,
+            "why_faster": (f"{len(findings)} plan issue(s) found by the local EXPLAIN rules"
+                           if findings else "No plan issues found by the local EXPLAIN rules"),
+            "recommendations": recommendations,
+            "warnings": [f["message"] for f in findings],
+            "estimated_impact": evaluation["severity"],
+            "engine_advice": [],
+            "materialization_advice": [],
+            "findings": findings,
+        },
+    }
+
+
+def rule_based_cost(evaluation: Dict[str, Any], reason: str) -> Dict[str, Any]:
+    """Cost-advisor-shaped result built from evaluate_explain output."""
+    findings = evaluation["findings"]
+    return {
+        "agent": "cost_advisor",
+        "status": "success",
+        "source": "rules",
+        "fallback_reason": reason,
+        "details": {
+            "estimated_cost": evaluation["severity"],
+            "cost_saving_tips": list(OrderedDict.fromkeys(f["suggestion"] for f in findings)),
+            "warnings": [f["message"] for f in findings if f["severity"] == "high"],
+        },
+    }
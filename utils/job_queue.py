@@ -0,0 +1,223 @@
+import asyncio
+import logging
+import time
+import uuid
+from collections import OrderedDict, deque
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+from utils.config import Config
+
+logger = logging.getLogger(__name__)
+
+# A job runner receives an on_stage_complete hook and returns the final result
+JobRunner = Callable[[Callable[[str, Any], Awaitable[None]]], Awaitable[Any]]
+
+TERMINAL_STATES = ("succeeded", "failed", "cancelled")
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return round(ordered[idx], 1)
+
+
+class Job:
+    def __init__(self, owner: str, runner: JobRunner, kind: str = "analysis"):
+        self.id = uuid.uuid4().hex
+        self.owner = owner
+        self.kind = kind
+        self.runner = runner
+        self.status = "queued"
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.events: List[Tuple[str, Any]] = []
+        self.task: Optional[asyncio.Task] = None
+        self._changed = asyncio.Event()
+
+    def add_event(self, event: str, data: Any):
+        self.events.append((event, data))
+        self._changed.set()
+
+    def to_dict(self, include_result: bool = True) -> Dict[str, Any]:
+        out = {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "completed_stages": [e for e, _ in self.events if e not in ("status", "complete", "error")],
+        }
+        if self.error:
+            out["error"] = self.error
+        if include_result and self.status == "succeeded":
+            out["result"] = self.result
+        return out
+
+
+class JobQueue:
+    """Bounded in-process queue of analysis jobs served by a fixed worker pool.
+
+    Jobs outlive the HTTP request that created them: clients poll or stream
+    progress by id. Finished jobs are kept for `retention` seconds, pruned
+    by a background task; a finished job drops its runner (and the
+    connection credentials it closes over) straight away.
+    """
+
+    def __init__(self,
+                 workers: int = Config.JOB_WORKERS,
+                 max_queued: int = Config.JOB_QUEUE_MAX,
+                 retention: float = Config.JOB_RETENTION):
+        self.workers = workers
+        self.retention = retention
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_queued)
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._worker_tasks: List[asyncio.Task] = []
+        self._pruner: Optional[asyncio.Task] = None
+        self._busy = 0
+        self._wait_ms: Deque[float] = deque(maxlen=500)
+        self._run_ms: Deque[float] = deque(maxlen=500)
+        self._counts = {state: 0 for state in TERMINAL_STATES}
+
+    def start(self):
+        if not self._worker_tasks:
+            self._worker_tasks = [asyncio.ensure_future(self._worker(i)) for i in range(self.workers)]
+        if self._pruner is None or self._pruner.done():
+            self._pruner = asyncio.ensure_future(self._prune_forever())
+
+    async def stop(self):
+        for job in self._jobs.values():
+            if job.status in ("queued", "running"):
+                self.cancel(job.id)
+        if self._pruner is not None:
+            self._pruner.cancel()
+            self._pruner = None
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        self._worker_tasks = []
+
+    def submit(self, owner: str, runner: JobRunner, kind: str = "analysis") -> Job:
+        """Queue a job. Raises asyncio.QueueFull when the backlog is at capacity."""
+        self._prune()
+        job = Job(owner, runner, kind)
+        self._queue.put_nowait(job)
+        self._jobs[job.id] = job
+        job.add_event("status", {"status": "queued"})
+        return job
+
+    def get(self, job_id: str, owner: Optional[str] = None) -> Optional[Job]:
+        job = self._jobs.get(job_id)
+        if job is None or (owner is not None and job.owner != owner):
+            return None
+        return job
+
+    def cancel(self, job_id: str) -> bool:
+        job = self._jobs.get(job_id)
+        if job is None or job.status in TERMINAL_STATES:
+            return False
+        if job.task is not None:
+            job.task.cancel()
+        else:
+            # Still queued: the worker will skip it when dequeued
+            self._finish(job, "cancelled", error="Cancelled before start")
+        return True
+
+    def _finish(self, job: Job, status: str, result: Any = None, error: Optional[str] = None):
+        job.status = status
+        job.result = result
+        job.error = error
+        job.finished_at = time.time()
+        job.runner = None
+        job.task = None
+        self._counts[status] += 1
+        if job.started_at is not None:
+            self._run_ms.append((job.finished_at - job.started_at) * 1000)
+        if status == "succeeded":
+            job.add_event("complete", result)
+        else:
+            job.add_event("error", {"status": status, "error": error})
+
+    async def _worker(self, index: int):
+        while True:
+            job = await self._queue.get()
+            try:
+                if job.status != "queued":
+                    continue
+                self._busy += 1
+                job.status = "running"
+                job.started_at = time.time()
+                self._wait_ms.append((job.started_at - job.created_at) * 1000)
+                job.add_event("status", {"status": "running"})
+
+                async def on_stage_complete(name: str, data: Any, job=job):
+                    job.add_event(name, data)
+
+                job.task = asyncio.ensure_future(job.runner(on_stage_complete))
+                try:
+                    result = await job.task
+                    self._finish(job, "succeeded", result=result)
+                except asyncio.CancelledError:
+                    if job.task.cancelled():
+                        self._finish(job, "cancelled", error="Cancelled while running")
+                    else:
+                        raise
+                except Exception as e:
+                    logger.exception(f"Job {job.id} failed: {e}")
+                    self._finish(job, "failed", error=str(e))
+                finally:
+                    self._busy -= 1
+            finally:
+                self._queue.task_done()
+
+    async def stream(self, job: Job) -> AsyncIterator[Tuple[str, Any]]:
+        """Yield a job's events from the start, then live until it finishes."""
+        sent = 0
+        while True:
+            while sent < len(job.events):
+                yield job.events[sent]
+                sent += 1
+            if job.status in TERMINAL_STATES:
+                return
+            job._changed.clear()
+            if sent < len(job.events):
+                continue
+            await job._changed.wait()
+
+    def _prune(self):
+        cutoff = time.time() - self.retention
+        for job_id in [j.id for j in self._jobs.values()
+                       if j.status in TERMINAL_STATES and (j.finished_at or 0) < cutoff]:
+            del self._jobs[job_id]
+
+    async def _prune_forever(self):
+        interval = max(1.0, min(self.retention / 2, 60.0))
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                self._prune()
+            except Exception as e:
+                logger.exception(f"Job pruning failed: {e}")
+
+    def metrics(self) -> Dict[str, Any]:
+        wait = list(self._wait_ms)
+        run = list(self._run_ms)
+        return {
+            "queue_depth": self._queue.qsize(),
+            "queue_capacity": self._queue.maxsize,
+            "workers": self.workers,
+            "busy_workers": self._busy,
+            "utilisation": round(self._busy / self.workers, 3) if self.workers else 0.0,
+            "running": sum(1 for j in self._jobs.values() if j.status == "running"),
+            "finished": dict(self._counts),
+            "queue_wait_ms": {"p50": _percentile(wait, 50), "p95": _percentile(wait, 95)},
+            "run_time_ms": {"p50": _percentile(run, 50), "p95": _percentile(run, 95)},
+        }
+
+
+job_queue = JobQueue()
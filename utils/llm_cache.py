@@ -0,0 +1,195 @@
+import asyncio
+import contextvars
+import copy
+import hashlib
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from utils.config import Config
+
+logger = logging.getLogger(__name__)
+
+# Set per request (QueryRequest.bypass_cache). Tasks spawned by the stage
+# executor inherit it, so agents don't need an extra parameter.
+bypass_cache: contextvars.ContextVar[bool] = contextvars.ContextVar("llm_cache_bypass", default=False)
+
+AGENT_TTLS = {
+    "query_optimizer": Config.LLM_CACHE_TTL_OPTIMIZER,
+    "cost_advisor": Config.LLM_CACHE_TTL_COST,
+    "schema_advisor": Config.LLM_CACHE_TTL_SCHEMA,
+    "data_validator": Config.LLM_CACHE_TTL_VALIDATOR,
+    # The fused reply includes the validator section, so it can't outlive it
+    "fused": min(Config.LLM_CACHE_TTL_OPTIMIZER, Config.LLM_CACHE_TTL_COST,
+                 Config.LLM_CACHE_TTL_SCHEMA, Config.LLM_CACHE_TTL_VALIDATOR),
+}
+
+
+def cache_key(model: str, temperature: float, max_tokens: int, prompt: str) -> str:
+    """Content address of an LLM call: identical inputs give identical keys."""
+    material = json.dumps([model, float(temperature), int(max_tokens), prompt], ensure_ascii=False)
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class LLMCache:
+    """Two-tier cache of parsed LLM JSON responses.
+
+    The memory tier is an LRU bounded by the serialized size of its values.
+    The optional disk tier stores one JSON file per key under `disk_dir` so
+    entries survive restarts; it is pruned oldest-first past `disk_max_bytes`.
+    """
+
+    def __init__(self,
+                 max_bytes: int = Config.LLM_CACHE_MAX_BYTES,
+                 disk_dir: Optional[str] = Config.LLM_CACHE_DIR,
+                 disk_max_bytes: int = Config.LLM_CACHE_DISK_MAX_BYTES,
+                 default_ttl: float = Config.LLM_CACHE_TTL):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir or None
+        self.disk_max_bytes = disk_max_bytes
+        self.default_ttl = default_ttl
+        self._entries: "OrderedDict[str, Tuple[float, int, Dict[str, Any]]]" = OrderedDict()
+        self._bytes = 0
+        self._disk_writes = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+
+    def ttl_for(self, agent: Optional[str]) -> float:
+        return AGENT_TTLS.get(agent, self.default_ttl)
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, key[:2], f"{key}.json")
+
+    def _remember(self, key: str, expires_at: float, value: Dict[str, Any], size: int):
+        if size > self.max_bytes:
+            return
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._bytes -= old[1]
+        self._entries[key] = (expires_at, size, value)
+        self._bytes += size
+        while self._bytes > self.max_bytes and self._entries:
+            _, (_, evicted_size, _) = self._entries.popitem(last=False)
+            self._bytes -= evicted_size
+            self.evictions += 1
+
+    def _read_disk(self, key: str) -> Optional[Tuple[float, Dict[str, Any], int]]:
+        path = self._disk_path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                raw = f.read()
+        except FileNotFoundError:
+            return None
+        try:
+            record = json.loads(raw)
+        except ValueError:
+            os.remove(path)
+            return None
+        if record.get("expires_at", 0) < time.time():
+            os.remove(path)
+            return None
+        return record["expires_at"], record["value"], len(raw)
+
+    def _write_disk(self, key: str, expires_at: float, value: Dict[str, Any]):
+        path = self._disk_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"expires_at": expires_at, "value": value}, f, default=str)
+        os.replace(tmp, path)
+        self._disk_writes += 1
+        if self._disk_writes % 100 == 0:
+            self._prune_disk()
+
+    def _prune_disk(self):
+        files = []
+        total = 0
+        for root, _, names in os.walk(self.disk_dir):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                files.append((st.st_mtime, st.st_size, path))
+                total += st.st_size
+        files.sort()
+        for _, size, path in files:
+            if total <= self.disk_max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except FileNotFoundError:
+                pass
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, _, value = entry
+            if expires_at >= time.time():
+                self._entries.move_to_end(key)
+                self.memory_hits += 1
+                return copy.deepcopy(value)
+            self._bytes -= self._entries.pop(key)[1]
+
+        if self.disk_dir:
+            try:
+                found = await asyncio.to_thread(self._read_disk, key)
+            except Exception as e:
+                logger.warning(f"LLM cache disk read failed: {e}")
+                found = None
+            if found is not None:
+                expires_at, value, size = found
+                self._remember(key, expires_at, value, size)
+                self.disk_hits += 1
+                return copy.deepcopy(value)
+
+        self.misses += 1
+        return None
+
+    async def set(self, key: str, value: Dict[str, Any], ttl: float):
+        if ttl <= 0:
+            return
+        expires_at = time.time() + ttl
+        # Callers mutate their responses (setdefault), so keep a private copy
+        value = copy.deepcopy(value)
+        size = len(json.dumps(value, default=str))
+        self._remember(key, expires_at, value, size)
+        self.stores += 1
+        if self.disk_dir:
+            try:
+                await asyncio.to_thread(self._write_disk, key, expires_at, value)
+            except Exception as e:
+                logger.warning(f"LLM cache disk write failed: {e}")
+
+    def clear(self):
+        self._entries.clear()
+        self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "enabled": Config.LLM_CACHE_ENABLED,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "disk_dir": self.disk_dir,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.memory_hits + self.disk_hits) / lookups, 3) if lookups else 0.0,
+            "stores": self.stores,
+            "evictions": self.evictions,
+        }
+
+
+llm_cache = LLMCache()
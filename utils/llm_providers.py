@@ -0,0 +1,182 @@
+import json
+import logging
+import os
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from utils.config import Config
+from utils.llm_resilience import CircuitBreaker, LatencyTracker
+from utils.llm_scheduler import LLMScheduler, SingleFlight
+
+logger = logging.getLogger(__name__)
+
+GROQ_URL = "https://api.groq.com/openai/v1/chat/completions"
+
+BALANCE_STRATEGIES = ("least_outstanding", "latency")
+
+
+class LLMEndpoint:
+    """One OpenAI-compatible chat completions endpoint (a key, region or self-hosted server).
+
+    Each endpoint has its own rate limiter, circuit breaker and latency
+    tracker. `models` maps the model names agents ask for to the names
+    this endpoint serves, e.g. for a self-hosted server.
+    """
+
+    def __init__(self, name: str, url: str, api_key: str = "",
+                 rpm: float = Config.LLM_RPM, tpm: float = Config.LLM_TPM,
+                 models: Optional[Dict[str, str]] = None):
+        self.name = name
+        self.url = url
+        self.api_key = api_key
+        self.models = models or {}
+        self.scheduler = LLMScheduler(rpm=rpm, tpm=tpm, name=name)
+        self.breaker = CircuitBreaker(name)
+        self.latency = LatencyTracker()
+        self.outstanding = 0
+        self.ewma_ms: Optional[float] = None
+        self.stats_counters = {"requests": 0, "errors": 0, "failovers": 0}
+
+    def model_for(self, model: str) -> str:
+        return self.models.get(model, model)
+
+    def headers(self) -> Dict[str, str]:
+        headers = {"Content-Type": "application/json"}
+        if self.api_key:
+            headers["Authorization"] = f"Bearer {self.api_key}"
+        return headers
+
+    def record_latency(self, model: str, seconds: float):
+        self.latency.record(model, seconds)
+        ms = seconds * 1000
+        self.ewma_ms = ms if self.ewma_ms is None else 0.8 * self.ewma_ms + 0.2 * ms
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "url": self.url,
+            "outstanding": self.outstanding,
+            "ewma_latency_ms": round(self.ewma_ms, 1) if self.ewma_ms is not None else None,
+            **self.stats_counters,
+            "rate_limiter": self.scheduler.stats(),
+            "circuit": self.breaker.stats(),
+            "latency": self.latency.stats(),
+        }
+
+
+def _should_fail_over(result: Dict[str, Any]) -> bool:
+    """Errors another endpoint may not have: exhausted or bad key, outage, network error."""
+    if "error" not in result:
+        return False
+    status = result.get("status")
+    return status is None or status in (401, 403, 429) or status >= 500
+
+
+class LLMProviderPool:
+    """Routes LLM calls across endpoints.
+
+    least_outstanding picks the endpoint with the fewest calls queued or in
+    flight (ties go to the faster one); latency picks the lowest
+    (outstanding + 1) x EWMA latency. Endpoints whose circuit is open are
+    skipped and rate-limited ones are used only when nothing else is
+    ready. A call that fails with an error another endpoint may not have
+    is retried on the next endpoint; the last candidate waits out 429s
+    instead. Identical concurrent calls share one request.
+    """
+
+    def __init__(self, endpoints: List[LLMEndpoint], strategy: str = Config.LLM_BALANCE_STRATEGY):
+        if strategy not in BALANCE_STRATEGIES:
+            logger.warning(f"Unknown LLM_BALANCE_STRATEGY {strategy!r}, using least_outstanding")
+            strategy = "least_outstanding"
+        self.endpoints = endpoints
+        self.strategy = strategy
+        self.coalescer = SingleFlight()
+
+    def _score(self, endpoint: LLMEndpoint, default_ms: float):
+        latency = endpoint.ewma_ms if endpoint.ewma_ms is not None else default_ms
+        if self.strategy == "latency":
+            return ((endpoint.outstanding + 1) * latency,)
+        return (endpoint.outstanding, latency)
+
+    def pick(self, exclude=()) -> Optional[LLMEndpoint]:
+        candidates = [ep for ep in self.endpoints if ep not in exclude and ep.breaker.available()]
+        if not candidates:
+            return None
+        ready = [ep for ep in candidates if ep.scheduler.paused_for() == 0]
+        if not ready:
+            return min(candidates, key=lambda ep: ep.scheduler.paused_for())
+        known = [ep.ewma_ms for ep in self.endpoints if ep.ewma_ms is not None]
+        default_ms = sum(known) / len(known) if known else 1.0
+        return min(ready, key=lambda ep: self._score(ep, default_ms))
+
+    async def send(self, tokens: int, call: Callable[[LLMEndpoint], Awaitable[Dict[str, Any]]]) -> Dict[str, Any]:
+        tried = set()
+        result: Dict[str, Any] = {"error": "No LLM endpoint available", "status": 503}
+        while True:
+            endpoint = self.pick(tried)
+            if endpoint is None:
+                return result
+            tried.add(endpoint)
+            last = self.pick(tried) is None
+            endpoint.outstanding += 1
+            try:
+                result = await endpoint.scheduler.send(tokens, lambda: call(endpoint),
+                                                       max_retries=None if last else 0)
+            finally:
+                endpoint.outstanding -= 1
+            endpoint.stats_counters["requests"] += 1
+            if "error" in result:
+                endpoint.stats_counters["errors"] += 1
+            if last or not _should_fail_over(result):
+                return result
+            endpoint.stats_counters["failovers"] += 1
+            logger.warning(f"LLM endpoint {endpoint.name} failed ({result.get('status')}: "
+                           f"{result.get('error')}), failing over")
+
+    async def run(self, key: str, tokens: int, call: Callable[[LLMEndpoint], Awaitable[Dict[str, Any]]]) -> Dict[str, Any]:
+        """send() with identical `key`s in flight sharing one request."""
+        return await self.coalescer.run(key, lambda: self.send(tokens, call))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "strategy": self.strategy,
+            "calls": self.coalescer.calls,
+            "coalesced": self.coalescer.coalesced,
+            "in_flight": len(self.coalescer),
+            "endpoints": {ep.name: ep.stats() for ep in self.endpoints},
+        }
+
+
+def _load_endpoints() -> List[LLMEndpoint]:
+    """Endpoints from LLM_ENDPOINTS (a JSON list), else the single Groq key."""
+    specs = []
+    if Config.LLM_ENDPOINTS:
+        try:
+            specs = json.loads(Config.LLM_ENDPOINTS)
+        except ValueError as e:
+            logger.error(f"LLM_ENDPOINTS is not valid JSON, ignoring it: {e}")
+    endpoints = []
+    names = set()
+    for i, spec in enumerate(specs if isinstance(specs, list) else []):
+        if not isinstance(spec, dict) or not spec.get("url"):
+            logger.warning(f"Skipping LLM_ENDPOINTS entry {i}: no url")
+            continue
+        name = str(spec.get("name") or f"endpoint{i}")
+        if name in names:
+            # Stats are keyed by name, so two endpoints must never share one
+            unique = next(f"{name}-{n}" for n in range(2, len(specs) + 2) if f"{name}-{n}" not in names)
+            logger.warning(f"Duplicate LLM_ENDPOINTS name {name!r} (entry {i}), renamed to {unique!r}")
+            name = unique
+        names.add(name)
+        endpoints.append(LLMEndpoint(
+            name=name,
+            url=spec["url"],
+            api_key=spec.get("api_key") or os.getenv(spec.get("api_key_env", ""), "") or "",
+            rpm=float(spec.get("rpm", Config.LLM_RPM)),
+            tpm=float(spec.get("tpm", Config.LLM_TPM)),
+            models=spec.get("models") if isinstance(spec.get("models"), dict) else None,
+        ))
+    if not endpoints and Config.GROQ_API_KEY:
+        endpoints.append(LLMEndpoint("groq", GROQ_URL, Config.GROQ_API_KEY))
+    return endpoints
+
+
+llm_providers = LLMProviderPool(_load_endpoints())
@@ -0,0 +1,147 @@
+import logging
+import math
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional
+
+from utils.config import Config
+
+logger = logging.getLogger(__name__)
+
+
+def _nearest_rank(ordered, pct: float) -> float:
+    return ordered[max(math.ceil(pct / 100 * len(ordered)) - 1, 0)]
+
+
+class LatencyTracker:
+    """Recent call latencies per model, used to size timeouts.
+
+    Successful calls record their duration; timed-out calls record the
+    timeout they hit, so a slowdown raises the p99 instead of hiding it.
+    Until `min_samples` calls have completed the fixed LLM_HTTP_TIMEOUT is
+    used; after that the timeout is the observed p99 times `factor`,
+    clamped to [min_timeout, max_timeout].
+    """
+
+    def __init__(self,
+                 window: int = Config.LLM_LATENCY_WINDOW,
+                 min_samples: int = Config.LLM_LATENCY_MIN_SAMPLES,
+                 factor: float = Config.LLM_TIMEOUT_P99_FACTOR,
+                 min_timeout: float = Config.LLM_TIMEOUT_MIN,
+                 max_timeout: float = Config.LLM_HTTP_TIMEOUT):
+        self.window = window
+        self.min_samples = min_samples
+        self.factor = factor
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self._samples: Dict[str, Deque[float]] = {}
+
+    def record(self, model: str, seconds: float):
+        self._samples.setdefault(model, deque(maxlen=self.window)).append(seconds)
+
+    def percentile(self, model: str, pct: float) -> Optional[float]:
+        samples = self._samples.get(model)
+        if not samples or len(samples) < self.min_samples:
+            return None
+        return _nearest_rank(sorted(samples), pct)
+
+    def timeout(self, model: str) -> float:
+        p99 = self.percentile(model, 99)
+        if p99 is None:
+            return self.max_timeout
+        return min(max(p99 * self.factor, self.min_timeout), self.max_timeout)
+
+    def hedge_delay(self, model: str) -> Optional[float]:
+        """Seconds to wait before a hedged request: the p95, or None while warming up."""
+        p95 = self.percentile(model, 95)
+        if p95 is None:
+            return None
+        return max(p95, Config.LLM_HEDGE_MIN_DELAY)
+
+    def stats(self) -> Dict[str, Any]:
+        out = {}
+        for model, samples in self._samples.items():
+            ordered = sorted(samples)
+            out[model] = {
+                "samples": len(ordered),
+                "p50_ms": round(_nearest_rank(ordered, 50) * 1000, 1),
+                "p95_ms": round(_nearest_rank(ordered, 95) * 1000, 1),
+                "p99_ms": round(_nearest_rank(ordered, 99) * 1000, 1),
+                "timeout_s": round(self.timeout(model), 1),
+            }
+        return out
+
+
+class CircuitBreaker:
+    """Fail fast while the LLM backend is unhealthy.
+
+    closed: calls pass; `failure_threshold` consecutive failures open it.
+    open: calls are rejected until `cooldown` seconds have passed.
+    half_open: one probe call is let through; success closes the circuit,
+    failure opens it for another cooldown.
+    """
+
+    def __init__(self, name: str,
+                 failure_threshold: int = Config.LLM_BREAKER_FAILURES,
+                 cooldown: float = Config.LLM_BREAKER_COOLDOWN):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+        self.stats_counters = {"rejected": 0, "opened": 0}
+
+    def available(self) -> bool:
+        """Whether allow() would let a call through, without claiming the probe."""
+        if self.state == "closed":
+            return True
+        if self.state == "open":
+            return time.monotonic() - self.opened_at >= self.cooldown
+        return not self.probing
+
+    def allow(self) -> bool:
+        if self.state == "closed":
+            return True
+        if self.state == "open" and time.monotonic() - self.opened_at >= self.cooldown:
+            self.state = "half_open"
+            logger.info(f"LLM circuit {self.name} half-open, probing")
+        if self.state == "half_open" and not self.probing:
+            self.probing = True
+            return True
+        self.stats_counters["rejected"] += 1
+        return False
+
+    def retry_in(self) -> float:
+        return max(self.opened_at + self.cooldown - time.monotonic(), 0.0)
+
+    def record_success(self):
+        if self.state != "closed":
+            logger.info(f"LLM circuit {self.name} closed")
+        self.state = "closed"
+        self.failures = 0
+        self.probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            if self.state != "open":
+                self.stats_counters["opened"] += 1
+                logger.warning(f"LLM circuit {self.name} open after {self.failures} failure(s); "
+                               f"failing fast for {self.cooldown:.0f}s")
+            self.state = "open"
+            self.opened_at = time.monotonic()
+        self.probing = False
+
+    def release(self):
+        """Let another probe through if this one ended without a verdict (e.g. cancelled)."""
+        self.probing = False
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "retry_in_s": round(self.retry_in(), 1) if self.state == "open" else 0.0,
+            **self.stats_counters,
+        }
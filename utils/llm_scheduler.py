@@ -0,0 +1,169 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional
+
+from utils.config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """Continuously refilled bucket; acquire() waits instead of failing.
+
+    Waiters are served in arrival order, so a large request is not starved
+    by a stream of small ones.
+    """
+
+    def __init__(self, capacity: float, per_second: float):
+        self.capacity = max(capacity, 1.0)
+        self.per_second = per_second
+        self.level = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.per_second)
+        self.updated = now
+
+    async def acquire(self, amount: float):
+        amount = min(amount, self.capacity)
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.level >= amount:
+                    self.level -= amount
+                    return
+                await asyncio.sleep((amount - self.level) / self.per_second)
+
+    def try_acquire(self, amount: float) -> bool:
+        """Take `amount` only if it is available now and nobody is waiting."""
+        if self._lock.locked():
+            return False
+        self._refill()
+        if self.level < amount:
+            return False
+        self.level -= amount
+        return True
+
+    def refund(self, amount: float):
+        self._refill()
+        self.level = min(self.capacity, self.level + max(amount, 0))
+
+    def drain(self):
+        """Empty the bucket, e.g. after the server reported a rate limit."""
+        self._refill()
+        self.level = 0.0
+
+
+class SingleFlight:
+    """Concurrent calls with the same key share one in-flight result.
+
+    The shared call runs in its own task, so a caller that is cancelled
+    (e.g. by a stage timeout) does not cancel it for the others.
+    """
+
+    def __init__(self):
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    async def run(self, key: str, call: Callable[[], Awaitable[Any]]) -> Any:
+        self.calls += 1
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            task = asyncio.ensure_future(call())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(task)
+
+    def __len__(self):
+        return len(self._inflight)
+
+
+class LLMScheduler:
+    """Client-side admission for LLM calls.
+
+    Calls wait for both a request token (requests per minute) and their
+    estimated token cost (tokens per minute) before being sent. A 429
+    pauses every call until the server's Retry-After has passed; send()
+    then resends the call, up to `max_retries` times.
+    """
+
+    def __init__(self,
+                 rpm: float = Config.LLM_RPM,
+                 tpm: float = Config.LLM_TPM,
+                 max_retries: int = Config.LLM_RATE_LIMIT_RETRIES,
+                 default_retry_after: float = Config.LLM_RETRY_AFTER_DEFAULT,
+                 name: str = "llm"):
+        self.name = name
+        self.requests = TokenBucket(rpm, rpm / 60.0)
+        self.tokens = TokenBucket(tpm, tpm / 60.0)
+        self.max_retries = max_retries
+        self.default_retry_after = default_retry_after
+        self.paused_until = 0.0
+        self._waits: Deque[float] = deque(maxlen=1000)
+        self.stats_counters = {"rate_limited": 0, "queued": 0, "admitted": 0, "wait_ms_total": 0.0}
+
+    async def _admit(self, tokens: int):
+        started = time.monotonic()
+        self.stats_counters["queued"] += 1
+        try:
+            while True:
+                pause = self.paused_until - time.monotonic()
+                if pause <= 0:
+                    break
+                await asyncio.sleep(pause)
+            await self.requests.acquire(1)
+            await self.tokens.acquire(tokens)
+        finally:
+            self.stats_counters["queued"] -= 1
+        waited = (time.monotonic() - started) * 1000
+        self._waits.append(waited)
+        self.stats_counters["admitted"] += 1
+        self.stats_counters["wait_ms_total"] += waited
+
+    def try_admit(self) -> bool:
+        """Admit an extra request (e.g. a hedge) only if the RPM budget has room now."""
+        return time.monotonic() >= self.paused_until and self.requests.try_acquire(1)
+
+    def _pause(self, retry_after: Optional[float]):
+        delay = retry_after if retry_after is not None else self.default_retry_after
+        self.paused_until = max(self.paused_until, time.monotonic() + delay)
+        self.requests.drain()
+        logger.warning(f"LLM endpoint {self.name} rate limited; pausing its calls for {delay:.1f}s")
+
+    def paused_for(self) -> float:
+        return max(self.paused_until - time.monotonic(), 0.0)
+
+    async def send(self, tokens: int, call: Callable[[], Awaitable[Dict[str, Any]]],
+                   max_retries: Optional[int] = None) -> Dict[str, Any]:
+        """Send `call` once admitted, resending after a 429 up to `max_retries` times."""
+        retries = self.max_retries if max_retries is None else max_retries
+        for _ in range(retries + 1):
+            await self._admit(tokens)
+            result = await call()
+            used = (result.get("raw") or {}).get("usage", {}).get("total_tokens") \
+                if isinstance(result.get("raw"), dict) else None
+            if used is not None:
+                self.tokens.refund(min(tokens, self.tokens.capacity) - used)
+            if result.get("status") != 429:
+                return result
+            self.stats_counters["rate_limited"] += 1
+            self._pause(result.get("retry_after"))
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        waits = sorted(self._waits)
+        return {
+            "rate_limited": self.stats_counters["rate_limited"],
+            "queued_now": self.stats_counters["queued"],
+            "avg_queue_wait_ms": round(self.stats_counters["wait_ms_total"] / max(self.stats_counters["admitted"], 1), 1),
+            "p95_queue_wait_ms": round(waits[int(0.95 * (len(waits) - 1))], 1) if waits else 0.0,
+            "max_queue_wait_ms": round(waits[-1], 1) if waits else 0.0,
+            "paused_for_s": round(self.paused_for(), 1),
+        }
@@ -0,0 +1,106 @@
+import logging
+from collections import namedtuple
+from typing import Any, Dict, List, Optional
+
+from utils.config import Config
+from utils.explain_rules import evaluate_explain
+from utils.sql_parser import parse_sql, tokenize
+
+logger = logging.getLogger(__name__)
+
+Complexity = namedtuple("Complexity", "score joins subqueries rows_examined flags has_plan")
+
+# Agents with a local rule-engine answer, which a trivial query can take instead of the LLM
+_RULE_AGENTS = ("query_optimizer", "cost_advisor")
+
+_FLAG_WEIGHT = {"high": 2, "medium": 1, "low": 0}
+
+
+class RouteDecision(namedtuple("RouteDecision", "agent tier model score reasons")):
+    """Which model an agent uses: tier is "skip" (no LLM call), "small" or "large"."""
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"tier": self.tier, "model": self.model, "score": self.score, "reasons": list(self.reasons)}
+
+
+def _has_plan(explain: Any) -> bool:
+    return isinstance(explain, list) and bool(explain)
+
+
+def score_complexity(query: str, explain: Any = None) -> Complexity:
+    """Score a query from its parse and EXPLAIN plan; 0 is a single-table indexed lookup.
+
+    Each join and subquery adds 2, GROUP BY and ORDER BY 1 each, every
+    EXPLAIN rule finding its severity (high 2, medium 1), and the rows the
+    plan examines 1 from 1,000 and 2 from EXPLAIN_LARGE_ROWS.
+    """
+    parsed = parse_sql(query)
+    subqueries = max(sum(1 for tok in tokenize(query) if tok.upper == "SELECT") - 1, 0)
+    # Table references beyond one per SELECT block are joins
+    joins = max(len(parsed.tables) - 1 - subqueries, 0)
+    score = 2 * joins + 2 * subqueries + bool(parsed.group_by) + bool(parsed.order_by)
+
+    rows_examined = 0
+    flags: List[str] = []
+    has_plan = _has_plan(explain)
+    if has_plan:
+        evaluation = evaluate_explain(explain, query)
+        rows_examined = evaluation["rows_product"]
+        for finding in evaluation["findings"]:
+            score += _FLAG_WEIGHT.get(finding["severity"], 0)
+            if finding["rule"] not in flags:
+                flags.append(finding["rule"])
+        if rows_examined >= Config.EXPLAIN_LARGE_ROWS:
+            score += 2
+        elif rows_examined >= 1000:
+            score += 1
+    return Complexity(score, joins, subqueries, rows_examined, flags, has_plan)
+
+
+def _reasons(c: Complexity) -> List[str]:
+    reasons = []
+    if c.joins:
+        reasons.append(f"{c.joins} join(s)")
+    if c.subqueries:
+        reasons.append(f"{c.subqueries} subquery/union branch(es)")
+    if c.has_plan:
+        reasons.append(f"~{c.rows_examined:,} rows examined")
+    else:
+        reasons.append("scored on the parse only (no EXPLAIN)")
+    if c.flags:
+        reasons.append("plan flags: " + ", ".join(c.flags))
+    return reasons
+
+
+def route_model(agent: str, query: str, explain: Any = None, sample_rows: Any = None,
+                complexity: Optional[Complexity] = None) -> RouteDecision:
+    """Pick the model for one agent call.
+
+    Queries scoring at most ROUTER_SKIP_MAX_SCORE with a clean plan skip the
+    LLM for the optimizer and cost agents (the EXPLAIN rules answer), and
+    the validator skips when there are no sample rows. Scores up to
+    ROUTER_SMALL_MAX_SCORE, and validations of at most
+    ROUTER_VALIDATOR_SMALL_ROWS rows, use LLM_MODEL_SMALL; the rest, and
+    anything that is not a SELECT, use LLM_MODEL_LARGE.
+    """
+    large, small = Config.LLM_MODEL_LARGE, Config.LLM_MODEL_SMALL
+    if not Config.MODEL_ROUTING_ENABLED:
+        return RouteDecision(agent, "large", large, None, ["model routing disabled"])
+
+    if agent == "data_validator":
+        rows = sample_rows.get("rows") if isinstance(sample_rows, dict) else None
+        if not rows:
+            return RouteDecision(agent, "skip", None, 0, ["no sample rows to validate"])
+        if len(rows) <= Config.ROUTER_VALIDATOR_SMALL_ROWS:
+            return RouteDecision(agent, "small", small, len(rows), [f"{len(rows)} sample row(s)"])
+        return RouteDecision(agent, "large", large, len(rows), [f"{len(rows)} sample row(s)"])
+
+    if not query.lstrip().lower().startswith(("select", "with", "(")):
+        return RouteDecision(agent, "large", large, None, ["not a SELECT"])
+    c = complexity or score_complexity(query, explain)
+    reasons = _reasons(c)
+    if agent in _RULE_AGENTS and c.has_plan and not c.flags and c.score <= Config.ROUTER_SKIP_MAX_SCORE:
+        return RouteDecision(agent, "skip", None, c.score, reasons)
+    if c.score <= Config.ROUTER_SMALL_MAX_SCORE:
+        return RouteDecision(agent, "small", small, c.score, reasons)
+    return RouteDecision(agent, "large", large, c.score, reasons)
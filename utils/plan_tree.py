@@ -0,0 +1,162 @@
+import json
+from typing import Any, Dict, Iterator, List, Optional
+
+# JSON keys in MariaDB EXPLAIN/ANALYZE FORMAT=JSON output that become plan nodes.
+# Other containers (nested_loop, query_specifications, subqueries, ...) are
+# walked through transparently.
+_NODE_TYPES = {
+    "query_block", "table", "block-nl-join", "filesort", "temporary_table", "read_sorted_file",
+    "materialized", "union_result", "duplicates_removal", "window_functions_computation",
+    "expression_cache",
+}
+
+_BUFFER_KEYS = ("buffer_type", "buffer_size", "join_type", "r_buffer_size", "r_sort_mode",
+                "r_used_priority_queue", "r_output_rows")
+
+# Actual/estimated row ratio beyond which a table's estimate counts as wrong
+MISESTIMATE_FACTOR = 10
+
+
+def _number(value: Any) -> Optional[float]:
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return value
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class PlanNode:
+    """One operator of a MariaDB JSON plan, with estimated and measured figures.
+
+    Measured fields (r_rows, loops, time_ms, r_filtered) are None unless the
+    plan came from ANALYZE FORMAT=JSON.
+    """
+
+    __slots__ = ("node_type", "table", "access_type", "key", "possible_keys", "rows", "r_rows", "loops",
+                 "filtered", "r_filtered", "time_ms", "cost", "condition", "buffer", "engine_stats",
+                 "children")
+
+    def __init__(self, node_type: str, data: Dict[str, Any], children: List["PlanNode"]):
+        self.node_type = node_type
+        self.table = data.get("table_name")
+        self.access_type = data.get("access_type")
+        self.key = data.get("key")
+        self.possible_keys = data.get("possible_keys")
+        self.rows = _number(data.get("rows"))
+        self.r_rows = _number(data.get("r_rows"))
+        self.loops = _number(data.get("r_loops", data.get("loops")))
+        self.filtered = _number(data.get("filtered"))
+        self.r_filtered = _number(data.get("r_filtered"))
+        time_ms = _number(data.get("r_total_time_ms"))
+        if time_ms is None and ("r_table_time_ms" in data or "r_other_time_ms" in data):
+            time_ms = (_number(data.get("r_table_time_ms")) or 0) + (_number(data.get("r_other_time_ms")) or 0)
+        self.time_ms = time_ms
+        self.cost = _number(data.get("cost"))
+        self.condition = data.get("attached_condition")
+        self.buffer = {k: data[k] for k in _BUFFER_KEYS if k in data} or None
+        self.engine_stats = data.get("r_engine_stats")
+        self.children = children
+
+    @property
+    def actual_rows_read(self) -> Optional[float]:
+        if self.r_rows is None:
+            return None
+        return self.r_rows * (self.loops or 1)
+
+    def walk(self) -> Iterator["PlanNode"]:
+        yield self
+        for child in self.children:
+            yield from child.walk()
+
+    def to_dict(self) -> Dict[str, Any]:
+        out = {"node_type": self.node_type}
+        for field in self.__slots__[1:-1]:
+            value = getattr(self, field)
+            if value is not None:
+                out[field] = value
+        out["children"] = [child.to_dict() for child in self.children]
+        return out
+
+
+def _children(data: Dict[str, Any]) -> List[PlanNode]:
+    nodes = []
+    for key, value in data.items():
+        if isinstance(value, dict):
+            if key in _NODE_TYPES:
+                nodes.append(PlanNode(key, value, _children(value)))
+            else:
+                nodes.extend(_children(value))
+        elif isinstance(value, list):
+            for item in value:
+                if isinstance(item, dict):
+                    nodes.extend(_children(item))
+    return nodes
+
+
+def parse_plan(plan: Any) -> Optional[PlanNode]:
+    """Build a PlanNode tree from EXPLAIN/ANALYZE FORMAT=JSON output (text or decoded)."""
+    if isinstance(plan, (str, bytes)):
+        plan = json.loads(plan)
+    if not isinstance(plan, dict):
+        return None
+    roots = _children(plan)
+    if len(roots) == 1:
+        return roots[0]
+    return PlanNode("plan", {}, roots) if roots else None
+
+
+def _level(time_ms: float) -> str:
+    if time_ms < 100:
+        return "low"
+    if time_ms < 1000:
+        return "medium"
+    return "high"
+
+
+def summarize_plan(root: PlanNode) -> Dict[str, Any]:
+    """Totals, estimate errors and a measured cost level for a plan tree."""
+    tables = [n for n in root.walk() if n.node_type == "table"]
+    analyzed = any(n.r_rows is not None or n.time_ms is not None for n in root.walk())
+    summary: Dict[str, Any] = {
+        "analyzed": analyzed,
+        "tables": len(tables),
+        "estimated_rows": sum(n.rows or 0 for n in tables),
+        "full_scans": [n.table for n in tables if n.access_type == "ALL"],
+        "estimated_cost": root.cost,
+        "filesort": any(n.node_type == "filesort" for n in root.walk()),
+        "temporary_table": any(n.node_type == "temporary_table" for n in root.walk()),
+        "join_buffers": [n.buffer for n in root.walk() if n.node_type == "block-nl-join" and n.buffer],
+    }
+    if not analyzed:
+        return summary
+
+    misestimates = []
+    for n in tables:
+        if n.rows and n.r_rows is not None:
+            ratio = (n.r_rows or 0.0) / n.rows
+            if ratio >= MISESTIMATE_FACTOR or ratio <= 1 / MISESTIMATE_FACTOR:
+                misestimates.append({"table": n.table, "estimated_rows": n.rows, "actual_rows": n.r_rows,
+                                     "ratio": round(ratio, 3)})
+    pages = [n.engine_stats.get("pages_accessed") for n in tables if isinstance(n.engine_stats, dict)]
+    total_ms = root.time_ms
+    if total_ms is None:
+        total_ms = sum(n.time_ms or 0 for n in tables)
+    summary.update({
+        "total_time_ms": round(total_ms, 3),
+        "actual_rows_read": sum(n.actual_rows_read or 0 for n in tables),
+        "pages_accessed": sum(p for p in pages if isinstance(p, (int, float))) if pages else None,
+        "misestimates": misestimates,
+        "measured_cost": _level(total_ms),
+    })
+    return summary
+
+
+def plan_report(result: Any) -> Dict[str, Any]:
+    """Turn MariaDBClient.explain_json output into {"mode", "tree", "summary"}."""
+    if not isinstance(result, dict) or "error" in result or "plan" not in result:
+        return result if isinstance(result, dict) else {}
+    root = parse_plan(result["plan"])
+    if root is None:
+        return {"error": "No plan operators found in JSON plan"}
+    return {"mode": result["mode"], "tree": root.to_dict(), "summary": summarize_plan(root)}
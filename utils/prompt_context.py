@@ -0,0 +1,189 @@
+import json
+import logging
+import math
+import re
+from typing import Any, Dict, List, Optional, Set
+
+from utils.config import Config
+from utils.sql_parser import parse_sql, tokenize
+
+logger = logging.getLogger(__name__)
+
+_WORD_RE = re.compile(r"\w+|[^\w\s]")
+
+_STAR_PREFIXES = ("SELECT", ",", "DISTINCT", "ALL")
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough BPE token count: one per punctuation mark, one per ~4 word characters."""
+    return sum(max(1, math.ceil(len(w) / 4)) if w[0].isalnum() or w[0] == "_" else 1
+               for w in _WORD_RE.findall(text or ""))
+
+
+def _dumps(value: Any) -> str:
+    return json.dumps(value, separators=(",", ":"), default=str, ensure_ascii=False)
+
+
+def _referenced_columns(query: str):
+    """(columns per lower-cased table, tables whose every column is selected)."""
+    parsed = parse_sql(query)
+    by_alias = {}
+    for ref in parsed.tables:
+        by_alias[ref.name.lower()] = ref.name.lower()
+        if ref.alias:
+            by_alias[ref.alias.lower()] = ref.name.lower()
+    columns: Dict[Optional[str], Set[str]] = {}
+    for col in parsed.columns:
+        columns.setdefault(col.table.lower() if col.table else None, set()).add(col.column.lower())
+
+    star: Set[str] = set()
+    tokens = tokenize(query)
+    for i, tok in enumerate(tokens):
+        if tok.text != "*" or i == 0:
+            continue
+        prev = tokens[i - 1].upper
+        if prev in _STAR_PREFIXES:
+            star.update(by_alias.values())
+        elif prev == "." and i >= 2:
+            table = by_alias.get(tokens[i - 2].upper.lower())
+            if table:
+                star.add(table)
+    return columns, star
+
+
+def compact_schema(schema: Dict[str, Any], query: str) -> Dict[str, Any]:
+    """Keep referenced and key columns per table, one short string per column.
+
+    Tables the query selects `*` from keep every column.
+    """
+    columns, star = _referenced_columns(query)
+    unqualified = columns.get(None, set())
+    stats = schema.get("_table_stats", {}) if isinstance(schema.get("_table_stats"), dict) else {}
+    out = {}
+    for table, rows in schema.items():
+        if table == "_table_stats":
+            continue
+        if not isinstance(rows, list):
+            out[table] = rows
+            continue
+        wanted = columns.get(table.lower(), set()) | unqualified
+        keep_all = table.lower() in star
+        kept = []
+        for row in rows:
+            name = str(row.get("Field", ""))
+            if keep_all or name.lower() in wanted or row.get("Key"):
+                entry = f"{name} {row.get('Type', '')}"
+                if row.get("Key"):
+                    entry += f" {row['Key']}"
+                if row.get("Null") == "NO":
+                    entry += " NOT NULL"
+                kept.append(entry)
+        entry = {"columns": kept}
+        if len(kept) < len(rows):
+            entry["omitted_columns"] = len(rows) - len(kept)
+        table_stats = stats.get(table) or {}
+        if table_stats.get("rows_estimate") is not None:
+            entry["rows"] = table_stats["rows_estimate"]
+        indexes = [f"{i['name']}({','.join(i['columns'])}){' UNIQUE' if i.get('unique') else ''}"
+                   for i in table_stats.get("indexes", []) if isinstance(i, dict)]
+        if indexes:
+            entry["indexes"] = indexes
+        out[table] = entry
+    return out
+
+
+def compact_explain(explain: List[Any], max_rows: int) -> List[Any]:
+    rows = [{k: v for k, v in row.items() if v not in (None, "")} if isinstance(row, dict) else row
+            for row in explain[:max_rows]]
+    if len(explain) > max_rows:
+        rows.append({"omitted_rows": len(explain) - max_rows})
+    return rows
+
+
+def _truncate(value: Any, max_chars: int) -> Any:
+    if isinstance(value, (bytes, bytearray)):
+        value = value.hex()
+    if isinstance(value, str) and len(value) > max_chars:
+        return value[:max_chars] + f"...(+{len(value) - max_chars})"
+    return value
+
+
+def compact_rows(sample_rows: Dict[str, Any], max_rows: int, max_chars: int) -> Dict[str, Any]:
+    rows = sample_rows.get("rows")
+    if not isinstance(rows, list):
+        return sample_rows
+    out = {k: v for k, v in sample_rows.items() if k != "rows"}
+    out["rows"] = [{k: _truncate(v, max_chars) for k, v in row.items()} if isinstance(row, dict) else row
+                   for row in rows[:max_rows]]
+    if len(rows) > max_rows:
+        out["omitted_rows"] = len(rows) - max_rows
+    return out
+
+
+def _has_schema(schema: Any) -> bool:
+    return isinstance(schema, dict) and bool(schema) and schema.get("error") is None
+
+
+def _verbose(parts: Dict[str, Any]) -> Dict[str, str]:
+    return {name: json.dumps(value, indent=2, default=str) for name, value in parts.items()}
+
+
+def build_context(query: str, agent: str, budget: int, schema: Any = None, explain: Any = None,
+                  sample_rows: Any = None) -> Dict[str, Optional[str]]:
+    """Serialize the prompt inputs an agent uses, within `budget` estimated tokens.
+
+    Returns a string per given input, or None when that input is missing
+    or an error. Schema is cut to referenced and key columns, EXPLAIN
+    rows and sample rows are capped and long values truncated; if that
+    is still over budget the caps are tightened, then the largest parts
+    are cut. Token counts before (verbose JSON) and after are logged.
+    """
+    parts: Dict[str, Any] = {}
+    if _has_schema(schema):
+        parts["schema"] = schema
+    if isinstance(explain, list) and explain:
+        parts["explain"] = explain
+    if isinstance(sample_rows, dict) and sample_rows:
+        parts["sample_rows"] = sample_rows
+    result: Dict[str, Optional[str]] = {"schema": None, "explain": None, "sample_rows": None}
+    if not parts:
+        return result
+
+    verbose = _verbose(parts)
+    before = sum(estimate_tokens(text) for text in verbose.values())
+    if not Config.PROMPT_COMPACTION_ENABLED:
+        result.update(verbose)
+        return result
+
+    explain_rows = Config.PROMPT_EXPLAIN_MAX_ROWS
+    sample_count = Config.PROMPT_SAMPLE_MAX_ROWS
+    value_chars = Config.PROMPT_VALUE_MAX_CHARS
+    while True:
+        compact = {}
+        if "schema" in parts:
+            compact["schema"] = _dumps(compact_schema(parts["schema"], query))
+        if "explain" in parts:
+            compact["explain"] = _dumps(compact_explain(parts["explain"], explain_rows))
+        if "sample_rows" in parts:
+            compact["sample_rows"] = _dumps(compact_rows(parts["sample_rows"], sample_count, value_chars))
+        sizes = {name: estimate_tokens(text) for name, text in compact.items()}
+        if sum(sizes.values()) <= budget:
+            break
+        if sample_count > 1 or value_chars > 16:
+            sample_count = max(sample_count // 2, 1)
+            value_chars = max(value_chars // 2, 16)
+        elif explain_rows > 4:
+            explain_rows //= 2
+        else:
+            # Still over budget: cut the largest parts down to their share of it
+            share = max(budget // len(compact), 1)
+            for name, text in compact.items():
+                if sizes[name] > share:
+                    keep = max(int(len(text) * share / sizes[name]), 0)
+                    compact[name] = text[:keep] + "...(truncated)"
+            break
+
+    after = sum(estimate_tokens(text) for text in compact.values())
+    logger.info(f"Prompt context for {agent}: ~{before} -> ~{after} tokens (budget {budget})")
+    result.update(compact)
+    return result
@@ -37,6 +37,31 @@ class ResponseFormatter:
             }
         }
 
+    @staticmethod
+    def format_stage(stage: str, output: Any) -> Dict[str, Any]:
+        """Format one pipeline stage as the response sections it fills in.
+
+        Used for streaming, so each section has the same shape it has in
+        the final response. Stages with no section of their own (the fused
+        call, whose answers arrive through the agent stages) return {}.
+        """
+        if stage in ("optimizer", "verified_optimizer"):
+            return {
+                "summary": ResponseFormatter._extract_summary(output),
+                "optimization": ResponseFormatter._format_optimizer(output),
+            }
+        if stage in ("cost", "measured_cost"):
+            return {"cost_analysis": ResponseFormatter._format_cost_advisor(output)}
+        if stage in ("schema_advisor", "evaluated_schema_advisor"):
+            return {"schema_improvements": ResponseFormatter._format_schema_advisor(output)}
+        if stage == "data_validator":
+            return {"data_quality": ResponseFormatter._format_data_validator(output)}
+        if stage in ("schema_context", "explain_plan", "sample_rows", "plan_tree"):
+            return {"technical_details": {stage: output}}
+        if stage == "benchmark":
+            return {"benchmark": output}
+        return {}
+
     @staticmethod
     def _extract_summary(optimizer_output: Dict[str, Any]) -> Dict[str, Any]:
         """Extract key summary from optimizer."""
@@ -64,8 +89,9 @@ class ResponseFormatter:
             }
 
         details = optimizer_output.get("details", {})
-        return {
+        formatted = {
             "status": "success",
+            "source": optimizer_output.get("source", "llm"),
             "optimized_query": details.get("optimized_query", "No optimization available"),
             "performance_impact": details.get("estimated_impact", "unknown"),
             "why_faster": details.get("why_faster", ""),
@@ -74,6 +100,9 @@ class ResponseFormatter:
             "engine_advice": details.get("engine_advice", []),
             "materialization_advice": details.get("materialization_advice", [])
         }
+        if "verification" in optimizer_output:
+            formatted["verification"] = optimizer_output["verification"]
+        return formatted
 
     @staticmethod
     def _format_cost_advisor(cost_output: Dict[str, Any]) -> Dict[str, Any]:
@@ -85,12 +114,17 @@ class ResponseFormatter:
             }
 
         details = cost_output.get("details", {})
-        return {
+        formatted = {
             "status": "success",
+            "source": cost_output.get("source", "llm"),
             "estimated_cost": details.get("estimated_cost", "unknown"),
             "cost_saving_tips": details.get("cost_saving_tips", []),
             "warnings": details.get("warnings", [])
         }
+        if "measured" in details:
+            formatted["predicted_cost"] = details.get("predicted_cost")
+            formatted["measured"] = details["measured"]
+        return formatted
 
     @staticmethod
     def _format_schema_advisor(schema_output: Dict[str, Any]) -> Dict[str, Any]:
@@ -110,12 +144,15 @@ class ResponseFormatter:
             }
 
         details = schema_output.get("details", {})
-        return {
+        formatted = {
             "status": "success",
             "recommended_indexes": details.get("recommended_indexes", []),
             "schema_changes": details.get("schema_changes", []),
             "warnings": details.get("warnings", [])
         }
+        if "what_if" in schema_output:
+            formatted["what_if"] = schema_output["what_if"]
+        return formatted
 
     @staticmethod
     def _format_data_validator(validator_output: Dict[str, Any]) -> Dict[str, Any]:
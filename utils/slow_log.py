@@ -0,0 +1,321 @@
+import asyncio
+import logging
+import math
+import re
+from typing import Any, AsyncIterator, BinaryIO, Dict, Iterable, Iterator, List, Optional
+
+from agents.query_optimizer import optimize_query
+from agents.schema_advisor import advise_schema
+from utils.batch_analysis import run_batch
+from utils.config import Config
+from utils.response_formatter import ResponseFormatter
+from utils.sql_fingerprint import fingerprint
+
+logger = logging.getLogger(__name__)
+
+_HEADER_PAIR_RE = re.compile(r"(\w+):\s+(\S+)")
+_GENERAL_RE = re.compile(
+    r"^(?:\d{6}\s+\d{1,2}:\d\d:\d\d|\d{4}-\d\d-\d\dT\S+)?\s+(?P<thread>\d+)\s+(?P<command>[A-Z][A-Za-z ]*?)\t(?P<arg>.*)$"
+)
+_SLOW_PREAMBLE = ("Tcp port:", "Time ", "Time\t")
+_GENERAL_COMMANDS = ("Query", "Execute")
+
+# Latency histogram: bucket i holds times in [BASE * GROWTH**i, BASE * GROWTH**(i+1)),
+# so percentiles are accurate to within 10% using a few dozen ints per digest.
+_HIST_BASE = 1e-6
+_HIST_GROWTH = 1.1
+_LOG_GROWTH = math.log(_HIST_GROWTH)
+
+
+def _bucket(seconds: float) -> int:
+    if seconds <= _HIST_BASE:
+        return 0
+    return int(math.log(seconds / _HIST_BASE) / _LOG_GROWTH)
+
+
+class DigestStats:
+    """Running totals for one query fingerprint."""
+
+    __slots__ = ("fingerprint", "sample", "sample_time", "schema", "count", "query_time", "max_query_time",
+                 "lock_time", "rows_examined", "max_rows_examined", "rows_sent", "first_seen", "last_seen",
+                 "histogram")
+
+    def __init__(self, fp: str, sample: str, schema: Optional[str]):
+        self.fingerprint = fp
+        self.sample = sample
+        self.sample_time = -1.0
+        self.schema = schema
+        self.count = 0
+        self.query_time = 0.0
+        self.max_query_time = 0.0
+        self.lock_time = 0.0
+        self.rows_examined = 0
+        self.max_rows_examined = 0
+        self.rows_sent = 0
+        self.first_seen: Optional[int] = None
+        self.last_seen: Optional[int] = None
+        self.histogram: Dict[int, int] = {}
+
+    def add(self, query: str, query_time: float, lock_time: float, rows_examined: int, rows_sent: int,
+            timestamp: Optional[int]):
+        self.count += 1
+        self.query_time += query_time
+        self.lock_time += lock_time
+        self.rows_examined += rows_examined
+        self.rows_sent += rows_sent
+        self.max_rows_examined = max(self.max_rows_examined, rows_examined)
+        if query_time > self.sample_time:
+            # Keep the slowest instance as the representative query
+            self.sample = query
+            self.sample_time = query_time
+        self.max_query_time = max(self.max_query_time, query_time)
+        bucket = _bucket(query_time)
+        self.histogram[bucket] = self.histogram.get(bucket, 0) + 1
+        if timestamp is not None:
+            self.first_seen = timestamp if self.first_seen is None else min(self.first_seen, timestamp)
+            self.last_seen = timestamp if self.last_seen is None else max(self.last_seen, timestamp)
+
+    def percentile(self, pct: float) -> float:
+        if not self.count:
+            return 0.0
+        rank = math.ceil(pct / 100 * self.count)
+        seen = 0
+        for bucket in sorted(self.histogram):
+            seen += self.histogram[bucket]
+            if seen >= rank:
+                # Upper bound of the bucket, capped by the largest value seen
+                return min(_HIST_BASE * _HIST_GROWTH ** (bucket + 1), self.max_query_time)
+        return self.max_query_time
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "fingerprint": self.fingerprint,
+            "query": self.sample,
+            "schema": self.schema,
+            "count": self.count,
+            "query_time": {
+                "total": round(self.query_time, 6),
+                "avg": round(self.query_time / self.count, 6) if self.count else 0.0,
+                "p95": round(self.percentile(95), 6),
+                "max": round(self.max_query_time, 6),
+            },
+            "lock_time": {
+                "total": round(self.lock_time, 6),
+                "avg": round(self.lock_time / self.count, 6) if self.count else 0.0,
+            },
+            "rows_examined": {
+                "total": self.rows_examined,
+                "avg": round(self.rows_examined / self.count, 1) if self.count else 0.0,
+                "max": self.max_rows_examined,
+            },
+            "rows_sent": self.rows_sent,
+            "first_seen": self.first_seen,
+            "last_seen": self.last_seen,
+        }
+
+
+class DigestAggregator:
+    """Groups log entries by fingerprint in bounded memory.
+
+    Only one DigestStats per distinct fingerprint is kept, with a single
+    sample query capped at `max_query_bytes`. Once `max_digests` shapes
+    exist, entries for new shapes are counted in `dropped` instead.
+    """
+
+    def __init__(self, max_digests: int = Config.SLOW_LOG_MAX_DIGESTS,
+                 max_query_bytes: int = Config.SLOW_LOG_MAX_QUERY_BYTES):
+        self.max_digests = max_digests
+        self.max_query_bytes = max_query_bytes
+        self.digests: Dict[str, DigestStats] = {}
+        self.entries = 0
+        self.dropped = 0
+        self.format: Optional[str] = None
+
+    def add(self, query: str, query_time: float = 0.0, lock_time: float = 0.0, rows_examined: int = 0,
+            rows_sent: int = 0, schema: Optional[str] = None, timestamp: Optional[int] = None):
+        query = query.strip().rstrip(";").rstrip()
+        if not query or query.startswith("# administrator command"):
+            return
+        self.entries += 1
+        fp = fingerprint(query)
+        stats = self.digests.get(fp)
+        if stats is None:
+            if len(self.digests) >= self.max_digests:
+                self.dropped += 1
+                return
+            stats = self.digests[fp] = DigestStats(fp, "", schema)
+        stats.add(query[:self.max_query_bytes], query_time, lock_time, rows_examined, rows_sent, timestamp)
+
+    def top(self, n: int, order_by: str = "total_time") -> List[Dict[str, Any]]:
+        keys = {
+            "total_time": lambda s: s.query_time,
+            "count": lambda s: s.count,
+            "rows_examined": lambda s: s.rows_examined,
+            "lock_time": lambda s: s.lock_time,
+        }
+        ranked = sorted(self.digests.values(), key=keys.get(order_by, keys["total_time"]), reverse=True)
+        return [s.to_dict() for s in ranked[:n]]
+
+    def report(self, n: int = Config.SLOW_LOG_TOP, order_by: str = "total_time") -> Dict[str, Any]:
+        return {
+            "format": self.format,
+            "entries": self.entries,
+            "unique_digests": len(self.digests),
+            "dropped_entries": self.dropped,
+            "total_query_time": round(sum(s.query_time for s in self.digests.values()), 6),
+            "order_by": order_by,
+            "digests": self.top(n, order_by),
+        }
+
+
+def _to_number(value: Optional[str], cast=float):
+    try:
+        return cast(value) if value is not None else cast(0)
+    except ValueError:
+        return cast(0)
+
+
+def _parse_slow(lines: Iterable[str], agg: DigestAggregator):
+    header: Dict[str, str] = {}
+    query: List[str] = []
+    size = 0
+    schema: Optional[str] = None
+    timestamp: Optional[int] = None
+
+    def flush():
+        if query and "Query_time" in header:
+            agg.add("".join(query),
+                    query_time=_to_number(header.get("Query_time")),
+                    lock_time=_to_number(header.get("Lock_time")),
+                    rows_examined=_to_number(header.get("Rows_examined"), int),
+                    rows_sent=_to_number(header.get("Rows_sent"), int),
+                    schema=header.get("Schema") or schema,
+                    timestamp=timestamp)
+
+    for line in lines:
+        if line.startswith("# "):
+            if query or line.startswith(("# Time:", "# User@Host:")):
+                flush()
+                header, query, size, timestamp = {}, [], 0, None
+            if not line.startswith("# Time:"):
+                header.update(_HEADER_PAIR_RE.findall(line))
+            continue
+        if line.startswith(_SLOW_PREAMBLE) or ", Version: " in line:
+            continue
+        lowered = line[:16].lower()
+        if lowered.startswith("set timestamp="):
+            timestamp = _to_number(line.strip().rstrip(";").split("=", 1)[1], int)
+            continue
+        if lowered.startswith("use ") and not query:
+            schema = line.strip().rstrip(";")[4:].strip("` ")
+            continue
+        if size < agg.max_query_bytes:
+            query.append(line)
+            size += len(line)
+    flush()
+
+
+def _parse_general(lines: Iterable[str], agg: DigestAggregator):
+    query: List[str] = []
+    size = 0
+
+    for line in lines:
+        m = _GENERAL_RE.match(line.rstrip("\n"))
+        if m:
+            if query:
+                agg.add("".join(query))
+                query, size = [], 0
+            if m.group("command").strip() in _GENERAL_COMMANDS:
+                query.append(m.group("arg") + "\n")
+                size = len(query[0])
+        elif query and size < agg.max_query_bytes:
+            query.append(line)
+            size += len(line)
+    if query:
+        agg.add("".join(query))
+
+
+def detect_format(sample: List[str]) -> str:
+    for line in sample:
+        if line.startswith(("# Query_time:", "# User@Host:")):
+            return "slow"
+    if any(_GENERAL_RE.match(line.rstrip("\n")) for line in sample):
+        return "general"
+    return "slow"
+
+
+def _text_lines(stream: BinaryIO) -> Iterator[str]:
+    for raw in stream:
+        yield raw.decode("utf-8", errors="replace")
+
+
+def ingest_log(stream: BinaryIO, fmt: str = "auto", aggregator: Optional[DigestAggregator] = None) -> DigestAggregator:
+    """Parse a slow or general query log from a binary stream.
+
+    The stream is read line by line, so memory use depends on the number of
+    distinct digests rather than the file size. Blocking; call it through
+    asyncio.to_thread from request handlers.
+    """
+    agg = aggregator or DigestAggregator()
+    lines = _text_lines(stream)
+    head: List[str] = []
+    if fmt == "auto":
+        for line in lines:
+            head.append(line)
+            if len(head) >= 50:
+                break
+        fmt = detect_format(head)
+
+    def all_lines():
+        yield from head
+        yield from lines
+
+    agg.format = fmt
+    if fmt == "general":
+        _parse_general(all_lines(), agg)
+    else:
+        _parse_slow(all_lines(), agg)
+    logger.info(f"Ingested {agg.entries} {fmt} log entries into {len(agg.digests)} digests")
+    return agg
+
+
+async def analyze_digests(digests: List[Dict[str, Any]], db_client=None, database: str = "",
+                          bypass_cache: bool = False) -> AsyncIterator[Dict[str, Any]]:
+    """Run the agents on each digest's sample query.
+
+    With a database connection the full batch pipeline is used. Without one
+    only the optimizer and schema advisor run, with no schema or plan.
+    """
+    queries = [d["query"] for d in digests]
+    if db_client is not None:
+        async for item in run_batch(db_client, queries, database, bypass_cache=bypass_cache):
+            yield item
+        return
+
+    semaphore = asyncio.Semaphore(max(1, Config.BATCH_CONCURRENCY))
+
+    async def analyze(index: int, digest: Dict[str, Any]) -> Dict[str, Any]:
+        async with semaphore:
+            optimizer, schema = await asyncio.gather(
+                optimize_query(digest["query"], {}, {}, {}),
+                advise_schema(digest["query"], {}),
+            )
+        return {
+            "type": "result",
+            "index": index,
+            "fingerprint": digest["fingerprint"],
+            "query": digest["query"],
+            "analysis": {
+                **ResponseFormatter.format_stage("optimizer", optimizer),
+                **ResponseFormatter.format_stage("schema_advisor", schema),
+            },
+        }
+
+    tasks = [asyncio.ensure_future(analyze(i, d)) for i, d in enumerate(digests)]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
@@ -0,0 +1,80 @@
+import hashlib
+import re
+from typing import List
+
+# One pass over the query. Order matters: quoted identifiers and strings are
+# matched before comments and numbers so their contents are never rewritten.
+_TOKEN_RE = re.compile(
+    r"""
+      (?P<ident>`(?:[^`]|``)*`)
+    | (?P<string>'(?:[^'\\]|\\.|'')*'|"(?:[^"\\]|\\.|"")*")
+    | (?P<comment>/\*(?!!|\+).*?\*/|(?:--\s|\#)[^\n]*)
+    | (?P<hex>\b0x[0-9a-fA-F]+\b|\b[xX]'[0-9a-fA-F]*'|\b[bB]'[01]*')
+    | (?P<number>(?<![\w.])(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?(?![\w]))
+    """,
+    re.VERBOSE | re.DOTALL,
+)
+
+_IN_LIST_RE = re.compile(r"\bin\s*\(\?(?:, \?)*\)")
+_VALUES_RE = re.compile(r"\bvalues\s*\(\?(?:, \?)*\)(?:, \(\?(?:, \?)*\))*")
+_LIMIT_RE = re.compile(r"\blimit \?(?:, \?)?(?: offset \?)?")
+_OPEN_PAREN_RE = re.compile(r"\(\s+")
+_CLOSE_PAREN_RE = re.compile(r"\s+\)")
+_COMMA_RE = re.compile(r"\s*,\s*")
+_OPERATOR_RE = re.compile(r"\s*(<=>|<>|!=|<=|>=|=|<|>)\s*")
+
+
+def normalize_sql(sql: str) -> str:
+    """Reduce a query to its canonical shape.
+
+    Comments are stripped, literals become `?`, whitespace collapses to a
+    single space and everything outside backtick identifiers is lowercased.
+    IN lists and multi-row VALUES collapse so list length doesn't matter.
+    """
+    out = []
+    pos = 0
+    for m in _TOKEN_RE.finditer(sql):
+        out.append(sql[pos:m.start()].lower())
+        kind = m.lastgroup
+        if kind == "ident":
+            out.append(m.group(0))
+        elif kind == "comment":
+            out.append(" ")
+        else:
+            out.append("?")
+        pos = m.end()
+    out.append(sql[pos:].lower())
+
+    text = " ".join("".join(out).split())
+    text = _OPEN_PAREN_RE.sub("(", text)
+    text = _CLOSE_PAREN_RE.sub(")", text)
+    text = _COMMA_RE.sub(", ", text)
+    text = _OPERATOR_RE.sub(r" \1 ", text)
+    text = text.rstrip("; ")
+    text = _IN_LIST_RE.sub("in (?+)", text)
+    text = _VALUES_RE.sub("values (?+)", text)
+    text = _LIMIT_RE.sub("limit ?", text)
+    return text
+
+
+def fingerprint(sql: str) -> str:
+    """Stable short hash of normalize_sql(sql), used as a cache key component."""
+    return hashlib.sha256(normalize_sql(sql).encode("utf-8")).hexdigest()[:32]
+
+
+def split_statements(text: str) -> List[str]:
+    """Split a SQL script on `;`, ignoring semicolons inside quotes or comments."""
+    statements = []
+    start = 0
+    pos = 0
+    # Semicolons can only appear in the gaps between matched tokens
+    gaps = [(m.start(), m.end()) for m in _TOKEN_RE.finditer(text)] + [(len(text), len(text))]
+    for gap_end, next_pos in gaps:
+        semi = text.find(";", pos, gap_end)
+        while semi != -1:
+            statements.append(text[start:semi])
+            start = semi + 1
+            semi = text.find(";", start, gap_end)
+        pos = next_pos
+    statements.append(text[start:])
+    return [s.strip() for s in statements if s.strip()]
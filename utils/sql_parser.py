@@ -0,0 +1,608 @@
+import logging
+import re
+from collections import namedtuple
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Sequence
+
+from utils.config import Config
+
+logger = logging.getLogger(__name__)
+
+Token = namedtuple("Token", "kind text upper")
+TableRef = namedtuple("TableRef", "schema name alias")
+ColumnRef = namedtuple("ColumnRef", "table column")
+Predicate = namedtuple("Predicate", "table column op clause")
+JoinKey = namedtuple("JoinKey", "left right")
+
+_TOKEN_RE = re.compile(
+    r"""
+      (?P<ws>\s+)
+    | (?P<comment>/\*.*?\*/|(?:--(?=\s|$)|\#)[^\n]*)
+    | (?P<qident>`(?:[^`]|``)*`)
+    | (?P<string>'(?:[^'\\]|\\.|'')*'|"(?:[^"\\]|\\.|"")*")
+    | (?P<hex>0x[0-9a-fA-F]+\b|[xX]'[0-9a-fA-F]*'|[bB]'[01]*')
+    | (?P<word>\d+[A-Za-z_$][\w$]*|[A-Za-z_$][\w$]*)
+    | (?P<number>(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)
+    | (?P<var>@@?[\w.$]+|@`[^`]*`)
+    | (?P<param>\?|:\w+)
+    | (?P<op><=>|<>|!=|<=|>=|:=|\|\||&&|<<|>>|[-+*/%=<>!~^&|.,;()])
+    """,
+    re.VERBOSE | re.DOTALL,
+)
+
+_JOIN_WORDS = {"JOIN", "INNER", "LEFT", "RIGHT", "FULL", "CROSS", "NATURAL", "OUTER", "STRAIGHT_JOIN"}
+_CLAUSE_WORDS = {"SELECT", "FROM", "WHERE", "GROUP", "HAVING", "ORDER", "LIMIT", "OFFSET", "UNION", "EXCEPT",
+                 "INTERSECT", "WINDOW", "FOR", "LOCK", "INTO", "SET", "VALUES", "VALUE", "ON", "USING",
+                 "RETURNING", "PROCEDURE", "FETCH", "UPDATE", "DELETE", "INSERT", "REPLACE", "WITH"}
+# Words that are never column names in expression position
+_EXPR_WORDS = {"AND", "OR", "NOT", "XOR", "IN", "IS", "NULL", "LIKE", "BETWEEN", "EXISTS", "CASE", "WHEN",
+               "THEN", "ELSE", "END", "AS", "ASC", "DESC", "INTERVAL", "DISTINCT", "ALL", "ANY", "SOME",
+               "TRUE", "FALSE", "UNKNOWN", "REGEXP", "RLIKE", "SOUNDS", "ESCAPE", "COLLATE", "BINARY", "DIV",
+               "MOD", "BY", "ROLLUP", "OVER", "PARTITION", "ROWS", "RANGE", "PRECEDING", "FOLLOWING",
+               "UNBOUNDED", "CURRENT", "ROW", "DUPLICATE", "KEY", "HIGH_PRIORITY", "LOW_PRIORITY",
+               "SQL_CALC_FOUND_ROWS", "SQL_NO_CACHE", "SQL_CACHE", "SQL_SMALL_RESULT", "SQL_BIG_RESULT",
+               "SQL_BUFFER_RESULT", "IGNORE", "DELAYED", "QUICK", "DISTINCTROW", "RECURSIVE", "LATERAL",
+               "CURRENT_DATE", "CURRENT_TIME", "CURRENT_TIMESTAMP", "LOCALTIME", "LOCALTIMESTAMP",
+               "UTC_DATE", "UTC_TIME", "UTC_TIMESTAMP", "DEFAULT", "OUTFILE", "DUMPFILE", "SEPARATOR"}
+_STOP_WORDS = _CLAUSE_WORDS | _JOIN_WORDS
+_KEYWORDS = _STOP_WORDS | _EXPR_WORDS
+_SELECT_MODIFIERS = {"ALL", "DISTINCT", "DISTINCTROW", "HIGH_PRIORITY", "STRAIGHT_JOIN", "SQL_SMALL_RESULT",
+                     "SQL_BIG_RESULT", "SQL_BUFFER_RESULT", "SQL_CACHE", "SQL_NO_CACHE", "SQL_CALC_FOUND_ROWS"}
+_DML_MODIFIERS = {"LOW_PRIORITY", "DELAYED", "HIGH_PRIORITY", "IGNORE", "QUICK", "INTO"}
+_INDEX_HINTS = {"USE", "IGNORE", "FORCE"}
+# Stop words that are also string functions, e.g. LEFT(name, 3)
+_FUNCTION_STOP_WORDS = {"LEFT", "RIGHT", "REPLACE", "INSERT"}
+_LITERAL_PREFIXES = {"DATE", "TIME", "TIMESTAMP"}
+_INTERVAL_UNITS = {"MICROSECOND", "SECOND", "MINUTE", "HOUR", "DAY", "WEEK", "MONTH", "QUARTER", "YEAR",
+                   "SECOND_MICROSECOND", "MINUTE_MICROSECOND", "MINUTE_SECOND", "HOUR_MICROSECOND",
+                   "HOUR_SECOND", "HOUR_MINUTE", "DAY_MICROSECOND", "DAY_SECOND", "DAY_MINUTE", "DAY_HOUR",
+                   "YEAR_MONTH"}
+_COMPARISONS = {"=", "<=>", "<>", "!=", "<", "<=", ">", ">="}
+_PREDICATE_WORDS = {"IN", "LIKE", "BETWEEN", "IS", "REGEXP", "RLIKE"}
+_PREDICATE_CLAUSES = ("where", "on", "having")
+
+
+def tokenize(sql: str) -> List[Token]:
+    """Split MariaDB SQL into tokens, dropping whitespace and comments.
+
+    Backtick identifiers are unquoted into `upper` (case preserved) so they
+    compare equal to bare names; other words carry their upper-cased text.
+    """
+    tokens = []
+    for m in _TOKEN_RE.finditer(sql):
+        kind = m.lastgroup
+        if kind in ("ws", "comment"):
+            continue
+        text = m.group(0)
+        if kind == "qident":
+            tokens.append(Token(kind, text[1:-1].replace("``", "`"), text[1:-1].replace("``", "`")))
+        elif kind == "word":
+            tokens.append(Token(kind, text, text.upper()))
+        else:
+            tokens.append(Token(kind, text, text))
+    return tokens
+
+
+def unqualify(sql: str, schema: str) -> str:
+    """Remove `schema.` qualifiers from table references, keeping all other text as is."""
+    out, last, pending, prev = [], 0, None, None
+    for m in _TOKEN_RE.finditer(sql):
+        kind = m.lastgroup
+        if kind in ("ws", "comment"):
+            continue
+        text = m.group(0)
+        if pending is not None:
+            if text == ".":
+                out.append(sql[last:pending])
+                last = m.end()
+                # Skip whitespace between the dot and the table name too
+                while last < len(sql) and sql[last].isspace():
+                    last += 1
+            pending = None
+        if kind in ("word", "qident") and prev != ".":
+            name = text[1:-1].replace("``", "`") if kind == "qident" else text
+            if name.lower() == schema.lower():
+                pending = m.start()
+        prev = text
+    out.append(sql[last:])
+    return "".join(out)
+
+
+class _Scope:
+    """Names visible to one SELECT: alias -> base table (None for CTEs/derived tables).
+
+    Select-list columns are read before FROM, so they wait in `deferred`
+    until the scope's tables are known. `select_aliases` maps each
+    select-list alias to the column it renames, or None for an expression.
+    """
+
+    def __init__(self, parent: Optional["_Scope"] = None):
+        self.parent = parent
+        self.aliases: Dict[str, Optional[str]] = {}
+        self.tables: List[str] = []
+        self.deferred: List[tuple] = []
+        self.select_aliases: Dict[str, Optional[tuple]] = {}
+
+    def add(self, alias: str, table: Optional[str]):
+        self.aliases[alias.lower()] = table
+        if table is not None:
+            self.tables.append(table)
+
+    def resolve(self, qualifier: Optional[str]) -> Optional[str]:
+        scope = self
+        while scope is not None:
+            if qualifier is None:
+                if len(scope.aliases) == 1 and len(scope.tables) == 1:
+                    return scope.tables[0]
+                if scope.aliases:
+                    return None
+            elif qualifier.lower() in scope.aliases:
+                return scope.aliases[qualifier.lower()]
+            scope = scope.parent
+        return None
+
+
+class ParsedQuery(namedtuple("ParsedQuery", "statement tables ctes derived columns predicates join_keys "
+                                            "group_by order_by")):
+    """Immutable parse result; shared between callers through the memo cache."""
+
+    @property
+    def table_names(self) -> List[str]:
+        seen = {}
+        for ref in self.tables:
+            seen.setdefault(ref.name.lower(), ref.name)
+        return list(seen.values())
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "statement": self.statement,
+            "tables": [ref._asdict() for ref in self.tables],
+            "ctes": list(self.ctes),
+            "derived_tables": list(self.derived),
+            "columns": [c._asdict() for c in self.columns],
+            "predicates": [p._asdict() for p in self.predicates],
+            "join_keys": [{"left": j.left._asdict(), "right": j.right._asdict()} for j in self.join_keys],
+            "group_by": [c._asdict() for c in self.group_by],
+            "order_by": [c._asdict() for c in self.order_by],
+        }
+
+
+class _Parser:
+    """Single forward pass over tokens that tracks clauses, scopes and subqueries.
+
+    It is not a validating parser: anything it doesn't understand is
+    skipped, so partial or dialect-specific SQL still yields what it can.
+    """
+
+    def __init__(self, tokens: Sequence[Token]):
+        self.toks = tokens
+        self.i = 0
+        self.statement: Optional[str] = None
+        self.tables: List[TableRef] = []
+        self.ctes: List[str] = []
+        self.derived: List[str] = []
+        self.columns: Dict[ColumnRef, None] = {}
+        self.predicates: Dict[Predicate, None] = {}
+        self.join_keys: Dict[JoinKey, None] = {}
+        self.group_by: List[ColumnRef] = []
+        self.order_by: List[ColumnRef] = []
+
+    # --- token helpers ---
+    def peek(self, offset: int = 0) -> Optional[Token]:
+        j = self.i + offset
+        return self.toks[j] if j < len(self.toks) else None
+
+    def word(self, offset: int = 0) -> Optional[str]:
+        t = self.peek(offset)
+        return t.upper if t is not None and t.kind == "word" else None
+
+    def is_op(self, text: str, offset: int = 0) -> bool:
+        t = self.peek(offset)
+        return t is not None and t.kind == "op" and t.text == text
+
+    def is_name(self, offset: int = 0) -> bool:
+        t = self.peek(offset)
+        return t is not None and (t.kind == "qident" or (t.kind == "word" and t.upper not in _KEYWORDS))
+
+    def starts_query(self, offset: int = 0) -> bool:
+        return self.word(offset) in ("SELECT", "WITH", "VALUES") or (
+            self.is_op("(", offset) and self.starts_query(offset + 1))
+
+    def skip_parens(self):
+        """Skip a balanced parenthesised group starting at the current token."""
+        depth = 0
+        while self.peek() is not None:
+            if self.is_op("("):
+                depth += 1
+            elif self.is_op(")"):
+                depth -= 1
+                if depth <= 0:
+                    self.i += 1
+                    return
+            self.i += 1
+
+    def expect_close(self):
+        if self.is_op(")"):
+            self.i += 1
+
+    # --- statements ---
+    def parse(self) -> ParsedQuery:
+        try:
+            self.query(frozenset(), None)
+        except Exception as e:
+            # Never fail callers over odd SQL; keep whatever was collected
+            logger.debug(f"SQL parse stopped early: {e}")
+        return ParsedQuery(
+            statement=self.statement or "other",
+            tables=tuple(dict.fromkeys(self.tables)),
+            ctes=tuple(self.ctes),
+            derived=tuple(self.derived),
+            columns=tuple(self.columns),
+            predicates=tuple(self.predicates),
+            join_keys=tuple(self.join_keys),
+            group_by=tuple(self.group_by),
+            order_by=tuple(self.order_by),
+        )
+
+    def query(self, ctes: frozenset, parent: Optional[_Scope]) -> frozenset:
+        """Parse statements until `)` or the end of input; returns the CTE names in effect."""
+        scope = _Scope(parent)
+        insert_scope = None
+        while self.peek() is not None and not self.is_op(")"):
+            start = self.i
+            w = self.word()
+            if self.is_op(";"):
+                self.i += 1
+                self.flush(scope)
+                scope, insert_scope = _Scope(parent), None
+            elif w == "WITH":
+                ctes = self.with_clause(ctes, scope)
+            elif w == "SELECT":
+                self.statement = self.statement or "select"
+                if scope is insert_scope:
+                    # INSERT ... SELECT reads from its own tables
+                    scope = _Scope(parent)
+                self.i += 1
+                while self.word() in _SELECT_MODIFIERS:
+                    self.i += 1
+                self.expr(scope, ctes, "select")
+            elif w == "FROM":
+                self.i += 1
+                self.table_refs(scope, ctes)
+            elif w == "WHERE":
+                self.i += 1
+                self.expr(scope, ctes, "where")
+            elif w in ("GROUP", "ORDER") and self.word(1) == "BY":
+                self.i += 2
+                self.expr(scope, ctes, w.lower())
+            elif w == "HAVING":
+                self.i += 1
+                self.expr(scope, ctes, "having")
+            elif w in ("UNION", "EXCEPT", "INTERSECT"):
+                self.i += 1
+                self.flush(scope)
+                scope = _Scope(parent)
+            elif w == "UPDATE":
+                self.statement = self.statement or "update"
+                self.i += 1
+                while self.word() in _DML_MODIFIERS:
+                    self.i += 1
+                self.table_refs(scope, ctes)
+            elif w in ("INSERT", "REPLACE"):
+                self.statement = self.statement or w.lower()
+                self.i += 1
+                while self.word() in _DML_MODIFIERS:
+                    self.i += 1
+                self.table_ref(scope, ctes, allow_alias=False)
+                insert_scope = scope
+                if self.is_op("(") and not self.starts_query(1):
+                    self.i += 1
+                    self.expr(scope, ctes, "insert")
+                    self.expect_close()
+            elif w == "DELETE":
+                self.statement = self.statement or "delete"
+                self.i += 1
+                # Multi-table DELETE names its targets before FROM; they are aliases listed again in FROM
+                while self.peek() is not None and self.word() != "FROM" and not self.is_op(";"):
+                    self.i += 1
+            elif w == "SET":
+                self.i += 1
+                self.expr(scope, ctes, "set")
+            elif w == "ON" and self.word(1) == "DUPLICATE":
+                self.i += 4  # ON DUPLICATE KEY UPDATE
+                self.expr(insert_scope or scope, ctes, "set")
+            elif w in ("VALUES", "VALUE"):
+                self.i += 1
+                self.expr(scope, ctes, "values")
+            elif w in ("LIMIT", "OFFSET", "WINDOW", "RETURNING", "FETCH"):
+                self.i += 1
+                self.expr(scope, ctes, None)
+            elif self.is_op("(") and self.starts_query(1):
+                self.i += 1
+                self.query(ctes, parent)
+                self.expect_close()
+            else:
+                self.expr(scope, ctes, None)
+            if self.i == start:
+                self.i += 1
+        self.flush(scope)
+        return ctes
+
+    def flush(self, scope: _Scope):
+        for qualifier, name in scope.deferred:
+            self.columns[ColumnRef(scope.resolve(qualifier), name)] = None
+        scope.deferred = []
+
+    def with_clause(self, ctes: frozenset, scope: _Scope) -> frozenset:
+        self.i += 1
+        if self.word() == "RECURSIVE":
+            self.i += 1
+        while self.is_name():
+            name = self.peek().text
+            self.ctes.append(name)
+            # Recursive CTEs can reference themselves
+            ctes = ctes | {name.lower()}
+            self.i += 1
+            if self.is_op("("):
+                self.skip_parens()
+            if self.word() == "AS":
+                self.i += 1
+            if self.is_op("("):
+                self.i += 1
+                self.query(ctes, scope.parent)
+                self.expect_close()
+            if not self.is_op(","):
+                break
+            self.i += 1
+        return ctes
+
+    # --- FROM / JOIN ---
+    def table_refs(self, scope: _Scope, ctes: frozenset):
+        while self.peek() is not None:
+            if self.is_op("("):
+                if self.starts_query(1):
+                    self.i += 1
+                    self.query(ctes, None)
+                    self.expect_close()
+                    alias = self.alias()
+                    if alias:
+                        self.derived.append(alias)
+                        scope.add(alias, None)
+                else:
+                    self.i += 1
+                    self.table_refs(scope, ctes)
+                    self.expect_close()
+            elif self.is_name():
+                self.table_ref(scope, ctes)
+            else:
+                return
+
+            while True:
+                if self.word() in _INDEX_HINTS and self.word(1) in ("INDEX", "KEY"):
+                    self.i += 2
+                    if self.word() == "FOR":
+                        self.i += 1
+                        while self.word() in ("JOIN", "ORDER", "GROUP", "BY"):
+                            self.i += 1
+                    if self.is_op("("):
+                        self.skip_parens()
+                elif self.word() == "ON":
+                    self.i += 1
+                    self.expr(scope, ctes, "on")
+                elif self.word() == "USING":
+                    self.i += 1
+                    self.using(scope)
+                else:
+                    break
+
+            if self.is_op(","):
+                self.i += 1
+            elif self.word() in _JOIN_WORDS:
+                while self.word() in _JOIN_WORDS:
+                    self.i += 1
+                if self.word() == "LATERAL":
+                    self.i += 1
+            else:
+                return
+
+    def table_ref(self, scope: _Scope, ctes: frozenset, allow_alias: bool = True):
+        if not self.is_name():
+            return
+        first = self.peek()
+        parts = [first.text]
+        self.i += 1
+        while self.is_op(".") and self.is_name(1):
+            parts.append(self.peek(1).text)
+            self.i += 2
+        if self.word() == "PARTITION" and self.is_op("(", 1):
+            self.i += 1
+            self.skip_parens()
+        alias = self.alias() if allow_alias else None
+        name = parts[-1]
+        if len(parts) == 1 and first.kind == "word" and first.upper == "DUAL":
+            # FROM DUAL names no table
+            return
+        if len(parts) == 1 and name.lower() in ctes:
+            scope.add(alias or name, None)
+            return
+        schema = parts[-2] if len(parts) > 1 else None
+        self.tables.append(TableRef(schema, name, alias))
+        scope.add(alias or name, name)
+
+    def alias(self) -> Optional[str]:
+        if self.word() in _INDEX_HINTS and self.word(1) in ("INDEX", "KEY"):
+            return None
+        if self.word() == "AS":
+            self.i += 1
+        if self.is_name() or (self.peek() is not None and self.peek().kind == "string" and self.word(-1) == "AS"):
+            alias = self.peek().text.strip("'\"")
+            self.i += 1
+            return alias
+        return None
+
+    def using(self, scope: _Scope):
+        if not self.is_op("("):
+            return
+        self.i += 1
+        joined = [t for t in scope.tables[-2:]]
+        while self.peek() is not None and not self.is_op(")"):
+            if self.is_name():
+                column = self.peek().text
+                refs = [ColumnRef(t, column) for t in joined]
+                for ref in refs:
+                    self.columns[ref] = None
+                if len(refs) == 2:
+                    self.join_keys[JoinKey(refs[0], refs[1])] = None
+            self.i += 1
+        self.expect_close()
+
+    # --- expressions ---
+    def column(self) -> Optional[tuple]:
+        """Consume a possibly qualified column name; returns (qualifier, name) or None for `t.*`."""
+        parts = [self.peek().text]
+        self.i += 1
+        while self.is_op(".") and (self.is_name(1) or self.is_op("*", 1)
+                                   or (self.peek(1) is not None and self.peek(1).kind == "word")):
+            parts.append(self.peek(1).text)
+            self.i += 2
+        if parts[-1] == "*":
+            return None
+        return (parts[-2] if len(parts) > 1 else None), parts[-1]
+
+    def at_stop(self, clause: Optional[str]) -> bool:
+        t = self.peek()
+        if t.kind == "op":
+            return t.text in (")", ";") or (clause == "on" and t.text == ",")
+        if t.kind != "word" or t.upper not in _STOP_WORDS:
+            return False
+        if self.is_op("(", 1) and (t.upper in _FUNCTION_STOP_WORDS or (clause == "set" and t.upper in ("VALUES", "VALUE"))):
+            return False
+        return True
+
+    def expr(self, scope: _Scope, ctes: frozenset, clause: Optional[str]):
+        """Consume one clause's expression list, recording columns and predicates.
+
+        Stops, without consuming, at the next clause or join keyword, a
+        closing parenthesis or `;` at this nesting level. A `clause` of None
+        skips the tokens without recording anything.
+        """
+        depth = 0
+        prev_operand = False  # an identifier right after an operand is an alias
+        interval = False
+        last_col = None  # column that a following operator applies to
+        last_source = None  # alias (or table) `last_col` was read through
+        pending = None  # (column, comparison, source) awaiting its right-hand side
+        item = None  # select-list item so far: None when empty, the column if it is a bare one, else False
+        while self.peek() is not None:
+            t = self.peek()
+            if depth == 0 and self.at_stop(clause):
+                break
+            if t.kind == "op":
+                item = None if depth == 0 and t.text == "," else False
+                if t.text == "(":
+                    if self.starts_query(1):
+                        self.i += 1
+                        self.query(ctes, scope)
+                        self.expect_close()
+                        prev_operand, last_col, pending = True, None, None
+                        continue
+                    depth += 1
+                    prev_operand = False
+                elif t.text == ")":
+                    depth -= 1
+                    prev_operand = True
+                elif t.text in _COMPARISONS:
+                    if last_col is not None and clause in _PREDICATE_CLAUSES:
+                        self.predicates[Predicate(last_col.table, last_col.column, t.text, clause)] = None
+                        pending = (last_col, t.text, last_source)
+                    last_col = None
+                    prev_operand = False
+                else:
+                    last_col, pending = None, None
+                    prev_operand = False
+                self.i += 1
+                continue
+
+            if t.kind == "word" and t.upper in _KEYWORDS:
+                self.i += 1
+                if t.upper == "AS":
+                    # Alias or CAST target type
+                    if self.is_name() or (self.peek() is not None and self.peek().kind == "string"):
+                        if clause == "select" and depth == 0:
+                            scope.select_aliases[self.peek().text.strip("'\"").lower()] = item or None
+                        self.i += 1
+                    prev_operand = True
+                    continue
+                item = False
+                if t.upper in _PREDICATE_WORDS and last_col is not None and clause in _PREDICATE_CLAUSES:
+                    self.predicates[Predicate(last_col.table, last_col.column, t.upper, clause)] = None
+                    last_col = None
+                interval = interval or t.upper == "INTERVAL"
+                prev_operand = t.upper in ("NULL", "TRUE", "FALSE", "END", "UNKNOWN")
+                continue
+
+            if t.kind in ("word", "qident"):
+                nxt = self.peek(1)
+                if t.kind == "word" and (self.is_op("(", 1) or (nxt is not None and nxt.kind == "string" and (
+                        t.upper in _LITERAL_PREFIXES or t.text.startswith("_")))):
+                    # Function name, typed literal or charset introducer
+                    self.i += 1
+                    item = False
+                    prev_operand = False
+                    continue
+                if prev_operand and interval and t.upper in _INTERVAL_UNITS:
+                    self.i += 1
+                    interval = False
+                    continue
+                if prev_operand and clause in ("select", None):
+                    if clause == "select" and depth == 0:
+                        scope.select_aliases[t.text.lower()] = item or None
+                    self.i += 1
+                    continue
+                name = self.column()
+                item = name if item is None and name is not None else False
+                col = None
+                if name is not None and clause == "select":
+                    scope.deferred.append(name)
+                elif name is not None and clause is not None:
+                    if name[0] is None and clause in ("group", "order", "having") and name[1].lower() in scope.select_aliases:
+                        # A select-list alias: record the column it renames, if any
+                        name = scope.select_aliases[name[1].lower()]
+                    if name is not None:
+                        col = ColumnRef(scope.resolve(name[0]), name[1])
+                        self.record_column(col, clause)
+                    if col is not None and pending is not None:
+                        left, op, left_source = pending
+                        self.predicates[Predicate(col.table, col.column, op, clause)] = None
+                        source = (name[0] or col.table or "").lower()
+                        # Compare aliases, not base tables, so self-joins keep their keys
+                        if op == "=" and left.table and col.table and left_source != source:
+                            self.join_keys[JoinKey(left, col)] = None
+                    last_source = (name[0] or col.table or "").lower() if col is not None else None
+                last_col = col
+                pending = None
+                prev_operand = True
+                continue
+
+            # Literal, parameter or variable
+            self.i += 1
+            item = False
+            last_col, pending = None, None
+            prev_operand = True
+
+    def record_column(self, col: ColumnRef, clause: Optional[str]):
+        self.columns[col] = None
+        if clause == "group":
+            self.group_by.append(col)
+        elif clause == "order":
+            self.order_by.append(col)
+
+
+@lru_cache(maxsize=Config.SQL_PARSE_CACHE_SIZE)
+def parse_sql(sql: str) -> ParsedQuery:
+    """Parse a statement into tables, columns, predicates, join keys and GROUP/ORDER BY columns.
+
+    Memoized on the query text, so the schema lookup, the pipeline and the
+    rule engine share one parse per query.
+    """
+    return _Parser(tokenize(sql)).parse()
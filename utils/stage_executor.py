@@ -0,0 +1,111 @@
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+
+class Stage:
+    """A named unit of work in an analysis pipeline.
+
+    `func` is awaited with the results of `deps` as positional arguments, in
+    the order they are listed. If it raises or exceeds `timeout`, `on_error`
+    is called with the error message and its return value becomes the stage
+    result, so downstream stages and the formatter always get a value.
+    """
+
+    def __init__(self,
+                 name: str,
+                 func: Callable[..., Awaitable[Any]],
+                 deps: Sequence[str] = (),
+                 timeout: Optional[float] = None,
+                 on_error: Optional[Callable[[str], Any]] = None):
+        self.name = name
+        self.func = func
+        self.deps = tuple(deps)
+        self.timeout = timeout
+        self.on_error = on_error or (lambda message: {"error": message})
+
+
+def agent_error(agent: str) -> Callable[[str], Dict[str, Any]]:
+    """Build an `on_error` handler returning an agent-shaped error section."""
+    def _handler(message: str) -> Dict[str, Any]:
+        return {"agent": agent, "status": "error", "details": {"error": message}}
+    return _handler
+
+
+class StageExecutor:
+    """Runs a DAG of stages, starting each one as soon as its deps are done.
+
+    `on_stage_complete`, if given, is awaited with (name, result) as each
+    stage finishes, which lets callers stream partial results.
+    """
+
+    def __init__(self, stages: Iterable[Stage],
+                 on_stage_complete: Optional[Callable[[str, Any], Awaitable[None]]] = None):
+        self.on_stage_complete = on_stage_complete
+        self.stages: Dict[str, Stage] = {}
+        for stage in stages:
+            if stage.name in self.stages:
+                raise ValueError(f"Duplicate stage name: {stage.name}")
+            self.stages[stage.name] = stage
+        for stage in self.stages.values():
+            missing = [d for d in stage.deps if d not in self.stages]
+            if missing:
+                raise ValueError(f"Stage {stage.name} depends on unknown stages: {missing}")
+        self._check_acyclic()
+        self.timings: Dict[str, float] = {}
+
+    def _check_acyclic(self):
+        state: Dict[str, int] = {}
+
+        def visit(name: str):
+            if state.get(name) == 1:
+                raise ValueError(f"Stage dependency cycle through {name}")
+            if state.get(name) == 2:
+                return
+            state[name] = 1
+            for dep in self.stages[name].deps:
+                visit(dep)
+            state[name] = 2
+
+        for name in self.stages:
+            visit(name)
+
+    async def _run_stage(self, stage: Stage, tasks: Dict[str, "asyncio.Task"]):
+        args = [await tasks[dep] for dep in stage.deps]
+        started = time.perf_counter()
+        try:
+            coro = stage.func(*args)
+            if stage.timeout is not None:
+                result = await asyncio.wait_for(coro, timeout=stage.timeout)
+            else:
+                result = await coro
+        except asyncio.TimeoutError:
+            logger.warning(f"Stage {stage.name} timed out after {stage.timeout}s")
+            result = stage.on_error(f"{stage.name} timed out after {stage.timeout}s")
+        except Exception as e:
+            logger.exception(f"Stage {stage.name} failed: {e}")
+            result = stage.on_error(str(e))
+        self.timings[stage.name] = round((time.perf_counter() - started) * 1000, 1)
+        if self.on_stage_complete is not None:
+            try:
+                await self.on_stage_complete(stage.name, result)
+            except Exception as e:
+                logger.warning(f"on_stage_complete failed for {stage.name}: {e}")
+        return result
+
+    async def run(self) -> Dict[str, Any]:
+        """Run every stage and return a mapping of stage name to result."""
+        tasks: Dict[str, asyncio.Task] = {}
+        for name, stage in self.stages.items():
+            tasks[name] = asyncio.ensure_future(self._run_stage(stage, tasks))
+        try:
+            results = await asyncio.gather(*tasks.values())
+        except BaseException:
+            for task in tasks.values():
+                task.cancel()
+            raise
+        logger.info(f"Stage timings (ms): {self.timings}")
+        return dict(zip(tasks.keys(), results))